@@ -0,0 +1,69 @@
+"""
+数据代理本地存储比较
+
+以本地资源文件`000333.csv`模拟`fetch_history`结果，为多个代码写入缓存，
+比较文件存储（每键一个pickle文件）与SQLite单文件存储的命中读取用时及磁盘占用。
+
+>>> python dataproxy_store.py --keys 2000
+"""
+import os
+import tempfile
+import time
+from unittest import mock
+
+import click
+
+from cswd.dataproxy import cache
+from cswd.dataproxy.cache import DataProxy
+from cswd.load import load_csv
+
+
+def _history_frame():
+    kwargs = {'index_col': 0, 'parse_dates': True,
+              'na_values': ['None', '--', 'none']}
+    return load_csv('000333.csv', kwargs=kwargs)
+
+
+def _disk_usage(root):
+    """目录下文件数量及总字节数"""
+    n, size = 0, 0
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            n += 1
+            size += os.path.getsize(os.path.join(dirpath, name))
+    return n, size
+
+
+def _run(store, keys, df, root):
+    def fetch_history(code):
+        return df
+
+    with mock.patch.object(cache, 'TEMP_DIR', root):
+        # 到期时间设为当日零点，写入后均为有效缓存
+        reader = DataProxy(fetch_history, '00:00:00', store=store)
+        start = time.perf_counter()
+        for code in keys:
+            reader.read(code)
+        write = time.perf_counter() - start
+        start = time.perf_counter()
+        for code in keys:
+            reader.read(code)
+        hit = time.perf_counter() - start
+    return write, hit
+
+
+@click.command()
+@click.option('--keys', default=2000, help='缓存键数量')
+def main(keys):
+    df = _history_frame()
+    codes = ['{:06d}'.format(i) for i in range(keys)]
+    for store in ('file', 'sqlite'):
+        with tempfile.TemporaryDirectory() as root:
+            write, hit = _run(store, codes, df, root)
+            n, size = _disk_usage(root)
+            print('{:6s}：写入{:.2f}秒，命中平均{:.3f}毫秒，文件{}个，占用{:.1f}MB'.format(
+                store, write, hit / keys * 1000, n, size / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    main()
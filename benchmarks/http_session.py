@@ -0,0 +1,81 @@
+"""
+连接池会话性能比较
+
+在本地启动支持保持连接(HTTP/1.1)的模拟服务器，返回`000333.csv`历史数据，
+分别以每次新建连接（原`requests.get`方式）与主机连接池会话调用`fetch_history`，
+比较总用时及单次平均用时，差值即为节约的TCP握手时间。
+
+>>> python http_session.py --calls 3000
+"""
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import click
+import requests
+
+from cswd.load import load_csv
+from cswd.websource import base, wy
+
+
+def _payload():
+    """与网易下载文件编码一致的历史数据"""
+    df = load_csv('000333.csv')
+    return df.to_csv(index=False).encode('cp936')
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    body = b''
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _run(calls, pooled):
+    """调用`fetch_history`指定次数，返回用时"""
+    if pooled:
+        patcher = mock.patch.object(base, 'get_http_session', base.get_http_session)
+    else:
+        # 模块级函数`requests.request`每次请求新建会话及连接
+        patcher = mock.patch.object(base, 'get_http_session', lambda server: requests)
+    with patcher:
+        start = time.perf_counter()
+        for _ in range(calls):
+            wy.fetch_history('000333', '2017-1-1', '2018-4-4')
+        return time.perf_counter() - start
+
+
+@click.command()
+@click.option('--calls', default=3000, help='调用次数')
+def main(calls):
+    _Handler.body = _payload()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host = '127.0.0.1:{}'.format(server.server_port)
+    # 本地服务器不限速
+    base.set_rate_limit(host, 1e6, 1e6)
+    url_fmt = 'http://' + host + '/service/chddata.html?code={}&start={}&end={}'
+    with mock.patch.object(wy, 'HISTORY_URL_FMT', url_fmt):
+        results = {}
+        for name, pooled in (('每次新建连接', False), ('连接池会话', True)):
+            elapsed = _run(calls, pooled)
+            results[name] = elapsed
+            print('{}：{}次，用时{:.2f}秒，平均{:.2f}毫秒'.format(
+                name, calls, elapsed, elapsed / calls * 1000))
+    saved = results['每次新建连接'] - results['连接池会话']
+    print('节约：{:.2f}秒，平均每次{:.2f}毫秒'.format(saved, saved / calls * 1000))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
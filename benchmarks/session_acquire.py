@@ -0,0 +1,56 @@
+"""
+数据库会话取得用时比较
+
+比较每次创建引擎（原`get_session`方式）与进程内共享引擎及会话工厂两种方式，
+取得会话、执行一次简单查询并关闭的平均用时。
+
+>>> python session_acquire.py --calls 2000
+"""
+import os
+import tempfile
+import time
+
+import click
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+from cswd.sql.base import get_engine, get_sessionmaker
+from cswd.sql.models import Base, StockDaily
+
+
+def _per_call_session(db):
+    """每次创建引擎及会话工厂"""
+    engine = create_engine('sqlite:///' + db)
+    return sessionmaker(bind=engine)()
+
+
+def _run(calls, make_session):
+    start = time.perf_counter()
+    for _ in range(calls):
+        sess = make_session()
+        sess.query(func.max(StockDaily.date)).filter(
+            StockDaily.code == '000001').scalar()
+        sess.close()
+    return time.perf_counter() - start
+
+
+@click.command()
+@click.option('--calls', default=2000, help='取得会话次数')
+def main(calls):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db = os.path.join(tmp_dir, 'bench.db')
+        Base.metadata.create_all(get_engine(db))
+        Session = get_sessionmaker(db)
+        results = {}
+        for name, make_session in (('每次创建引擎', lambda: _per_call_session(db)),
+                                   ('共享引擎', Session)):
+            elapsed = _run(calls, make_session)
+            results[name] = elapsed
+            print('{}：{}次，用时{:.2f}秒，平均{:.3f}毫秒'.format(
+                name, calls, elapsed, elapsed / calls * 1000))
+        print('加速：{:.1f}倍'.format(results['每次创建引擎'] / results['共享引擎']))
+        get_engine(db).dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+新浪实时报价解析性能比较
+
+以与`hq.sinajs.cn`一致格式的模拟报价（含停牌股票的空报价），比较：
+    逐行    正则提取后逐行分割，构建字符串DataFrame，再逐行转换类型
+    向量化  `sina._to_dataframe`，一次提取及类型转换
+
+>>> python sina_quotes.py --codes 3800
+"""
+import re
+import time
+
+import click
+import numpy as np
+import pandas as pd
+
+from cswd.common.constants import QUOTE_COLS
+from cswd.websource.sina import QUOTE_PATTERN, _to_dataframe
+
+REPEAT = 20
+
+
+def _payload(codes, seed=0):
+    """模拟报价网页内容。约百分之二的股票停牌"""
+    rng = np.random.RandomState(seed)
+    lines = []
+    for code in codes:
+        prefix = 'sh' if code[0] == '6' else 'sz'
+        if rng.rand() < 0.02:
+            lines.append('var hq_str_{}{}="";'.format(prefix, code))
+            continue
+        price = round(rng.uniform(2, 100), 2)
+        book = []
+        for i in range(10):
+            book += [str(rng.randint(1, 2000) * 100),
+                     '{:.3f}'.format(price + (i - 4.5) * 0.01)]
+        fields = (['股票{}'.format(code)] +
+                  ['{:.3f}'.format(price * x) for x in (0.99, 1.0, 1.01, 1.02, 0.98)] +
+                  ['{:.3f}'.format(price), '{:.3f}'.format(price + 0.01),
+                   str(rng.randint(1, 10 ** 8)), '{:.3f}'.format(rng.uniform(1e6, 1e9))] +
+                  book + ['2018-04-04', '15:00:03', '00'])
+        lines.append('var hq_str_{}{}="{}";'.format(prefix, code, ','.join(fields)))
+    return '\n'.join(lines)
+
+
+def _legacy(content, p_codes):
+    """原有解析方式及`flush_stock_quote._gen`中的逐行类型转换"""
+    res = [x.split(',') for x in re.findall(QUOTE_PATTERN, content)]
+    df = pd.DataFrame(res).iloc[:, :32]
+    df.columns = QUOTE_COLS[1:]
+    df.insert(0, '股票代码', p_codes)
+    df.dropna(inplace=True)
+    records = []
+    for _, row in df.iterrows():
+        record = {}
+        for col in QUOTE_COLS:
+            value = row[col]
+            if col in ('股票代码', '股票简称', '时间'):
+                record[col] = value
+            elif col == '日期':
+                record[col] = pd.Timestamp(value).date()
+            elif col.endswith('量'):
+                record[col] = int(value)
+            else:
+                record[col] = float(value)
+        records.append(record)
+    return records
+
+
+def _timeit(fun, *args):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        fun(*args)
+    return (time.perf_counter() - start) / REPEAT
+
+
+@click.command()
+@click.option('--codes', default=3800, help='模拟股票代码数量')
+def main(codes):
+    codes = [str(i).zfill(6) if i < 2000 else str(600000 + i) for i in range(1, codes + 1)]
+    content = _payload(codes)
+    print('模拟报价：{}只股票，{:.0f}KB'.format(len(codes), len(content.encode()) / 1024))
+    for name, fun in (('逐行', _legacy), ('向量化', _to_dataframe)):
+        elapsed = _timeit(fun, content, codes)
+        print('{}：平均用时{:.1f}毫秒'.format(name, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+股票日线写入性能比较
+
+比较逐行构建ORM对象与executemany批量写入两种方式的写入速度（行/秒）。
+以本地资源文件`000333.csv`模拟网页数据，复制为多个股票代码写入临时数据库。
+
+>>> python stockdaily_insert.py --codes 200
+"""
+import os
+import shutil
+import tempfile
+import time
+
+import click
+
+from cswd.load import load_csv
+from cswd.sql.base import dispose_engines, get_engine
+from cswd.sql.models import Base, StockDaily
+from cswd.tasks.stock_daily import _write
+
+from sqlalchemy.orm import sessionmaker
+
+
+def _history_frame():
+    """与`fetch_history`结构一致的测试数据"""
+    kwargs = {'index_col': 0, 'parse_dates': True,
+              'na_values': ['None', '--', 'none']}
+    df = load_csv('000333.csv', kwargs=kwargs)
+    return df.sort_index()
+
+
+def _run(df, codes, bulk):
+    """写入全部代码，返回（行数，用时）"""
+    root = tempfile.mkdtemp()
+    db = os.path.join(root, 'bench.db')
+    engine = get_engine(db)
+    Base.metadata.create_all(engine, tables=[StockDaily.__table__])
+    sess = sessionmaker(bind=engine)()
+    rows = 0
+    start = time.perf_counter()
+    for code in codes:
+        rows += _write(sess, code, df, bulk)
+    elapsed = time.perf_counter() - start
+    sess.close()
+    # 关闭缓存的引擎连接后再删除数据库文件
+    dispose_engines()
+    shutil.rmtree(root)
+    return rows, elapsed
+
+
+@click.command()
+@click.option('--codes', default=100, help='模拟股票代码数量')
+def main(codes):
+    df = _history_frame()
+    codes = [str(i).zfill(6) for i in range(1, codes + 1)]
+    for name, bulk in (('ORM逐行', False), ('批量写入', True)):
+        rows, elapsed = _run(df, codes, bulk)
+        print('{}：{}行，用时{:.2f}秒，{:.0f}行/秒'.format(
+            name, rows, elapsed, rows / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -14,6 +14,8 @@ DB_DIR_NAME = 'database'
 
 DB_NAME = 'stock.db'
 
+TICK_DIR_NAME = 'ticks'
+
 QUOTE_COLS = ['股票代码', '股票简称',
               '开盘', '前收盘', '现价', '最高', '最低',
               '竞买价', '竞卖价', '成交量', '成交额',
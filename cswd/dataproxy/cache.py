@@ -20,17 +20,25 @@
 """
 
 import os
+import re
 import sys
-import pickle
+import threading
 import enum
+import inspect
+import datetime as dt
 import pandas as pd
 from pandas.tseries.offsets import BDay, Week, MonthBegin, QuarterBegin
 from hashlib import md5
+from collections import OrderedDict
 from six import iteritems, b
 import logbook
 
 from ..common.constants import MARKET_START
 from ..common.utils import data_root
+from ..websource.exceptions import ConnectFailed, NoWebData
+from .locks import KeyLock, store_lock
+from .stores import (STORES, SQLITE_FILE_NAME, FileStore, MemoryCache,
+                     SqliteStore, to_timestamp)
 
 logger = logbook.Logger(__name__)
 
@@ -38,6 +46,15 @@ TEMP_DIR = data_root('webcache')
 
 DEFAULT_TIME_STR = '18:00:00'  # 网站更新数据时间
 DEFAULT_FREQ = 'D'
+FREQS = ('D', 'W', 'M', 'Q')   # 更新周期
+DEFAULT_STORE = 'file'         # 本地存储方式。可选'file', 'sqlite'
+DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024  # 进程内缓存默认占用上限(字节)
+DEFAULT_CACHE_BUDGET = 2 * 1024 ** 3     # 本地缓存默认占用上限(字节)
+DEFAULT_NEGATIVE_TTL = 24 * 3600         # 无数据结果默认有效期(秒)
+NEGATIVE_ERRORS = (NoWebData,)           # 作为无数据结果缓存的异常类型
+
+# 已创建的数据代理。函数名称 -> 数据代理
+_registry = {}
 
 
 def hash_args(*args, **kwargs):
@@ -51,6 +68,42 @@ def hash_args(*args, **kwargs):
     return hasher.hexdigest()
 
 
+# 形如'2018-1-1'、'2018/01/01'的日期字符串
+DATE_STR_PATTERN = re.compile(r'^\d{4}[-/]\d{1,2}[-/]\d{1,2}$')
+
+
+def normalize_arg(value):
+    """将日期类参数统一表达为'%Y-%m-%d'（含时间部分时为ISO格式）"""
+    if isinstance(value, str) and DATE_STR_PATTERN.match(value):
+        value = pd.Timestamp(value.replace('/', '-'))
+    if isinstance(value, (dt.date, pd.Timestamp)):
+        value = pd.Timestamp(value)
+        if value == value.normalize():
+            return value.strftime('%Y-%m-%d')
+        return value.isoformat()
+    return value
+
+
+def canonical_args(func, *args, **kwargs):
+    """
+    按函数签名绑定参数，应用默认值，并规范日期类参数
+
+    位置参数、关键字参数写法不同，或使用默认值，但意义相同的调用返回相同结果。
+
+    Returns
+    -------
+    res : OrderedDict
+        参数名称 -> 规范后的参数值，按签名顺序排列。
+        无法绑定（如参数错误）时返回None
+    """
+    try:
+        bound = inspect.signature(func).bind(*args, **kwargs)
+    except (TypeError, ValueError):
+        return None
+    bound.apply_defaults()
+    return OrderedDict((k, normalize_arg(v)) for k, v in bound.arguments.items())
+
+
 def last_modified_time(path):
     """
     Get the last modified time of path as a Timestamp.
@@ -59,7 +112,7 @@ def last_modified_time(path):
     ------
         舍弃秒以下单位的数字
     """
-    return pd.Timestamp(int(os.path.getmtime(path)), unit='s', tz = 'Asia/Shanghai')
+    return to_timestamp(os.path.getmtime(path))
 
 
 def next_update_time(last_updated, freq='D', hour=18, minute=0):
@@ -94,9 +147,86 @@ def next_update_time(last_updated, freq='D', hour=18, minute=0):
         raise TypeError('不能识别的周期类型，仅接受{}'.format(('D', 'W', 'M', 'Q')))
 
 
+def parse_time_str(time_str):
+    """将时间字符串（如'18:00:00'）解析为(时, 分, 秒)"""
+    parts = [int(x) for x in time_str.split(':')]
+    parts += [0] * (3 - len(parts))
+    return tuple(parts[:3])
+
+
+def today_deadline(time_str):
+    """当日指定时间（如'18:00:00'）的时间戳"""
+    hour, minute, second = parse_time_str(time_str)
+    deadline = pd.Timestamp('now', tz = 'Asia/Shanghai').normalize()
+    deadline = deadline.replace(hour=hour, minute=minute, second=second)
+    return deadline
+
+
+class NoDataResult(object):
+    """
+    缓存的无数据结果
+
+    下载函数触发`NEGATIVE_ERRORS`异常时存储本对象，有效期内读取时重新抛出同类异常，
+    避免反复请求已知不存在的网页。
+    """
+
+    def __init__(self, error):
+        self.error_type = type(error)
+        self.args = error.args
+
+    def is_expired(self, last_time, ttl):
+        return pd.Timestamp('now', tz='Asia/Shanghai') >= last_time + pd.Timedelta(seconds=ttl)
+
+    def reraise(self):
+        raise self.error_type(*self.args)
+
+
+# 不存在有效的本地数据
+_MISSING = object()
+
+
+def _is_empty(data):
+    """是否为无数据结果或空DataFrame"""
+    if isinstance(data, NoDataResult):
+        return True
+    return isinstance(data, (pd.DataFrame, pd.Series)) and data.empty
+
+
 class DataProxy(object):
+    """
+    数据代理
+
+    Parameters
+    ----------
+    fetch_fun : function
+        下载网络数据的函数
+    time_str : str
+        网站更新数据时间，如'18:00:00'
+    freq : str
+        更新周期，可选'D'、'W'、'M'、'Q'。参见`next_update_time`
+    store : str
+        本地存储方式
+            'file'：每次调用结果存储为一个pickle文件（默认）
+            'sqlite'：同一函数所有结果存储于单个SQLite文件，压缩存储，内存映射读取
+    memory_limit : int
+        进程内LRU缓存占用上限（字节）。默认为None，不使用进程内缓存
+    stale_while_revalidate : bool
+        为真时，本地数据过期后立即返回过期数据，并在后台线程中重新下载；
+        后台下载网络连接失败时，继续使用过期数据并发出警告。
+        仅适用于过期数据无害的场合（如按周更新的基础信息）；
+        不得用于以日期为参数、结果随时间变化的判断（如是否交易日）。
+        进程退出前等待后台下载完成
+    negative_ttl : int
+        无数据结果（下载函数触发`NoWebData`异常）的有效期（秒）。
+        有效期内读取时直接抛出该异常，不再请求网页。默认为None，不缓存无数据结果
+    negative_only : bool
+        为真时，仅缓存无数据结果（含空DataFrame），有数据时每次下载且不存储。
+        适用于数据另有本地存储的场合（如成交明细）
+    """
 
-    def __init__(self, fetch_fun, time_str=None, freq=None):
+    def __init__(self, fetch_fun, time_str=None, freq=None, store=None,
+                 memory_limit=None, stale_while_revalidate=False,
+                 negative_ttl=None, negative_only=False):
         self._fetch_fun = fetch_fun
         if time_str:
             self._time_str = time_str
@@ -106,15 +236,32 @@ class DataProxy(object):
             self._freq = freq
         else:
             self._freq = DEFAULT_FREQ
+        if store:
+            self._store_name = store
+        else:
+            self._store_name = DEFAULT_STORE
         # 验证
         self._validate()
-        self._ensure_root_dir()
+        self._store = STORES[self._store_name](self._ensure_root_dir())
+        if memory_limit:
+            self._memory = MemoryCache(memory_limit)
+        else:
+            self._memory = None
+        self._key_lock = KeyLock()
+        self._stale_while_revalidate = stale_while_revalidate
+        self._negative_ttl = negative_ttl
+        self._negative_only = negative_only
+        self._revalidating = set()
+        self._revalidating_lock = threading.Lock()
+        _registry[self._fetch_fun.__name__] = self
 
     def _validate(self):
         assert isinstance(self._freq, str), 'freq必须是str实例'
         assert isinstance(self._time_str, str), 'time_str必须是str实例'
         assert ':' in self._time_str, 'time_str要包含":"字符'
+        assert self._freq.upper() in FREQS, 'freq仅接受{}'.format(FREQS)
         assert hasattr(self._fetch_fun, '__call__'), '{}必须是函数'.format(self._fetch_fun)
+        assert self._store_name in STORES, 'store仅接受{}'.format(tuple(STORES))
 
     def _ensure_root_dir(self):
         """确保函数根目录存在"""
@@ -123,42 +270,273 @@ class DataProxy(object):
             os.makedirs(subdir)
         return subdir
 
+    @property
+    def store(self):
+        """本地存储对象"""
+        return self._store
+
+    def memory_info(self):
+        """进程内缓存命中、未命中、淘汰次数及占用字节数。未使用时返回None"""
+        if self._memory is None:
+            return None
+        return self._memory.info()
+
+    def get_cache_key(self, *args, **kwargs):
+        """本地存储键。意义相同的调用（参见`canonical_args`）使用同一键"""
+        arguments = canonical_args(self._fetch_fun, *args, **kwargs)
+        if arguments is None:
+            return hash_args(*args, **kwargs)
+        return hash_args(**arguments)
+
     def get_cache_file_path(self, *args, **kwargs):
-        """获取本地缓存文件路径"""
-        name = '{}'.format(hash_args(*args, **kwargs))
-        subdir = self._ensure_root_dir()
-        file_path = os.path.join(TEMP_DIR, subdir, name)
-        return file_path
+        """获取本地缓存文件路径（仅适用于文件存储）"""
+        assert self._store_name == 'file', '仅文件存储方式存在单独的缓存文件'
+        return self._store.path(self.get_cache_key(*args, **kwargs))
 
     @property
     def expiration(self):
         """将时间字符串转换为时间戳"""
-        hour = int(self._time_str.split(':')[0])
-        minute = int(self._time_str.split(':')[1])
-        second = int(self._time_str.split(':')[2])
-        deadline = pd.Timestamp('now', tz = 'Asia/Shanghai').normalize()
-        deadline = deadline.replace(hour=hour, minute=minute, second=second)
-        return deadline
+        return today_deadline(self._time_str)
 
-    def read(self, *args, **kwargs):
-        """读取网页数据。如果存在本地数据，使用缓存；否则从网页下载。"""
-        file_path = self.get_cache_file_path(*args, **kwargs)
-        download_from_web = False
-        expiration = self.expiration
-        if not os.path.exists(file_path):
-            download_from_web = True
-        else:
-            last_time = last_modified_time(file_path)
-            if last_time > expiration:
-                download_from_web = False
-            else:
-                download_from_web = True
-        if download_from_web:
+    def expires_at(self, last_time):
+        """
+        更新时间为`last_time`的本地数据的过期时间
+
+        说明：
+            按`freq`计算下次更新时间（参见`next_update_time`）；
+            'D'周期下，当日网站更新时间之前写入的数据，于当日更新时间过期
+        """
+        hour, minute, second = parse_time_str(self._time_str)
+        if self._freq.upper() == 'D':
+            deadline = last_time.normalize().replace(
+                hour=hour, minute=minute, second=second)
+            if last_time < deadline:
+                return deadline
+        res = next_update_time(last_time, self._freq, hour, minute)
+        return res.replace(second=second)
+
+    def is_expired(self, last_time):
+        """更新时间为`last_time`的本地数据是否已经过期"""
+        return pd.Timestamp('now', tz='Asia/Shanghai') >= self.expires_at(last_time)
+
+    def invalidate(self, *args, **kwargs):
+        """删除指定参数的本地数据，下次读取时重新下载"""
+        key = self.get_cache_key(*args, **kwargs)
+        if self._memory is not None:
+            self._memory.discard(key)
+        with self._key_lock(key), store_lock(self._store.root, key):
+            self._store.delete(key)
+
+    def _refresh(self, key, args, kwargs):
+        """
+        下载并存储数据，返回(数据, 更新时间)。数据未存储时，更新时间为None
+
+        同一键同时只有一个下载（进程内使用键锁，跨进程使用文件锁）。
+        等待锁的调用方取得锁后，如数据已由其他调用方更新，直接读取本地数据。
+        """
+        with self._key_lock(key), store_lock(self._store.root, key):
+            last_time = self._store.updated_time(key)
+            data = self._load_fresh(key, last_time)
+            if data is not _MISSING:
+                return data, last_time
             try:
                 data = self._fetch_fun(*args, **kwargs)
-                with open(file_path, 'wb') as f:
-                    pickle.dump(data, f)
+            except NEGATIVE_ERRORS as e:
+                if not self._negative_ttl:
+                    raise
+                data = NoDataResult(e)
+            if self._negative_only and not _is_empty(data):
+                return data, None
+            self._store.dump(key, data)
+            return data, self._store.updated_time(key)
+
+    def _load_fresh(self, key, last_time):
+        """读取有效的本地数据。不存在或已过期（含无数据结果超出有效期）时返回`_MISSING`"""
+        if last_time is None or self.is_expired(last_time):
+            return _MISSING
+        data = self._store.load(key)
+        if isinstance(data, NoDataResult) and data.is_expired(last_time, self._negative_ttl):
+            return _MISSING
+        return data
+
+    def _revalidate(self, key, args, kwargs):
+        """后台线程重新下载（同一键同时只有一个后台线程）"""
+        with self._revalidating_lock:
+            if key in self._revalidating:
+                return
+            self._revalidating.add(key)
+
+        def target():
+            try:
+                data, last_time = self._refresh(key, args, kwargs)
+                if (self._memory is not None and last_time is not None
+                        and not isinstance(data, NoDataResult)):
+                    self._memory.put(key, last_time, data)
+            except ConnectFailed as e:
+                logger.warn('{}网络连接失败，继续使用过期数据。参数：{} {}。{}'.format(
+                    self._fetch_fun.__name__, args, kwargs, e))
             except Exception as e:
-                raise e
-        with open(file_path, 'rb') as f:
-            return pickle.load(f)
\ No newline at end of file
+                logger.warn('{}后台刷新失败，继续使用过期数据。参数：{} {}。{!r}'.format(
+                    self._fetch_fun.__name__, args, kwargs, e))
+            finally:
+                with self._revalidating_lock:
+                    self._revalidating.discard(key)
+
+        # 非守护线程：单次运行的脚本退出前完成下载，本地数据得以更新
+        thread = threading.Thread(target=target,
+                                  name='revalidate-{}'.format(self._fetch_fun.__name__))
+        thread.start()
+        return thread
+
+    def read(self, *args, **kwargs):
+        """读取网页数据。如果存在本地数据，使用缓存；否则从网页下载。"""
+        key = self.get_cache_key(*args, **kwargs)
+        if self._memory is not None:
+            hit, data = self._memory.get(key, self.is_expired)
+            if hit:
+                return data
+        last_time = self._store.updated_time(key)
+        data = self._load_fresh(key, last_time)
+        if data is _MISSING:
+            if last_time is not None and self._stale_while_revalidate:
+                # 过期数据不放入进程内缓存
+                self._revalidate(key, args, kwargs)
+                data = self._store.load(key)
+                if isinstance(data, NoDataResult):
+                    data.reraise()
+                return data
+            data, last_time = self._refresh(key, args, kwargs)
+        if isinstance(data, NoDataResult):
+            data.reraise()
+        if self._memory is not None and last_time is not None:
+            self._memory.put(key, last_time, data)
+        return data
+
+
+class CacheManager(object):
+    """
+    本地缓存管理
+
+    统计各函数缓存占用，先删除过期项目，再按最后访问时间删除最久未使用的项目，
+    直至总占用不超过预算。缓存保持有效，无需整体删除后重新下载。
+
+    Parameters
+    ----------
+    max_bytes : int
+        本地缓存占用上限（字节）
+    root : str
+        缓存根目录，默认为`TEMP_DIR`
+
+    Notes
+    -----
+        未在本进程创建数据代理的函数目录，按默认更新时间判断是否过期。
+        判断过期前应导入`data_proxies`模块
+
+    Example
+    -------
+    >>> from cswd.dataproxy import data_proxies
+    >>> manager = CacheManager(1024 ** 3)
+    >>> manager.stats()
+    >>> manager.evict()
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BUDGET, root=None):
+        self.max_bytes = max_bytes
+        self.root = root if root else TEMP_DIR
+
+    def _stores(self):
+        """各函数本地存储。返回[(函数名称, 存储, 过期判断函数)]"""
+        if not os.path.exists(self.root):
+            return []
+        res = []
+        default_expiration = today_deadline(DEFAULT_TIME_STR)
+        for name in sorted(os.listdir(self.root)):
+            subdir = os.path.join(self.root, name)
+            if not os.path.isdir(subdir):
+                continue
+            proxy = _registry.get(name)
+            if proxy is not None and proxy.store.root == subdir:
+                res.append((name, proxy.store, proxy.is_expired))
+                continue
+            if os.path.exists(os.path.join(subdir, SQLITE_FILE_NAME)):
+                store = SqliteStore(subdir)
+            else:
+                store = FileStore(subdir)
+            res.append((name, store,
+                        lambda last_time: last_time <= default_expiration))
+        return res
+
+    def _entries(self):
+        """全部项目。返回[(函数名称, 存储, 项目, 是否过期)]"""
+        res = []
+        for name, store, is_expired in self._stores():
+            for entry in store.entries():
+                res.append((name, store, entry,
+                            is_expired(to_timestamp(entry.updated))))
+        return res
+
+    def stats(self):
+        """
+        各函数缓存统计
+
+        Returns
+        -------
+        res : DataFrame
+            以函数名称为索引，列为项目数、字节数、过期项目数、过期字节数
+        """
+        columns = ['项目数', '字节数', '过期项目数', '过期字节数']
+        rows = {}
+        for name, _, entry, expired in self._entries():
+            row = rows.setdefault(name, [0, 0, 0, 0])
+            row[0] += 1
+            row[1] += entry.nbytes
+            if expired:
+                row[2] += 1
+                row[3] += entry.nbytes
+        return pd.DataFrame.from_dict(rows, orient='index', columns=columns)
+
+    def total_bytes(self):
+        """本地缓存总占用字节数"""
+        return sum(entry.nbytes for _, _, entry, _ in self._entries())
+
+    def _delete(self, store, key):
+        with store_lock(store.root, key):
+            store.delete(key)
+
+    def evict(self, max_bytes=None):
+        """
+        删除过期项目，再按最久未使用删除至不超过预算
+
+        Returns
+        -------
+        res : tuple
+            (删除项目数, 释放字节数)
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        entries = self._entries()
+        total = sum(entry.nbytes for _, _, entry, _ in entries)
+        removed, freed = 0, 0
+        touched = set()
+        keep = []
+        for name, store, entry, expired in entries:
+            if expired:
+                self._delete(store, entry.key)
+                touched.add(store)
+                removed += 1
+                freed += entry.nbytes
+            else:
+                keep.append((store, entry))
+        keep.sort(key=lambda x: x[1].accessed)
+        for store, entry in keep:
+            if total - freed <= max_bytes:
+                break
+            self._delete(store, entry.key)
+            touched.add(store)
+            removed += 1
+            freed += entry.nbytes
+        for store in touched:
+            store.compact()
+        logger.info('删除缓存项目{}个，释放{:.1f}MB，剩余{:.1f}MB'.format(
+            removed, freed / 1024 ** 2, (total - freed) / 1024 ** 2))
+        return removed, freed
@@ -12,6 +12,7 @@ from ..websource.wy import (fetch_financial_indicator,
                             fetch_company_info,
                             fetch_top10_stockholder,
                             fetch_jjcg,
+                            fetch_cjmx,
                             get_index_base)
 
 from ..websource.juchao import (fetch_adjustment,
@@ -24,37 +25,56 @@ from ..websource.juchao import (fetch_adjustment,
 
 from ..websource.date_utils import is_trading_day, get_non_trading_days, get_trading_dates
 
-from .cache import DataProxy
+from .cache import DataProxy, DEFAULT_MEMORY_LIMIT, DEFAULT_NEGATIVE_TTL
+from .history import HistoryProxy
 
 # 交易日期
+# 以日期为参数的判断，过期数据可能给出错误结果，过期后在前台重新下载
 is_trading_reader = DataProxy(is_trading_day, time_str='9:30:00')
 non_trading_days_reader = DataProxy(get_non_trading_days)
 trading_days_reader = DataProxy(get_trading_dates)
 
+# 说明：按代码大量调用的代理使用SQLite单文件存储，避免产生数千个小文件；
+#      同一运行中重复读取的代理另使用进程内缓存；
+#      变动缓慢的数据按周更新。财务报告虽按季度发布，但各公司披露时间分散在季后数周，
+#      按季度更新将遗漏新发布的报告，故亦按周更新（按公告触发的刷新不受影响）；
+#      按期间或日期查询的代理缓存无数据结果，避免反复请求不存在的网页；
+#      按周更新的基础信息过期数据无害，过期时先使用本地数据，后台刷新
+
 # 基础信息
 
 # -> 股票
-juchao_info_reader = DataProxy(fetch_company_brief_info)
-wy_info_reader = DataProxy(fetch_company_info)
+juchao_info_reader = DataProxy(fetch_company_brief_info, freq='W',
+                               stale_while_revalidate=True)
+wy_info_reader = DataProxy(fetch_company_info, freq='W', stale_while_revalidate=True)
 stock_code_reader = DataProxy(get_stock_codes)
-top_10_reader = DataProxy(fetch_top10_stockholder)
-jjcg_reader = DataProxy(fetch_jjcg)
+top_10_reader = DataProxy(fetch_top10_stockholder, freq='W',
+                          store='sqlite', memory_limit=DEFAULT_MEMORY_LIMIT,
+                          negative_ttl=DEFAULT_NEGATIVE_TTL)
+jjcg_reader = DataProxy(fetch_jjcg, freq='W', store='sqlite',
+                        negative_ttl=DEFAULT_NEGATIVE_TTL)
 announcement_reader = DataProxy(fetch_announcement_summary)
 
-industry_stocks_reader = DataProxy(fetch_industry_stocks)  # 行业股票清单
-industry_reader = DataProxy(fetch_industry)               # 行业
+industry_stocks_reader = DataProxy(fetch_industry_stocks, freq='W')  # 行业股票清单
+industry_reader = DataProxy(fetch_industry, freq='W')     # 行业
 
 # -> 指数
-index_info_reader = DataProxy(fetch_index_info)
+index_info_reader = DataProxy(fetch_index_info, freq='W', stale_while_revalidate=True)
 index_base_reader = DataProxy(get_index_base)
 
 # 交易类
-history_data_reader = DataProxy(fetch_history)
+# 每个代码保存一个序列，仅下载缺失期间
+history_data_reader = HistoryProxy(fetch_history, memory_limit=DEFAULT_MEMORY_LIMIT)
 margin_reader = DataProxy(fetch_margin_data, time_str='09:00:00')  # 融资融券
+# 成交明细另以TickStore存储，仅缓存无数据结果
+cjmx_reader = DataProxy(fetch_cjmx, store='sqlite', negative_ttl=DEFAULT_NEGATIVE_TTL,
+                        negative_only=True)
 
 # 财务类数据
-indicator_reader = DataProxy(fetch_financial_indicator)  # 财务指标
-report_reader = DataProxy(fetch_financial_report)        # 财务报表
+indicator_reader = DataProxy(fetch_financial_indicator, freq='W',
+                             store='sqlite', memory_limit=DEFAULT_MEMORY_LIMIT)  # 财务指标
+report_reader = DataProxy(fetch_financial_report, freq='W',
+                          store='sqlite', memory_limit=DEFAULT_MEMORY_LIMIT)  # 财务报表
 performance_notice_reader = DataProxy(fetch_performance_notice)  # 业绩预告(使用同花顺业绩预告)
 
 # 分红派息
@@ -79,6 +99,7 @@ __all__ = [
     'index_base_reader',
     'history_data_reader',
     'margin_reader',
+    'cjmx_reader',
     'indicator_reader',
     'report_reader',
     'performance_notice_reader',
@@ -0,0 +1,153 @@
+"""
+历史交易数据增量缓存
+
+`DataProxy`以全部参数作为键，每日结束日期变化导致缓存失效，需要重新下载全部期间。
+历史交易数据（不复权）一旦生成不再变动，`HistoryProxy`为每个代码保存一个不断增长的序列，
+并记录已覆盖期间。读取时仅下载缺失的期间（通常仅为最新交易日），合并后从本地序列截取。
+
+说明：
+    结束日期晚于已发布日期（当日网站更新时间之前为上一日）时，不计入覆盖期间。
+    已发布日期当日仅在网站返回该日数据后计入覆盖期间，此前每次读取均重新下载。
+    未发布部分在每个更新周期内只尝试下载一次，至下一更新时间后读取时重新下载。
+"""
+from datetime import timedelta
+
+import pandas as pd
+
+from ..common.utils import sanitize_dates
+from ..websource.exceptions import NoWebData
+from .cache import DataProxy, hash_args
+from .locks import store_lock
+
+
+class HistoryProxy(DataProxy):
+    """
+    增量历史交易数据代理
+
+    Parameters
+    ----------
+    fetch_fun : function
+        下载函数，签名与`wy.fetch_history`一致：(code, start, end, is_index)
+    time_str : str
+        网站更新数据时间
+    store : str
+        本地存储方式，默认为'sqlite'
+    memory_limit : int
+        进程内缓存占用上限（字节）
+
+    Example
+    -------
+    >>> reader = HistoryProxy(fetch_history)
+    >>> df = reader.read('000001', '2018-1-1', '2018-4-4')
+    """
+
+    def __init__(self, fetch_fun, time_str=None, store='sqlite', memory_limit=None):
+        super(HistoryProxy, self).__init__(fetch_fun, time_str, store=store,
+                                           memory_limit=memory_limit)
+
+    def get_cache_key(self, code, is_index=False):
+        """本地存储键。每个代码一个序列"""
+        return hash_args('series', code, is_index=is_index)
+
+    def is_expired(self, last_time):
+        """序列以覆盖期间判断是否需要下载，不按时间过期"""
+        return False
+
+    def _published_date(self):
+        """网站已发布数据的最后日期"""
+        now = pd.Timestamp('now', tz='Asia/Shanghai')
+        if now > self.expiration:
+            return now.date()
+        return (now - timedelta(days=1)).date()
+
+    def _load(self, key):
+        """读取本地序列。返回(序列字典, 是否来自进程内缓存)"""
+        if self._memory is not None:
+            hit, entry = self._memory.get(key, self.is_expired)
+            if hit:
+                return entry, True
+        if self._store.updated_time(key) is None:
+            return None, False
+        return self._store.load(key), False
+
+    def _fetch(self, code, start, end, is_index):
+        df = self._fetch_fun(code=code, start=start, end=end, is_index=is_index)
+        return df.sort_index()
+
+    def _covered_end(self, data, start, end, published):
+        """
+        下载期间`start`至`end`的覆盖结束日期
+
+        已发布日期之前的日期均可确认；已发布日期当日仅在返回数据包含该日时计入，
+        网站延迟发布时，下次读取重新下载。已发布日期之后的数据可能不完整，不计入。
+        """
+        res = min(end, published - timedelta(days=1))
+        if data is not None and not data.empty:
+            res = max(res, min(data.index[-1].date(), end, published))
+        return max(res, start - timedelta(days=1))
+
+    def _extend(self, entry, code, start, end, is_index):
+        """
+        下载缺失期间并合并。返回(序列字典, 是否变动)
+
+        序列字典：{'data': 升序DataFrame, 'start': 覆盖开始日期, 'end': 覆盖结束日期,
+                   'tail': 最近一次尝试下载未发布期间时的已发布日期}
+        """
+        published = self._published_date()
+        tail = published if end > published else None
+        if entry is None:
+            data = self._fetch(code, start, end, is_index)
+            cov_end = self._covered_end(data, start, end, published)
+            return {'data': data, 'start': start, 'end': cov_end, 'tail': tail}, True
+        parts = [entry['data']]
+        cov_start, cov_end = entry['start'], entry['end']
+        if start < cov_start:
+            parts.insert(0, self._fetch(
+                code, start, cov_start - timedelta(days=1), is_index))
+            cov_start = start
+        # 缺失期间均未发布，且本更新周期内已尝试下载时，不再重复请求
+        tried = cov_end >= published and entry.get('tail') == published
+        if end > cov_end and not tried:
+            # 自已覆盖期间后一日开始下载，保持序列连续
+            tail_start = cov_end + timedelta(days=1)
+            try:
+                part = self._fetch(code, tail_start, end, is_index)
+                parts.append(part)
+            except NoWebData:
+                # 期间内无交易（停牌或尚未发布）
+                part = None
+            cov_end = max(cov_end, self._covered_end(part, tail_start, end, published))
+        else:
+            tail = entry.get('tail')
+        if len(parts) == 1 and (tail, cov_end) == (entry.get('tail'), entry['end']):
+            return entry, False
+        data = pd.concat(parts)
+        data = data[~data.index.duplicated(keep='last')].sort_index()
+        return {'data': data, 'start': cov_start, 'end': cov_end, 'tail': tail}, True
+
+    def read(self, code, start=None, end=None, is_index=False):
+        """
+        读取历史交易数据（不复权）
+
+        Returns
+        -------
+        res : DataFrame
+            与`fetch_history`一致，按日期降序排列
+
+        Notes
+        -----
+            开始日期大于结束日期时，触发值异常
+        """
+        start, end = sanitize_dates(start, end)
+        key = self.get_cache_key(code, is_index)
+        with self._key_lock(key), store_lock(self._store.root, key):
+            entry, in_memory = self._load(key)
+            entry, changed = self._extend(entry, code, start, end, is_index)
+            if changed:
+                self._store.dump(key, entry)
+            if self._memory is not None and (changed or not in_memory):
+                self._memory.put(key, pd.Timestamp('now', tz='Asia/Shanghai'), entry)
+        data = entry['data']
+        if data.empty:
+            return data.copy()
+        return data.loc[pd.Timestamp(start):pd.Timestamp(end)].iloc[::-1].copy()
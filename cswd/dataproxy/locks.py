@@ -0,0 +1,156 @@
+"""
+数据代理锁
+
+    KeyLock     进程内按键加锁，同一键同时只有一个线程下载
+    file_lock   跨进程文件锁
+    store_lock  跨进程按键加锁，多个计划任务程序同时运行时，同一键只下载一次
+
+每个本地存储只使用一个锁文件，按键散列锁定文件中的不同字节，
+不同键（散列不同时）可在多个进程中同时下载。
+"""
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+LOCK_FILE_NAME = '.lock'
+LOCK_SLOTS = 256       # 锁文件按键散列分段加锁的段数
+
+
+class KeyLock(object):
+    """
+    进程内按键加锁（线程安全）
+
+    Example
+    -------
+    >>> locks = KeyLock()
+    >>> with locks('a'):
+    ...     pass
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}    # 键 -> [锁, 使用数量]
+
+    @contextmanager
+    def __call__(self, key):
+        with self._lock:
+            item = self._locks.setdefault(key, [threading.Lock(), 0])
+            item[1] += 1
+        try:
+            with item[0]:
+                yield
+        finally:
+            with self._lock:
+                item[1] -= 1
+                if item[1] == 0:
+                    del self._locks[key]
+
+
+def _lock_fd(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    else:
+        while True:
+            try:
+                msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                time.sleep(0.1)
+
+
+def _unlock_fd(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path):
+    """
+    跨进程独占文件锁，阻塞至取得锁
+
+    Notes
+    -----
+        锁按打开的文件描述符区分，同一进程内的多个线程也会相互阻塞
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT)
+    try:
+        _lock_fd(fd)
+        try:
+            yield
+        finally:
+            _unlock_fd(fd)
+    finally:
+        os.close(fd)
+
+
+def _slot(key):
+    """键在锁文件中所对应的字节位置"""
+    return zlib.crc32(key.encode('utf-8')) % LOCK_SLOTS
+
+
+# 锁文件路径 -> 文件描述符。fcntl锁属于进程，关闭同一文件的任一描述符
+# 均会释放本进程在该文件上的全部锁，因此每个锁文件只打开一次，不再关闭
+_fds = {}
+_fds_lock = threading.Lock()
+# 同一进程内，同一字节同时只由一个线程锁定
+_slot_locks = KeyLock()
+
+
+def _shared_fd(path):
+    with _fds_lock:
+        fd = _fds.get(path)
+        if fd is None:
+            fd = _fds[path] = os.open(path, os.O_RDWR | os.O_CREAT)
+        return fd
+
+
+@contextmanager
+def _range_lock(path, offset):
+    """跨进程锁定文件中的一个字节，阻塞至取得锁"""
+    if fcntl is not None:
+        fd = _shared_fd(path)
+        fcntl.lockf(fd, fcntl.LOCK_EX, 1, offset)
+        try:
+            yield
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN, 1, offset)
+    else:
+        # msvcrt锁属于文件句柄，每次使用独立的句柄
+        fd = os.open(path, os.O_RDWR | os.O_CREAT)
+        try:
+            os.lseek(fd, offset, os.SEEK_SET)
+            _lock_fd(fd)
+            try:
+                yield
+            finally:
+                os.lseek(fd, offset, os.SEEK_SET)
+                _unlock_fd(fd)
+        finally:
+            os.close(fd)
+
+
+@contextmanager
+def store_lock(root, key):
+    """
+    跨进程按键加锁，阻塞至取得锁
+
+    存储目录`root`下只使用一个锁文件`LOCK_FILE_NAME`
+
+    Notes
+    -----
+        散列相同的不同键相互阻塞；同一进程内不阻塞散列不同的键
+    """
+    path = os.path.join(root, LOCK_FILE_NAME)
+    offset = _slot(key)
+    with _slot_locks((path, offset)), _range_lock(path, offset):
+        yield
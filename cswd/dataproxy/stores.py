@@ -0,0 +1,314 @@
+"""
+数据代理本地存储
+
+    FileStore       每个键对应一个pickle文件（默认）
+    SqliteStore     每个函数对应一个SQLite文件，值以压缩后的pickle存储
+    MemoryCache     进程内LRU缓存，可选，位于以上本地存储之前
+
+本地存储记录每个键的更新时间及最后访问时间，供`CacheManager`按过期及最久未使用淘汰。
+
+使用大量小文件时，每次运行都会产生数千个文件，且每次命中均需完整读取文件。
+SqliteStore将同一函数的全部缓存存放于单个数据库文件，读取时使用内存映射，
+并以zlib压缩存储，显著减少文件数量及磁盘占用。
+"""
+import copy
+import os
+import pickle
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict, namedtuple
+
+import pandas as pd
+
+TZ = 'Asia/Shanghai'
+
+SQLITE_FILE_NAME = 'cache.sqlite'
+TMP_PREFIX = '.tmp-'
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024   # 内存映射大小(字节)
+COMPRESS_LEVEL = 1       # 压缩级别。级别越高，占用越少，但读写更慢
+ACCESS_RESOLUTION = 3600  # 访问时间精度(秒)。SqliteStore超出该时长才更新访问时间
+
+
+# 本地存储项目。时间均为时间戳（秒）
+CacheEntry = namedtuple('CacheEntry', 'key updated accessed nbytes')
+
+
+def to_timestamp(seconds):
+    """将时间戳（秒）转换为本地时间。舍弃秒以下单位的数字"""
+    return pd.Timestamp(int(seconds), unit='s', tz='UTC').tz_convert(TZ)
+
+
+class FileStore(object):
+    """
+    文件存储
+
+    Parameters
+    ----------
+    root : str
+        存储目录
+    """
+
+    def __init__(self, root):
+        self.root = root
+        if not os.path.exists(root):
+            os.makedirs(root)
+
+    def path(self, key):
+        """键所对应的文件路径"""
+        return os.path.join(self.root, key)
+
+    def updated_time(self, key):
+        """最后更新时间，不存在时返回None"""
+        try:
+            return to_timestamp(os.path.getmtime(self.path(key)))
+        except FileNotFoundError:
+            return None
+
+    def load(self, key):
+        path = self.path(key)
+        with open(path, 'rb') as f:
+            data = pickle.load(f)
+        # 记录访问时间（保留修改时间），不依赖文件系统的atime设置
+        try:
+            os.utime(path, (time.time(), os.path.getmtime(path)))
+        except OSError:
+            pass
+        return data
+
+    def dump(self, key, data):
+        """写入临时文件后替换，读取方不会读到写入中途的文件"""
+        fd, tmp_path = tempfile.mkstemp(prefix=TMP_PREFIX, dir=self.root)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(data, f)
+            os.replace(tmp_path, self.path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def delete(self, key):
+        try:
+            os.remove(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        """全部存储项目列表"""
+        res = []
+        for item in os.scandir(self.root):
+            # 跳过锁文件及写入中的临时文件
+            if item.name.startswith('.') or not item.is_file():
+                continue
+            try:
+                st = item.stat()
+            except FileNotFoundError:
+                continue
+            res.append(CacheEntry(item.name, st.st_mtime, st.st_atime, st.st_size))
+        return res
+
+    def compact(self):
+        pass
+
+
+class SqliteStore(object):
+    """
+    单文件SQLite存储
+
+    Parameters
+    ----------
+    root : str
+        存储目录，数据库文件为目录下的`cache.sqlite`
+    compress_level : int
+        zlib压缩级别(0-9)，0代表不压缩
+
+    Notes
+    -----
+        每个线程使用独立的数据库连接
+    """
+
+    def __init__(self, root, compress_level=COMPRESS_LEVEL):
+        self.root = root
+        if not os.path.exists(root):
+            os.makedirs(root)
+        self.db_path = os.path.join(root, SQLITE_FILE_NAME)
+        self.compress_level = compress_level
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache '
+                         '(key TEXT PRIMARY KEY, updated REAL, data BLOB, accessed REAL)')
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(cache)')]
+            if 'accessed' not in columns:
+                conn.execute('ALTER TABLE cache ADD COLUMN accessed REAL')
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA mmap_size={}'.format(SQLITE_MMAP_SIZE))
+            self._local.conn = conn
+        return conn
+
+    def updated_time(self, key):
+        """最后更新时间，不存在时返回None"""
+        row = self._conn().execute(
+            'SELECT updated FROM cache WHERE key=?', (key,)).fetchone()
+        if row is None:
+            return None
+        return to_timestamp(row[0])
+
+    def load(self, key):
+        """读取键值。访问时间仅用于淘汰，距上次记录超出`ACCESS_RESOLUTION`时才写入"""
+        row = self._conn().execute(
+            'SELECT data, accessed FROM cache WHERE key=?', (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        now = time.time()
+        if row[1] is None or now - row[1] >= ACCESS_RESOLUTION:
+            with self._conn() as conn:
+                conn.execute('UPDATE cache SET accessed=? WHERE key=?', (now, key))
+        return pickle.loads(zlib.decompress(row[0]))
+
+    def dump(self, key, data):
+        blob = zlib.compress(pickle.dumps(data, pickle.HIGHEST_PROTOCOL),
+                             self.compress_level)
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute('INSERT OR REPLACE INTO cache (key, updated, data, accessed) '
+                         'VALUES (?, ?, ?, ?)', (key, now, blob, now))
+
+    def delete(self, key):
+        with self._conn() as conn:
+            conn.execute('DELETE FROM cache WHERE key=?', (key,))
+
+    def entries(self):
+        """全部存储项目列表"""
+        rows = self._conn().execute(
+            'SELECT key, updated, COALESCE(accessed, updated), LENGTH(data) FROM cache')
+        return [CacheEntry(*row) for row in rows]
+
+    def compact(self):
+        """删除项目后回收数据库文件空间"""
+        conn = self._conn()
+        conn.execute('VACUUM')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+STORES = {
+    'file': FileStore,
+    'sqlite': SqliteStore,
+}
+
+
+def _copy(data):
+    """返回副本，避免调用方修改内存中的缓存"""
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        return data.copy()
+    return copy.deepcopy(data)
+
+
+def _sizeof(data):
+    """估计对象占用内存字节数"""
+    if isinstance(data, pd.DataFrame):
+        return int(data.memory_usage(index=True, deep=True).sum())
+    if isinstance(data, pd.Series):
+        return int(data.memory_usage(index=True, deep=True))
+    try:
+        return len(pickle.dumps(data, pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(data)
+
+
+MemoryInfo = namedtuple('MemoryInfo', 'hits misses evictions currsize maxsize')
+
+
+class MemoryCache(object):
+    """
+    进程内LRU缓存（线程安全）
+
+    位于本地存储之前，同一运行中重复读取同一键时，免去查询本地存储及反序列化。
+
+    Parameters
+    ----------
+    maxsize : int
+        最大占用字节数。超出时淘汰最久未使用的项目
+
+    Notes
+    -----
+        存入及取出时均复制对象
+    """
+
+    def __init__(self, maxsize):
+        assert maxsize > 0, 'maxsize必须大于0'
+        self.maxsize = maxsize
+        self.currsize = 0
+        self.hits = self.misses = self.evictions = 0
+        self._items = OrderedDict()   # 键 -> (更新时间, 数据, 字节数)
+        self._lock = threading.Lock()
+
+    def get(self, key, is_expired):
+        """
+        查询键值
+
+        Parameters
+        ----------
+        key : str
+            键
+        is_expired : function
+            接收更新时间，判断项目是否过期
+
+        Returns
+        -------
+        res : tuple
+            (是否命中, 数据)。过期项目视为未命中
+        """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or is_expired(item[0]):
+                if item is not None:
+                    self._remove(key)
+                self.misses += 1
+                return False, None
+            self._items.move_to_end(key)
+            self.hits += 1
+            data = item[1]
+        return True, _copy(data)
+
+    def put(self, key, updated, data):
+        nbytes = _sizeof(data)
+        if nbytes > self.maxsize:
+            return
+        data = _copy(data)
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+            self._items[key] = (updated, data, nbytes)
+            self.currsize += nbytes
+            while self.currsize > self.maxsize:
+                self._remove(next(iter(self._items)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, nbytes = self._items.pop(key)
+        self.currsize -= nbytes
+
+    def discard(self, key):
+        with self._lock:
+            if key in self._items:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.currsize = 0
+
+    def info(self):
+        """命中、未命中、淘汰次数及占用字节数"""
+        with self._lock:
+            return MemoryInfo(self.hits, self.misses, self.evictions,
+                              self.currsize, self.maxsize)
@@ -1,4 +1,5 @@
 from .base import get_session, session_scope, get_engine
+from .ticks import TickStore
 from .models import (
     Stock,
     Issue,
@@ -33,6 +34,7 @@ __all__ = [
     'get_session',
     'session_scope',
     'get_engine',
+    'TickStore',
     'Stock',
     'Issue',
     'TradingCalendar',
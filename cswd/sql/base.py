@@ -1,9 +1,12 @@
 import os
 import enum
+import threading
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
 from sqlalchemy.exc import IntegrityError
 
 from ..common.utils import data_root
@@ -11,6 +14,41 @@ from ..common.constants import DB_DIR_NAME, DB_NAME
 
 
 SQLITE_MAX_VARIABLE_NUMBER = 999
+BULK_BATCH_SIZE = 10000   # 批量写入时，每批行数
+POOL_SIZE = 5             # 连接池保持的连接数量
+MAX_OVERFLOW = 10         # 连接池允许超出的连接数量
+
+# SQLite连接参数方案。建立连接时执行PRAGMA设置
+#   default：计划任务写入，研究进程同时读取（WAL模式下读取不被写入阻塞）
+#   read：只读研究，更大的内存映射及页面缓存
+#   bulk：初始化等大批量写入，不等待数据落盘（断电可能丢失最后的事务，但不会损坏数据库）
+PRAGMA_PROFILES = {
+    'default': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 1024 ** 3,          # 1GB
+        'cache_size': -64 * 1024,        # 负数单位为KB，即64MB
+        'temp_store': 'MEMORY',
+        'busy_timeout': 30000,           # 毫秒
+    },
+    'read': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 16 * 1024 ** 3,     # 实际映射不超过数据库大小及编译上限
+        'cache_size': -256 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 30000,
+    },
+    'bulk': {
+        'journal_mode': 'WAL',
+        'synchronous': 'OFF',
+        'mmap_size': 1024 ** 3,
+        'cache_size': -512 * 1024,
+        'temp_store': 'MEMORY',
+        'busy_timeout': 60000,
+    },
+}
+DEFAULT_PROFILE = 'default'
 
 class Action(enum.Enum):
     INSERT = 1    # 插入
@@ -64,19 +102,197 @@ def db_path(db_name):
     return os.path.join(db_dir, db_name)
 
 
-def get_engine(path_str=db_path(DB_NAME), echo=False):
-    """数据库引擎"""
-    engine = create_engine('sqlite:///' + path_str, echo=echo)
+_engines = {}
+_sessionmakers = {}
+_checked = set()      # 已检查结构的数据库路径
+_engines_lock = threading.Lock()
+
+
+def set_default_profile(profile):
+    """
+    设置默认连接参数方案
+
+    Parameters
+    ----------
+    profile : str
+        `PRAGMA_PROFILES`中的方案名称，如初始化数据时使用'bulk'，研究时使用'read'
+    """
+    global DEFAULT_PROFILE
+    assert profile in PRAGMA_PROFILES, 'profile仅接受{}'.format(tuple(PRAGMA_PROFILES))
+    DEFAULT_PROFILE = profile
+
+
+def _pragma_listener(pragmas):
+    """建立连接时执行PRAGMA设置"""
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA {}={}'.format(name, value))
+        cursor.close()
+    return on_connect
+
+
+def get_engine(path_str=None, echo=False, profile=None):
+    """
+    数据库引擎
+
+    同一数据库路径（及echo设置、连接参数方案）在进程内共享一个引擎及连接池，
+    避免每次取得会话时重新创建引擎、建立连接。
+
+    Parameters
+    ----------
+    path_str : str
+        数据库路径，默认为`stock.db`
+    echo : bool
+        是否输出SQL语句
+    profile : str
+        连接参数方案（参见`PRAGMA_PROFILES`），默认为`DEFAULT_PROFILE`
+
+    Notes
+    -----
+        连接池中的连接可能由不同线程使用，但每个连接同时只被一个会话使用。
+        进程内首次使用某一数据库路径时检查已有数据表的索引，
+        需要升级时触发`migrate.UpgradeRequired`（参见`migrate`）
+    """
+    if path_str is None:
+        path_str = db_path(DB_NAME)
+    if profile is None:
+        profile = DEFAULT_PROFILE
+    key = (path_str, echo, profile)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = create_engine('sqlite:///' + path_str, echo=echo,
+                                   poolclass=QueuePool,
+                                   pool_size=POOL_SIZE,
+                                   max_overflow=MAX_OVERFLOW,
+                                   connect_args={'check_same_thread': False})
+            event.listen(engine, 'connect',
+                         _pragma_listener(PRAGMA_PROFILES[profile]))
+            _engines[key] = engine
+        checked = path_str in _checked
+    if not checked:
+        # 仅读取索引信息，不修改数据库，无需持有锁
+        from .migrate import check_schema
+        check_schema(engine)
+        with _engines_lock:
+            _checked.add(path_str)
     return engine
 
 
-def get_session(echo=False):
-    engine = get_engine(echo=echo)
-    Session = sessionmaker(bind=engine)
+def get_sessionmaker(path_str=None, echo=False, profile=None):
+    """数据库引擎所对应的会话工厂（同一路径共享）"""
+    engine = get_engine(path_str, echo, profile)
+    with _engines_lock:
+        Session = _sessionmakers.get(engine)
+        if Session is None:
+            Session = sessionmaker(bind=engine)
+            _sessionmakers[engine] = Session
+        return Session
+
+
+def get_session(echo=False, profile=None):
+    Session = get_sessionmaker(echo=echo, profile=profile)
     session = Session()
     return session
 
 
+def dispose_engines():
+    """关闭全部引擎连接池（如子进程中需要重新建立连接）"""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
+        _sessionmakers.clear()
+        _checked.clear()
+
+
+def bulk_insert(sess, tab_cls, records, batch_size=BULK_BATCH_SIZE):
+    """
+    以executemany方式批量插入记录
+
+    Parameters
+    ----------
+    sess : Session
+        数据库会话
+    tab_cls : class
+        数据表模型类
+    records : list
+        字典列表，键为数据表列名称（而非类属性名称）
+    batch_size : int
+        每批行数
+
+    Returns
+    -------
+    res : int
+        插入行数
+
+    Notes
+    -----
+        绕过ORM对象构建，由调用方负责提交事务
+    """
+    table = tab_cls.__table__
+    for i in range(0, len(records), batch_size):
+        sess.execute(table.insert(), records[i:i + batch_size])
+    return len(records)
+
+
+def unique_columns(tab_cls):
+    """数据表唯一索引的列名称，无唯一索引时返回None"""
+    for index in tab_cls.__table__.indexes:
+        if index.unique:
+            return [c.name for c in index.columns]
+    return None
+
+
+def upsert(sess, tab_cls, records, update=False, batch_size=BULK_BATCH_SIZE):
+    """
+    以`INSERT ... ON CONFLICT`方式批量写入记录
+
+    Parameters
+    ----------
+    sess : Session
+        数据库会话
+    tab_cls : class
+        数据表模型类，必须定义唯一索引
+    records : list
+        字典列表，键为数据表列名称（而非类属性名称）
+    update : bool
+        与唯一索引冲突时，是否以新值更新已有行。默认忽略新值
+    batch_size : int
+        每批行数
+
+    Returns
+    -------
+    res : int
+        插入（或更新）行数
+
+    Notes
+    -----
+        重复写入同一数据不会产生重复行，无需事先查询已有数据。
+        由调用方负责提交事务
+    """
+    keys = unique_columns(tab_cls)
+    assert keys, '{}未定义唯一索引'.format(tab_cls.__tablename__)
+    if not records:
+        return 0
+    table = tab_cls.__table__
+    stmt = sqlite_insert(table)
+    if update:
+        columns = [c for c in records[0] if c not in keys]
+        if '更新时间' in table.c:
+            columns.append('更新时间')
+        stmt = stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={c: stmt.excluded[c] for c in columns})
+    else:
+        stmt = stmt.on_conflict_do_nothing(index_elements=keys)
+    res = 0
+    for i in range(0, len(records), batch_size):
+        res += sess.execute(stmt, records[i:i + batch_size]).rowcount
+    return res
+
+
 def drop_table(tab_cls):
     """删除类所对应的数据表"""
     table = tab_cls.__table__
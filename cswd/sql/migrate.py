@@ -0,0 +1,125 @@
+"""
+已有数据库升级
+
+`create_all`不会为已经存在的表添加模型中新定义的索引。
+以`upsert`写入的表必须存在唯一索引，否则`ON CONFLICT`语句执行失败。
+
+升级需要删除与唯一索引冲突的重复行，为显式步骤：运行`upgrade-db`（或`create-db-tables`）。
+`get_engine`首次打开数据库时仅以`check_schema`检查索引，需要升级时触发`UpgradeRequired`。
+重复执行升级不会产生任何变动。
+"""
+import logbook
+from sqlalchemy import create_engine, inspect
+
+from .models import Base
+
+logger = logbook.Logger('数据库升级')
+
+# 已废弃的索引。表名称 -> 索引名称
+# 分红派息同一实施日期可能存在多个分红年度，唯一索引改为（代码，日期，分红年度）
+OBSOLETE_INDEXES = {
+    'adjustments': ('uix_adjustments_code_date',),
+}
+
+
+class UpgradeRequired(Exception):
+    """数据库版本过旧，需要升级"""
+    pass
+
+
+def _pending(inspector):
+    """需要变动的索引。返回[(表, 缺失的模型索引列表, 需删除的废弃索引名称列表)]"""
+    res = []
+    tables = set(inspector.get_table_names())
+    for table in Base.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        existing = {x['name'] for x in inspector.get_indexes(table.name)}
+        missing = [index for index in table.indexes if index.name not in existing]
+        obsolete = [name for name in OBSOLETE_INDEXES.get(table.name, ())
+                    if name in existing]
+        if missing or obsolete:
+            res.append((table, missing, obsolete))
+    return res
+
+
+def check_schema(engine):
+    """
+    检查已有数据表是否包含模型定义的全部索引
+
+    Raises
+    ------
+    UpgradeRequired
+        存在缺失或已废弃的索引
+    """
+    with engine.connect() as conn:
+        pending = _pending(inspect(conn))
+    if pending:
+        names = sorted(table.name for table, _, _ in pending)
+        raise UpgradeRequired('数据库{}需要升级（数据表：{}），请先运行`upgrade-db`'.format(
+            engine.url.database, '，'.join(names)))
+
+
+def _dedupe(conn, table, columns):
+    """删除与唯一索引冲突的重复行，保留最后写入（序号最大）的行。逐行记录删除的行"""
+    cols = ', '.join('"{}"'.format(c) for c in columns)
+    where = ('WHERE "序号" NOT IN '
+             '(SELECT MAX("序号") FROM "{0}" GROUP BY {1})').format(table.name, cols)
+    rows = conn.exec_driver_sql('SELECT "序号", {} FROM "{}" {}'.format(
+        cols, table.name, where)).fetchall()
+    for row in rows:
+        logger.info('表：{}，删除重复行：序号 {}，{}'.format(
+            table.name, row[0], dict(zip(columns, row[1:]))))
+    if rows:
+        conn.exec_driver_sql('DELETE FROM "{}" {}'.format(table.name, where))
+    return len(rows)
+
+
+def _create_index(conn, index):
+    """以`CREATE INDEX IF NOT EXISTS`添加索引（多个进程同时升级时不会出错）"""
+    cols = ', '.join('"{}"'.format(c.name) for c in index.columns)
+    sql = 'CREATE {}INDEX IF NOT EXISTS "{}" ON "{}" ({})'.format(
+        'UNIQUE ' if index.unique else '', index.name, index.table.name, cols)
+    conn.exec_driver_sql(sql)
+
+
+def create_indexes(engine):
+    """
+    为已有数据表添加模型中新定义的索引，并删除已废弃的索引
+
+    添加唯一索引前，先删除重复行。全部变动在同一事务中完成。
+
+    Returns
+    -------
+    res : list
+        新添加的索引名称列表
+    """
+    res = []
+    with engine.begin() as conn:
+        for table, missing, obsolete in _pending(inspect(conn)):
+            for name in obsolete:
+                conn.exec_driver_sql('DROP INDEX IF EXISTS "{}"'.format(name))
+                logger.info('表：{}，删除废弃索引：{}'.format(table.name, name))
+            for index in missing:
+                if index.unique:
+                    columns = [c.name for c in index.columns]
+                    rows = _dedupe(conn, table, columns)
+                    if rows:
+                        logger.info('表：{}，删除重复行{}行'.format(table.name, rows))
+                _create_index(conn, index)
+                logger.info('表：{}，添加索引：{}'.format(table.name, index.name))
+                res.append(index.name)
+    return res
+
+
+def upgrade(path_str):
+    """
+    升级指定路径的数据库
+
+    使用独立的引擎，不经过`get_engine`的检查及缓存
+    """
+    engine = create_engine('sqlite:///' + path_str)
+    try:
+        return create_indexes(engine)
+    finally:
+        engine.dispose()
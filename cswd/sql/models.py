@@ -1,7 +1,7 @@
 import datetime
 
 from sqlalchemy import (Column, Date, DateTime, Enum, Float, ForeignKey, Boolean,
-                        Integer, SmallInteger, String, Text, func)
+                        Index, Integer, SmallInteger, String, Text, func)
 from sqlalchemy.ext.declarative import declarative_base, declared_attr
 from sqlalchemy.orm import relationship
 
@@ -183,6 +183,9 @@ Stock.shareholders = relationship("Shareholder",
 
 class StockDaily(Base):
     """股票日线数据"""
+    __table_args__ = (
+        Index('uix_stock_dailies_code_date', '股票代码', '日期', unique=True),
+    )
     code = Column(String(6),
                   ForeignKey('stocks.股票代码'),
                   index=True,
@@ -264,6 +267,9 @@ class BalanceSheet(Base):
         2. 公告日期为发布报告日期
         3. 如存在修订，则只保存最后一期数据，即修正后版本
     """
+    __table_args__ = (
+        Index('uix_balance_sheets_code_date', '股票代码', '报告日期', unique=True),
+    )
     code = Column(String,
                   ForeignKey('stocks.股票代码'),
                   index=True,
@@ -410,6 +416,9 @@ class ProfitStatement(Base):
         2. 公告日期为发布报告日期
         3. 如存在修订，则只保存最后一期数据，即修正后版本
     """
+    __table_args__ = (
+        Index('uix_profit_statements_code_date', '股票代码', '报告日期', unique=True),
+    )
     code = Column(String,
                   ForeignKey('stocks.股票代码'),
                   index=True,
@@ -487,6 +496,9 @@ class CashflowStatement(Base):
         2. 公告日期为发布报告日期
         3. 如存在修订，则只保存最后一期数据，即修正后版本
     """
+    __table_args__ = (
+        Index('uix_cashflow_statements_code_date', '股票代码', '报告日期', unique=True),
+    )
     code = Column(String,
                   ForeignKey('stocks.股票代码'),
                   index=True,
@@ -614,6 +626,9 @@ class ZYZB(Base):
         2. 公告日期为发布报告日期
         3. 如存在修订，则只保存最后一期数据，即修正后版本
     """
+    __table_args__ = (
+        Index('uix_zyzbs_code_date', '股票代码', '报告日期', unique=True),
+    )
     code = Column(String,
                   ForeignKey('stocks.股票代码'),
                   index=True,
@@ -663,6 +678,9 @@ class YLNL(Base):
         2. 公告日期为发布报告日期
         3. 如存在修订，则只保存最后一期数据，即修正后版本
     """
+    __table_args__ = (
+        Index('uix_ylnls_code_date', '股票代码', '报告日期', unique=True),
+    )
     code = Column(String,
                   ForeignKey('stocks.股票代码'),
                   index=True,
@@ -708,6 +726,9 @@ class CHNL(Base):
         2. 公告日期为发布报告日期
         3. 如存在修订，则只保存最后一期数据，即修正后版本
     """
+    __table_args__ = (
+        Index('uix_chnls_code_date', '股票代码', '报告日期', unique=True),
+    )
     code = Column(String,
                   ForeignKey('stocks.股票代码'),
                   index=True,
@@ -754,6 +775,9 @@ class CZNL(Base):
         2. 公告日期为发布报告日期
         3. 如存在修订，则只保存最后一期数据，即修正后版本
     """
+    __table_args__ = (
+        Index('uix_cznls_code_date', '股票代码', '报告日期', unique=True),
+    )
     code = Column(String,
                   ForeignKey('stocks.股票代码'),
                   index=True,
@@ -786,6 +810,9 @@ class YYNL(Base):
         2. 公告日期为发布报告日期
         3. 如存在修订，则只保存最后一期数据，即修正后版本
     """
+    __table_args__ = (
+        Index('uix_yynls_code_date', '股票代码', '报告日期', unique=True),
+    )
     code = Column(String,
                   ForeignKey('stocks.股票代码'),
                   index=True,
@@ -856,6 +883,9 @@ class IndexInfo(Base):
 
 class IndexDaily(Base):
     """指数日线交易数据"""
+    __table_args__ = (
+        Index('uix_index_dailies_code_date', '股票代码', '日期', unique=True),
+    )
     code = Column(String,
                   ForeignKey('index_infos.指数代码'),
                   index=True,
@@ -906,6 +936,9 @@ class Treasury(Base):
 
 class Margin(Base):
     """融资融券"""
+    __table_args__ = (
+        Index('uix_margins_code_date', '股票代码', '日期', unique=True),
+    )
     code = Column(String(6),
                   ForeignKey('stocks.股票代码'),
                   index=True,
@@ -933,6 +966,10 @@ Stock.margins = relationship("Margin",
 
 class Adjustment(Base):
     """分红派息"""
+    __table_args__ = (
+        # 同一实施日期可能实施多个年度的分红
+        Index('uix_adjustments_code_date_annual', '股票代码', '日期', '分红年度', unique=True),
+    )
     code = Column(String(6),
                   ForeignKey('stocks.股票代码'),
                   index=True,
@@ -957,7 +994,10 @@ Stock.adjustments = relationship("Adjustment",
 
 
 class DealDetail(Base):
-    """成交明细"""
+    """成交明细（早期版本数据，刷新时迁移至`cswd.sql.ticks`列式存储）"""
+    __table_args__ = (
+        Index('ix_deal_details_code_date', '股票代码', '日期'),
+    )
     code = Column(String(6),
                   ForeignKey('stocks.股票代码'),
                   index=True,
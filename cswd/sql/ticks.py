@@ -0,0 +1,268 @@
+"""
+成交明细列式存储
+
+每个交易日一个压缩文件（numpy `.npz`），全部股票按代码排序后连续存放：
+
+    codes       int32    股票代码（整数）
+    offsets     int64    各代码在数据列中的开始位置，长度为代码数量 + 1
+    time        int32    时间，自零点起的秒数
+    price       float32  价格
+    change      float32  涨跌额
+    volume      int64    成交量
+    amount      float64  成交额
+    direction   int8     方向，`DIRECTIONS`中的序号，未知为-1
+
+相较于数据库中每笔成交一行，占用显著减少；按日期删除过期数据仅需删除文件。
+
+Example
+-------
+>>> store = TickStore()
+>>> store.write('2018-04-04', {'000001': df})
+>>> store.read('000001', '2018-04-01', '2018-04-04')
+"""
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from ..common.constants import TICK_DIR_NAME
+from ..common.utils import data_root, sanitize_dates
+from ..dataproxy.locks import store_lock
+
+FILE_SUFFIX = '.npz'
+DATE_FMT = '%Y%m%d'
+TMP_PREFIX = '.tmp-'
+
+DIRECTIONS = ('买盘', '卖盘', '中性盘')
+
+# 数据列 -> (网页数据列名称, 类型)
+COLUMNS = {
+    'time': ('时间', np.int32),
+    'price': ('价格', np.float32),
+    'change': ('涨跌额', np.float32),
+    'volume': ('成交量', np.int64),
+    'amount': ('成交额', np.float64),
+    'direction': ('方向', np.int8),
+}
+
+
+def _encode_time(times):
+    """'HH:MM:SS'转换为自零点起的秒数"""
+    parts = pd.Series(times).astype(str).str.split(':', expand=True).astype(int)
+    return (parts[0] * 3600 + parts[1] * 60 + parts[2]).values.astype(np.int32)
+
+
+def _decode_time(seconds):
+    h, rest = np.divmod(seconds, 3600)
+    m, s = np.divmod(rest, 60)
+    return ['{:02d}:{:02d}:{:02d}'.format(*x) for x in zip(h, m, s)]
+
+
+def encode(df):
+    """
+    将单个股票单日成交明细转换为列数组
+
+    Parameters
+    ----------
+    df : DataFrame
+        与`wy.fetch_cjmx`一致，包含时间、价格、涨跌额、成交量、成交额、方向列
+
+    Returns
+    -------
+    res : dict
+        数据列名称 -> 数组（按时间升序排列）
+    """
+    direction = pd.Categorical(df['方向'], categories=DIRECTIONS).codes
+    res = {
+        'time': _encode_time(df['时间']),
+        'price': df['价格'].values.astype(np.float32),
+        'change': pd.to_numeric(df['涨跌额'], errors='coerce').values.astype(np.float32),
+        'volume': pd.to_numeric(df['成交量'], errors='coerce').fillna(0).values.astype(np.int64),
+        'amount': df['成交额'].values.astype(np.float64),
+        'direction': direction.astype(np.int8),
+    }
+    order = np.argsort(res['time'], kind='mergesort')
+    return {k: v[order] for k, v in res.items()}
+
+
+def decode(code, date_, arrays):
+    """列数组转换为与`DealDetail`列名称一致的DataFrame"""
+    direction = np.asarray(DIRECTIONS + (None,), dtype=object)[arrays['direction']]
+    data = {'股票代码': code, '日期': date_,
+            '时间': _decode_time(arrays['time'])}
+    for name, (col, _) in COLUMNS.items():
+        if name not in ('time', 'direction'):
+            data[col] = arrays[name]
+    data['方向'] = direction
+    columns = ['股票代码', '日期'] + [x[0] for x in COLUMNS.values()]
+    return pd.DataFrame(data, columns=columns)
+
+
+class TickStore(object):
+    """
+    成交明细存储
+
+    Parameters
+    ----------
+    root : str
+        存储目录，默认为数据根目录下的`ticks`
+
+    Notes
+    -----
+        写入同一交易日时，与已有文件合并后整体替换，同一代码以新数据为准。
+        合并期间按交易日加锁（跨进程），多个程序同时写入同一交易日不会丢失数据
+    """
+
+    def __init__(self, root=None):
+        if root is None:
+            root = data_root(TICK_DIR_NAME)
+        elif not os.path.exists(root):
+            os.makedirs(root)
+        self.root = root
+
+    def path(self, date_):
+        """交易日所对应的文件路径"""
+        return os.path.join(self.root, pd.Timestamp(date_).strftime(DATE_FMT) + FILE_SUFFIX)
+
+    def dates(self):
+        """已存储的交易日列表（升序）"""
+        res = []
+        for name in os.listdir(self.root):
+            if name.endswith(FILE_SUFFIX) and not name.startswith('.'):
+                res.append(pd.Timestamp(name[:-len(FILE_SUFFIX)]).date())
+        return sorted(res)
+
+    def _load(self, date_):
+        """读取交易日全部数据，不存在时返回None"""
+        try:
+            with np.load(self.path(date_)) as f:
+                return {k: f[k] for k in f.files}
+        except FileNotFoundError:
+            return None
+
+    def codes(self, date_):
+        """交易日已存储的股票代码集合"""
+        try:
+            with np.load(self.path(date_)) as f:
+                # npz按成员解压，仅读取代码列
+                codes = f['codes']
+        except FileNotFoundError:
+            return set()
+        return {str(x).zfill(6) for x in codes}
+
+    def write(self, date_, frames):
+        """
+        写入单个交易日数据
+
+        Parameters
+        ----------
+        date_ : date
+            交易日
+        frames : dict
+            股票代码 -> DataFrame（`wy.fetch_cjmx`结果）或`encode`结果
+
+        Returns
+        -------
+        res : int
+            写入行数
+        """
+        encoded = {}
+        rows = 0
+        for code, data in frames.items():
+            if isinstance(data, pd.DataFrame):
+                data = encode(data)
+            encoded[int(code)] = data
+            rows += len(data['time'])
+        with self._lock(date_):
+            parts = {}
+            existing = self._load(date_)
+            if existing is not None:
+                offsets = existing['offsets']
+                for i, code in enumerate(existing['codes']):
+                    parts[int(code)] = {name: existing[name][offsets[i]:offsets[i + 1]]
+                                        for name in COLUMNS}
+            parts.update(encoded)
+            self._dump(date_, parts)
+        return rows
+
+    def _lock(self, date_):
+        """交易日文件的读取-合并-写入锁"""
+        return store_lock(self.root, os.path.basename(self.path(date_)))
+
+    def _dump(self, date_, parts):
+        codes = np.array(sorted(parts), dtype=np.int32)
+        sizes = [len(parts[code]['time']) for code in codes]
+        arrays = {'codes': codes,
+                  'offsets': np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)}
+        for name, (_, dtype) in COLUMNS.items():
+            values = [parts[code][name] for code in codes]
+            arrays[name] = np.concatenate(values).astype(dtype) if values \
+                else np.empty(0, dtype=dtype)
+        # 写入临时文件后替换，读取方不会读到写入中途的文件
+        fd, tmp_path = tempfile.mkstemp(prefix=TMP_PREFIX, dir=self.root)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(tmp_path, self.path(date_))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def read(self, code=None, start=None, end=None):
+        """
+        读取成交明细
+
+        Parameters
+        ----------
+        code : str
+            股票代码，默认为全部股票
+        start, end : date
+            期间（含），默认为全部已存储期间
+
+        Returns
+        -------
+        res : DataFrame
+            列名称与`DealDetail`一致，按日期、代码、时间排序
+        """
+        dates = self.dates()
+        if start is not None or end is not None:
+            start, end = sanitize_dates(start, end)
+            dates = [d for d in dates if start <= d <= end]
+        frames = []
+        for d in dates:
+            arrays = self._load(d)
+            if arrays is None:
+                continue
+            codes, offsets = arrays['codes'], arrays['offsets']
+            if code is None:
+                indices = range(len(codes))
+            else:
+                i = np.searchsorted(codes, int(code))
+                indices = [i] if i < len(codes) and codes[i] == int(code) else []
+            for i in indices:
+                part = {name: arrays[name][offsets[i]:offsets[i + 1]] for name in COLUMNS}
+                frames.append(decode(str(codes[i]).zfill(6), d, part))
+        if not frames:
+            return decode(code, None, {name: np.empty(0, dtype=dtype)
+                                       for name, (_, dtype) in COLUMNS.items()})
+        return pd.concat(frames, ignore_index=True)
+
+    def drop_before(self, date_):
+        """
+        删除指定日期（含）之前的全部交易日数据
+
+        Returns
+        -------
+        res : list
+            已删除的交易日列表
+        """
+        date_ = pd.Timestamp(date_).date()
+        dropped = [d for d in self.dates() if d <= date_]
+        for d in dropped:
+            with self._lock(d):
+                try:
+                    os.remove(self.path(d))
+                except FileNotFoundError:
+                    pass
+        return dropped
@@ -1,23 +1,19 @@
 from datetime import timedelta
 import logbook
-from sqlalchemy import func
 import pandas as pd
 
 from cswd.dataproxy.data_proxies import adjustment_reader
-from cswd.sql.base import get_session, Action
-from cswd.sql.models import Issue, Adjustment
+from cswd.sql.base import get_session, Action, upsert
+from cswd.sql.models import Adjustment
 from cswd.common.utils import ensure_list
 
-from .utils import get_all_codes, log_to_db
+from .scheduler import DEFAULT_WORKERS, run_parallel
+from .utils import get_all_codes, get_ipo_dates, last_dates, log_to_db
 
 logger = logbook.Logger('分红派息')
 
 
-def last_update_date(code):
-    """类给定代码最后更新日期"""
-    sess = get_session()
-    dt = sess.query(func.max(Adjustment.last_updated)).filter(
-        Adjustment.code == code).scalar()
+def _to_update_date(dt):
     if dt:
         return dt.date()
     else:
@@ -25,71 +21,96 @@ def last_update_date(code):
         return pd.Timestamp('1900').date()
 
 
+def last_update_date(code):
+    """类给定代码最后更新日期"""
+    dts = last_dates(Adjustment, Adjustment.last_updated, code=code)
+    return _to_update_date(dts.get(code))
+
+
 def _gen(code, data):
+    """转换为数据表记录（字典列表，键为数据表列名称）"""
     objs = []
     for d, row in data.iterrows():
-        ad = Adjustment(code=code,
-                        date=d.date(),
-                        A001_分红年度=row['annual'],
-                        A002_派息=row['amount'],
-                        A003_送股=row['ratio'],
-                        A004_股权登记日=row['record_date'],
-                        A005_除权基准日=row['listing_date'],
-                        A006_红股上市日=row['pay_date'])
-        objs.append(ad)
+        objs.append({'股票代码': code,
+                     '日期': d.date(),
+                     '分红年度': row['annual'],
+                     '派息': row['amount'],
+                     '送股': row['ratio'],
+                     '股权登记日': row['record_date'],
+                     '除权基准日': row['listing_date'],
+                     '红股上市日': row['pay_date']})
     return objs
 
 
-def flush(codes):
+def _plan(codes):
+    """计算各代码需要添加数据的开始日期，返回（代码，开始日期）列表"""
     today = pd.Timestamp('today').date()
+    updated = last_dates(Adjustment, Adjustment.last_updated)
+    watermarks = last_dates(Adjustment)
+    ipos = get_ipo_dates()
+    plans = []
     for code in codes:
-        sess = get_session()
-        lud = last_update_date(code)
+        lud = _to_update_date(updated.get(code))
         if lud == today:
             logger.info('代码：{} 无需更新'.format(code))
             continue
-        last_date = sess.query(func.max(Adjustment.date)).filter(
-            Adjustment.code == code).scalar()
+        last_date = watermarks.get(code)
         if last_date:
             start = last_date + timedelta(days=1)
         else:
-            ipo = sess.query(Issue.A004_上市日期).filter(
-                Issue.code == code).filter(Issue.A004_上市日期.isnot(None)).scalar()
+            ipo = ipos.get(code)
             # 如尚未上市，则继续下一个代码
             if not ipo:
                 logger.info('代码：{} 无数据'.format(code))
                 continue
             else:
                 start = ipo
-        # 读取全部分红派息表网络数据
-        df = adjustment_reader.read(code)
+        plans.append((code, start))
+    return plans
+
+
+def _fetch(plan):
+    """读取全部分红派息表网络数据"""
+    code, _ = plan
+    return adjustment_reader.read(code)
+
+
+def flush(codes, max_workers=DEFAULT_WORKERS):
+    plans = _plan(codes)
+    sess = get_session()
+
+    def write(plan, df):
+        code, start = plan
         # 如存在分红派息数据
         if df is not None:
             try:
                 # 如分红、派息均无效，则去除
                 df = df.dropna(0, 'all', subset=['amount', 'ratio'])
             except KeyError:
-                continue
+                return
             data = df[df.index.date >= start]
             # 如没有有效数据，则继续下一个代码
             if data.empty:
-                continue
-            data.sort_index(inplace=True)
-            to_adds = _gen(code, data)
-            sess.add_all(to_adds)
+                return
+            data = data.sort_index()
+            rows = upsert(sess, Adjustment, _gen(code, data))
             sess.commit()
-            logger.info('代码：{}, 添加{}行'.format(code, len(to_adds)))
+            logger.info('代码：{}, 添加{}行'.format(code, rows))
             log_to_db(Adjustment.__tablename__, True,
-                      len(to_adds), Action.INSERT, code,
+                      rows, Action.INSERT, code,
                       start=data.index[0].date(),
                       end=data.index[-1].date())
         else:
             logger.info('代码：{}, 无数据'.format(code))
             log_to_db(Adjustment.__tablename__, True, 0, Action.INSERT, code)
+
+    try:
+        run_parallel(plans, _fetch, write, max_workers)
+    finally:
         sess.close()
 
 
-def flush_adjustment(codes=None):
+def flush_adjustment(codes=None, max_workers=DEFAULT_WORKERS):
     """
     刷新股票分红派息数据
     
@@ -101,4 +122,4 @@ def flush_adjustment(codes=None):
         codes = get_all_codes(False)
     else:
         codes = ensure_list(codes)
-    flush(codes)
\ No newline at end of file
+    flush(codes, max_workers)
\ No newline at end of file
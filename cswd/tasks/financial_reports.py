@@ -8,14 +8,13 @@
 
 import logbook
 import numpy as np
-from sqlalchemy import func
 from datetime import timedelta
 from pandas.tseries.offsets import QuarterEnd
 import pandas as pd
 
-from cswd.sql.base import get_session, ShareholderType, Status
+from cswd.sql.base import get_session, ShareholderType, Status, upsert
 from cswd.dataproxy.data_proxies import report_reader, indicator_reader
-from cswd.sql.models import (Issue, Stock, BalanceSheet, ProfitStatement,
+from cswd.sql.models import (Stock, BalanceSheet, ProfitStatement,
                              CashflowStatement, ZYZB, YLNL, CHNL, CZNL, YYNL,
                              Action)
 from cswd.sql.constants import (
@@ -25,7 +24,8 @@ from cswd.sql.constants import (
 from cswd.websource.exceptions import NoWebData
 from cswd.common.utils import ensure_list
 
-from .utils import get_all_codes, log_to_db
+from .scheduler import DEFAULT_WORKERS, run_parallel
+from .utils import get_all_codes, get_ipo_dates, last_dates, log_to_db
 
 REPORT_ITEMS = ('zcfzb', 'lrb', 'xjllb')
 INDICATOR_ITEMS = ('zhzb', 'ylnl', 'chnl', 'cznl', 'yynl')
@@ -60,12 +60,19 @@ def _to_float(x):
         return float(x)
 
 
-def _get_start_dates(sess, code, class_):
-    """获取数据库指定代码所对应的表开始日期"""
-    last_date = sess.query(func.max(
-        class_.date)).filter(class_.code == code).scalar()
+def _get_start_dates(last_date, ipo):
+    """
+    根据数据库中最后报告日期及上市日期，确定开始日期
+
+    Parameters
+    ----------
+    last_date : date
+        数据库中该代码的最后报告日期，不存在时为None
+    ipo : date
+        上市日期，不存在时为None
+    """
     if last_date is None:
-        start = sess.query(Issue.A004_上市日期).filter(Issue.code == code).scalar()
+        start = ipo
     else:
         # 开始日期递延到下一天
         start = last_date + timedelta(days=1)
@@ -85,14 +92,17 @@ def _get_start_dates(sess, code, class_):
 
 
 def insert_data(sess, df, code, date_, class_, maps_, type_name):
-    """插入df中指定日期列的数据（在数据库表中增加一行）"""
-    obj = class_(code=code, date=date_)
+    """
+    插入df中指定日期列的数据（在数据库表中增加一行）
+
+    如该报告期已经存在，则以最新数据（修正后版本）更新
+    """
+    record = {'股票代码': code, '报告日期': date_}
     for k, v in maps_.items():
         i = int(k[1:]) - 1  # 编码自然序号，序号从1开始
         col = date_.strftime(r'%Y-%m-%d')
-        value = _to_float(df.loc[i, col])
-        setattr(obj, '_'.join((k, v)), value)
-    sess.add(obj)
+        record[v] = _to_float(df.loc[i, col])
+    upsert(sess, class_, [record], update=True)
     sess.commit()
     logger.info('{} 插入数据 代码：{}，日期：{}'.format(type_name, code, date_))
 
@@ -103,19 +113,31 @@ class ReportRefresher(object):
         self.item = item
 
     @property
-    def read_fun(self):
-        """当前项目所对应的网页数据读取代理函数"""
+    def reader(self):
+        """当前项目所对应的网页数据代理"""
         if self.item in REPORT_ITEMS:
-            return report_reader.read
+            return report_reader
         else:
-            return indicator_reader.read
+            return indicator_reader
 
-    def _insert(self, sess, df, code):
-        """插入数据"""
+    @property
+    def read_fun(self):
+        """当前项目所对应的网页数据读取代理函数"""
+        return self.reader.read
+
+    def _starts(self, codes, **filters):
+        """各代码开始日期（每表一次查询）"""
+        class_ = ITEM_INFO_MAPS[self.item][1]
+        watermarks = last_dates(class_, **filters)
+        ipos = get_ipo_dates()
+        return {code: _get_start_dates(watermarks.get(code), ipos.get(code))
+                for code in codes}
+
+    def _insert(self, sess, df, code, start):
+        """插入不早于开始日期的数据"""
         class_ = ITEM_INFO_MAPS[self.item][1]
         maps_ = ITEM_INFO_MAPS[self.item][2]
         type_name = ITEM_INFO_MAPS[self.item][0]
-        start = _get_start_dates(sess, code, class_)
         if start is None:
             logger.info('{} 代码:{} 无最新数据'.format(type_name, code))
             return
@@ -137,28 +159,57 @@ class ReportRefresher(object):
                     logger.info('{} 代码:{} 日期:{} 已经存在'.format(
                         type_name, code, r_date))
 
-    def flush(self, sess, code):
-        """刷新单个股票"""
-        df = self.read_fun(code, 'report', self.item)
+    def _is_valid(self, df, code):
+        """检查科目长度"""
         valid_rows = len(ITEM_INFO_MAPS[self.item][2])
         item_name = ITEM_INFO_MAPS[self.item][0]
         msg_fmt = '{}科目长度应为{}，实际为{}（跳过：股票{}）'
         msg = msg_fmt.format(item_name, valid_rows, len(df), code)
         if df.shape[0] != valid_rows:
             logger.warn(msg)
-            return
-        self._insert(sess, df, code)
+            return False
+        return True
 
-    def batch_flush(self, codes):
-        """刷新批量股票"""
+    def _fetch(self, code):
+        """下载单个股票网页数据（不访问数据库）"""
+        return self.read_fun(code, 'report', self.item)
+
+    def flush(self, sess, code):
+        """刷新单个股票"""
+        df = self._fetch(code)
+        if self._is_valid(df, code):
+            start = self._starts([code], code=code)[code]
+            self._insert(sess, df, code, start)
+
+    def batch_flush(self, codes, max_workers=DEFAULT_WORKERS):
+        """刷新批量股票（并行下载，串行写入）"""
         codes = ensure_list(codes)
-        for code in codes:
-            sess = get_session()
-            self.flush(sess, code)
+        starts = self._starts(codes)
+        sess = get_session()
+
+        def write(code, df):
+            if self._is_valid(df, code):
+                self._insert(sess, df, code, starts[code])
+
+        try:
+            run_parallel(codes, self._fetch, write, max_workers)
+        finally:
             sess.close()
 
 
-def flush_reports(codes=None):
+def invalidate_reports(codes):
+    """
+    删除指定股票财务报告的网页缓存
+
+    说明：
+        财务报告缓存按周更新，发布定期报告公告后，应先删除缓存再刷新
+    """
+    for code in ensure_list(codes):
+        for item in VALID_ITEMS:
+            ReportRefresher(item).reader.invalidate(code, 'report', item)
+
+
+def flush_reports(codes=None, max_workers=DEFAULT_WORKERS):
     """
     刷新财务报告
     
@@ -172,4 +223,4 @@ def flush_reports(codes=None):
         codes = ensure_list(codes)
     for item in VALID_ITEMS:
         fresher = ReportRefresher(item)
-        fresher.batch_flush(codes)
+        fresher.batch_flush(codes, max_workers)
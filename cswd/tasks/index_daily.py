@@ -9,17 +9,15 @@ from sqlalchemy import func
 from cswd.dataproxy.data_proxies import history_data_reader
 from cswd.websource.wy import get_main_index
 from cswd.sql.models import IndexDaily, TradingCalendar, IndexInfo
-from cswd.sql.base import get_session, Action
+from cswd.sql.base import get_session, Action, upsert
 
-from .utils import log_to_db
+from .utils import last_dates, log_to_db
 
 logger = logbook.Logger('指数日线')
 
 
-def _get_start_date(sess, code):
-    """获取数据库中指定代码最后一日"""
-    last_date = sess.query(func.max(IndexDaily.date)).filter(
-        IndexDaily.code == code).scalar()
+def _get_start_date(last_date):
+    """数据库中最后一日的下一日，无数据时返回None"""
     if last_date is None:
         start = None
     else:
@@ -28,25 +26,25 @@ def _get_start_date(sess, code):
 
 
 def _gen(df):
+    """转换为数据表记录（字典列表，键为数据表列名称）"""
     res = []
     for d, row in df.iterrows():
-        obj = IndexDaily(code=row['股票代码'][1:],
-                         date=d.date(),
-                         open=row['开盘价'],
-                         high=row['最高价'],
-                         low=row['最低价'],
-                         close=row['收盘价'],
-                         volume=row['成交量'],
-                         amount=row['成交金额'],
-                         change_pct=row['涨跌幅'])
-        res.append(obj)
+        res.append({'股票代码': row['股票代码'][1:],
+                    '日期': d.date(),
+                    '开盘价': row['开盘价'],
+                    '最高价': row['最高价'],
+                    '最低价': row['最低价'],
+                    '收盘价': row['收盘价'],
+                    '成交量': row['成交量'],
+                    '成交额': row['成交金额'],
+                    '涨跌幅': row['涨跌幅']})
     return res
 
 
 def flush(codes, end):
+    watermarks = last_dates(IndexDaily)
     for code in codes:
-        sess = get_session()
-        start = _get_start_date(sess, code)
+        start = _get_start_date(watermarks.get(code))
         if start is not None and start > end:
             logger.info('代码：{} 无需刷新'.format(code))
             continue
@@ -60,14 +58,15 @@ def flush(codes, end):
             logger.info('无法获取网页数据。代码：{}，开始日期：{}, 结束日期：{}'.format(
                 code, start, end))
             continue
-        objs = _gen(df)
-        sess.add_all(objs)
+        # 已存在的（代码，日期）忽略
+        sess = get_session()
+        rows = upsert(sess, IndexDaily, _gen(df))
         sess.commit()
         logger.info('代码：{}, 新增{}行'.format(
-            code, len(objs)))
+            code, rows))
         sess.close()
-        if len(objs):
-            log_to_db(IndexDaily.__tablename__, True, len(objs), Action.INSERT,
+        if rows:
+            log_to_db(IndexDaily.__tablename__, True, rows, Action.INSERT,
                       code, start=df.index[0].date(), end=df.index[-1].date())
         else:
             log_to_db(IndexDaily.__tablename__, False, 0, Action.INSERT, code)
@@ -39,12 +39,13 @@ def _to_sql(class_, total_num):
     msg_fmt = '表{}已添加{}行数据(第{}个/共{}文件)'
     for i in range(total_num):
         df = _download(table_name, i)
-        df.to_sql(
-            table_name,
-            con=engine.connect(),
-            if_exists='append',
-            index=False,
-        )
+        with engine.connect() as conn:
+            df.to_sql(
+                table_name,
+                con=conn,
+                if_exists='append',
+                index=False,
+            )
         logger.info(msg_fmt.format(table_name, df.shape[0], i + 1, total_num))
 
 
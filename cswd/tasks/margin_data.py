@@ -8,7 +8,7 @@ import logbook
 from sqlalchemy import func
 from datetime import datetime, timedelta
 
-from cswd.sql.base import get_session, Action
+from cswd.sql.base import get_session, Action, upsert
 from cswd.sql.models import Margin, TradingCalendar
 from cswd.sql.constants import MARGIN_MAPS
 from cswd.websource.wy import fetch_margin_data, MARGIN_START
@@ -19,11 +19,12 @@ logger = logbook.Logger('融资融券')
 
 
 def _gen(df):
+    """转换为数据表记录（字典列表，键为数据表列名称）"""
     ms = []
     for _, row in df.iterrows():
-        m = Margin(code=row['股票代码'], date=row['日期'])
-        for k, v in MARGIN_MAPS.items():
-            setattr(m, '_'.join((k, v)), row[v])
+        m = {'股票代码': row['股票代码'], '日期': row['日期']}
+        for v in MARGIN_MAPS.values():
+            m[v] = row[v]
         ms.append(m)
     return ms
 
@@ -37,13 +38,12 @@ def flush(dates):
         # 确保不重复添加
         if not has_data:
             df = fetch_margin_data(d)
-            to_adds = _gen(df)
-            sess.add_all(to_adds)
+            rows = upsert(sess, Margin, _gen(df))
             sess.commit()
             logger.info('日期：{}, 新增{}行'.format(
-                d, len(to_adds)))
-            log_to_db(Margin.__tablename__, True, len(
-                to_adds), Action.INSERT, start=d, end=d)
+                d, rows))
+            log_to_db(Margin.__tablename__, True, rows,
+                      Action.INSERT, start=d, end=d)
         else:
             logger.info('日期：{}, 数据已经存在'.format(d))
         sess.close()
@@ -0,0 +1,335 @@
+"""
+本机实时报价广播
+
+多个研究、策略进程各自调用`fetch_quotes`时，新浪访问次数成倍增加，容易触发访问频次限制。
+`QuoteBroadcaster`运行唯一的报价轮询，每次刷新后将全部报价发送给本机订阅方；
+订阅方以`QuoteClient.latest()`读取最新报价，不访问网络。
+
+    广播方    broadcast-stock-quote（即`QuoteBroadcaster().run()`）
+    订阅方    QuoteClient().latest()
+
+说明：
+    以`multiprocessing.connection`通讯，posix系统为Unix套接字，Windows为命名管道。
+    每个订阅方有独立的发送线程及队列，未及时读取的订阅方只会错过中间的报价，
+    不影响轮询及其他订阅方；发送停滞超过`SEND_TIMEOUT`秒的订阅方被断开。
+    `QuoteBroadcaster`默认不写入数据库。以`write=True`运行时（broadcast-stock-quote），
+    广播方即为唯一写入方，不要同时运行poll-stock-quote，否则报价重复写入
+"""
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from multiprocessing.connection import Client, Listener
+
+import logbook
+
+from cswd.common.utils import data_root
+
+from .stock_quote import QuotePoller
+
+logger = logbook.Logger('报价广播')
+
+AUTHKEY = b'cswd-quotes'      # 仅用于本机进程间认证
+SOCKET_NAME = 'quotes.sock'
+PIPE_NAME = r'\\.\pipe\cswd-quotes'
+RECV_TIMEOUT = 0.5            # 订阅方检查是否关闭的间隔（秒）
+SEND_QUEUE_SIZE = 1           # 每个订阅方待发送的快照数量。队列已满时以最新快照替换
+SEND_TIMEOUT = 30             # 单次发送超过此秒数，视为订阅方停止读取
+
+# 报价快照。序号自1开始，每次刷新加1
+QuoteSnapshot = namedtuple('QuoteSnapshot', 'seq time data')
+
+
+def default_address():
+    """默认通讯地址"""
+    if sys.platform == 'win32':
+        return PIPE_NAME
+    return os.path.join(data_root('run'), SOCKET_NAME)
+
+
+class _Subscriber(object):
+    """
+    订阅方连接
+
+    后台线程依次发送队列中的快照，发送阻塞时不影响广播方
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self._queue = queue.Queue(SEND_QUEUE_SIZE)
+        self._sending_since = None
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='quote-send')
+        self._thread.start()
+
+    @property
+    def closed(self):
+        return self._closed.is_set()
+
+    def stalled(self):
+        """当前发送是否已超时"""
+        since = self._sending_since
+        return since is not None and time.monotonic() - since > SEND_TIMEOUT
+
+    def put(self, snapshot):
+        """放入待发送快照，不等待。尚未发送的旧快照被丢弃"""
+        while not self.closed:
+            try:
+                self._queue.put_nowait(snapshot)
+                return
+            except queue.Full:
+                try:
+                    self._queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _run(self):
+        while not self.closed:
+            snapshot = self._queue.get()
+            if snapshot is None:
+                break
+            self._sending_since = time.monotonic()
+            try:
+                self.conn.send(snapshot)
+            except (OSError, EOFError):
+                break
+            finally:
+                self._sending_since = None
+        self.close()
+
+    def close(self):
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if sys.platform != 'win32':
+            # 关闭套接字，使阻塞于发送的线程退出
+            try:
+                sock = socket.fromfd(self.conn.fileno(), socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.shutdown(socket.SHUT_RDWR)
+                sock.close()
+            except OSError:
+                pass
+        try:
+            self._queue.put_nowait(None)
+        except queue.Full:
+            pass
+        if threading.current_thread() is not self._thread:
+            self._thread.join(RECV_TIMEOUT)
+        self.conn.close()
+
+
+class QuoteBroadcaster(QuotePoller):
+    """
+    报价广播
+
+    每次刷新后，将全部最新报价发送给全部订阅方。新的订阅方连接时，立即发送最近一次报价。
+
+    Parameters
+    ----------
+    address : str
+        通讯地址，默认为`default_address()`
+    authkey : bytes
+        认证密钥
+    kwargs : dict
+        `QuotePoller`参数。`write`默认为False
+
+    Example
+    -------
+    >>> QuoteBroadcaster(write=True).run()
+    """
+
+    def __init__(self, address=None, authkey=AUTHKEY, **kwargs):
+        kwargs.setdefault('write', False)
+        super(QuoteBroadcaster, self).__init__(**kwargs)
+        self.address = address or default_address()
+        self.authkey = authkey
+        self.snapshot = None
+        self._seq = 0
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._listener = None
+
+    def start(self):
+        """开始接受订阅"""
+        if self._listener is not None:
+            return
+        if sys.platform != 'win32' and os.path.exists(self.address):
+            # 上次未正常退出时残留的套接字文件
+            os.remove(self.address)
+        self._listener = Listener(self.address, authkey=self.authkey)
+        thread = threading.Thread(target=self._accept, daemon=True,
+                                  name='quote-broadcast')
+        thread.start()
+        logger.info('开始广播报价：{}'.format(self.address))
+
+    def _accept(self):
+        while True:
+            listener = self._listener
+            if listener is None:
+                return
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                # 监听已关闭，或认证失败等
+                if self._listener is not None:
+                    logger.warn('拒绝订阅：{}'.format(e))
+                continue
+            subscriber = _Subscriber(conn)
+            with self._lock:
+                closed = self._listener is None
+                if not closed:
+                    if self.snapshot is not None:
+                        subscriber.put(self.snapshot)
+                    self._subscribers.append(subscriber)
+                    logger.info('新增订阅，共{}个'.format(len(self._subscribers)))
+            if closed:
+                # 接受连接期间广播方已关闭
+                subscriber.close()
+                return
+
+    @property
+    def subscribers(self):
+        """订阅方数量"""
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, data):
+        """
+        交由各订阅方发送线程发送报价，不等待发送完成
+
+        断开已失效或发送停滞的订阅方
+        """
+        with self._lock:
+            self._seq += 1
+            self.snapshot = QuoteSnapshot(self._seq, datetime.now(), data)
+            active, dropped = [], []
+            for subscriber in self._subscribers:
+                if subscriber.closed or subscriber.stalled():
+                    dropped.append(subscriber)
+                else:
+                    subscriber.put(self.snapshot)
+                    active.append(subscriber)
+            self._subscribers = active
+        for subscriber in dropped:
+            if not subscriber.closed:
+                logger.warn('订阅方停止读取，断开连接')
+            subscriber.close()
+
+    def poll(self):
+        changed = super(QuoteBroadcaster, self).poll()
+        self.publish(self.latest)
+        return changed
+
+    def close(self):
+        """停止接受订阅，断开全部订阅方"""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            if sys.platform != 'win32':
+                # 唤醒阻塞于accept的线程，使其退出
+                try:
+                    with socket.socket(socket.AF_UNIX) as sock:
+                        sock.connect(self.address)
+                except OSError:
+                    pass
+            listener.close()
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, []
+        for subscriber in subscribers:
+            subscriber.close()
+        if sys.platform != 'win32' and os.path.exists(self.address):
+            os.remove(self.address)
+
+    def run(self, *args, **kwargs):
+        self.start()
+        try:
+            super(QuoteBroadcaster, self).run(*args, **kwargs)
+        finally:
+            self.close()
+
+
+class QuoteClient(object):
+    """
+    报价订阅
+
+    后台线程接收广播方发送的报价，`latest`返回最近一次报价，不访问网络。
+
+    Parameters
+    ----------
+    address : str
+        通讯地址，默认为`default_address()`
+    authkey : bytes
+        认证密钥
+
+    Example
+    -------
+    >>> client = QuoteClient()
+    >>> df = client.latest(timeout=10)
+    """
+
+    def __init__(self, address=None, authkey=AUTHKEY):
+        self.address = address or default_address()
+        self._conn = Client(self.address, authkey=authkey)
+        self._snapshot = None
+        self._received = threading.Condition()
+        self._closed = False
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._receive, daemon=True,
+                                        name='quote-client')
+        self._thread.start()
+
+    def _receive(self):
+        while not self._stopped.is_set():
+            try:
+                if not self._conn.poll(RECV_TIMEOUT):
+                    continue
+                snapshot = self._conn.recv()
+            except (OSError, EOFError):
+                break
+            with self._received:
+                self._snapshot = snapshot
+                self._received.notify_all()
+        with self._received:
+            self._closed = True
+            self._received.notify_all()
+
+    @property
+    def connected(self):
+        """与广播方的连接是否有效"""
+        return not self._closed
+
+    def snapshot(self, timeout=None):
+        """
+        最近一次报价快照
+
+        Parameters
+        ----------
+        timeout : float
+            尚未收到报价时，最多等待的秒数。默认不等待
+
+        Returns
+        -------
+        res : QuoteSnapshot
+            尚未收到报价时返回None
+        """
+        with self._received:
+            if self._snapshot is None and timeout:
+                self._received.wait_for(
+                    lambda: self._snapshot is not None or self._closed, timeout)
+            return self._snapshot
+
+    def latest(self, timeout=None):
+        """最近一次全部报价（DataFrame），尚未收到报价时返回None"""
+        snapshot = self.snapshot(timeout)
+        if snapshot is None:
+            return None
+        return snapshot.data.copy()
+
+    def close(self):
+        self._stopped.set()
+        self._thread.join()
+        self._conn.close()
@@ -0,0 +1,62 @@
+"""
+并行下载调度
+
+刷新任务的耗时主要在网络等待。使用有限线程池同时下载多个代码的网页数据，
+由调用线程作为唯一写入者，按下载完成顺序写入数据库，避免多线程写入SQLite。
+
+说明：
+    下载函数内部不得访问数据库会话；
+    写入函数在调用线程中执行，可安全使用同一会话。
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import logbook
+
+DEFAULT_WORKERS = 4    # 默认并发下载线程数
+
+logger = logbook.Logger('并行调度')
+
+
+def run_parallel(items, fetch_fun, write_fun, max_workers=DEFAULT_WORKERS):
+    """
+    并行下载，串行写入
+
+    Parameters
+    ----------
+    items : list
+        任务列表（如股票代码，或者（代码，开始日期）元组）
+    fetch_fun : function
+        下载函数，接收单个任务，返回下载结果。在工作线程中执行
+    write_fun : function
+        写入函数，接收（任务，下载结果）。在调用线程中执行
+    max_workers : int
+        并发下载线程数。小于等于1时，退化为顺序执行
+
+    Returns
+    -------
+    res : int
+        完成的任务数量
+
+    Notes
+    -----
+        任一下载或写入出现异常时，取消尚未开始的下载，并在调用线程中重新抛出
+    """
+    items = list(items)
+    if max_workers is None or max_workers <= 1:
+        for item in items:
+            write_fun(item, fetch_fun(item))
+        return len(items)
+    done = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch_fun, item): item for item in items}
+        try:
+            for future in as_completed(futures):
+                item = futures[future]
+                write_fun(item, future.result())
+                done += 1
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            logger.info('中断调度，已完成{}/{}项任务'.format(done, len(items)))
+            raise
+    return done
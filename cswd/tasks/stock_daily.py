@@ -3,7 +3,7 @@
 """
 import logbook
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import func, or_
 import pandas as pd
 from sqlalchemy.sql import exists
 
@@ -11,13 +11,35 @@ from cswd.common.utils import ensure_list
 from cswd.dataproxy.data_proxies import history_data_reader
 from cswd.websource.wy import fetch_last_history
 from cswd.sql.models import StockDaily, Stock, Status, TradingCalendar
-from cswd.sql.base import get_session, Action, session_scope
+from cswd.sql.base import get_session, Action, session_scope, upsert
 from cswd.sql.constants import STOCKDAILY_MAPS
 
-from .utils import get_all_codes, log_to_db
+from .scheduler import DEFAULT_WORKERS, run_parallel
+from .utils import get_all_codes, last_dates, log_to_db
 
 logger = logbook.Logger('股票日线')
 
+# 网页数据列名称与数据表列名称一致
+STOCKDAILY_COLS = list(STOCKDAILY_MAPS.values())
+
+# 全市场最新日线。数据表列名称 -> (网页字段, 倍数)，转换为与`fetch_history`一致的单位
+# 网页不提供成交笔数，以最新日线添加的行该列为None，作为临时数据，下次刷新时替换
+SNAPSHOT_MAPS = {
+    '名称': ('NAME', None),
+    '开盘价': ('OPEN', 1),
+    '最高价': ('HIGH', 1),
+    '最低价': ('LOW', 1),
+    '收盘价': ('PRICE', 1),
+    '成交量': ('VOLUME', 1),
+    '成交金额': ('TURNOVER', 1),
+    '换手率': ('HS', 100),
+    '前收盘': ('YESTCLOSE', 1),
+    '涨跌额': ('UPDOWN', 1),
+    '涨跌幅': ('PERCENT', 100),
+    '总市值': ('TCAP', 1),
+    '流通市值': ('MCAP', 1),
+}
+
 
 def _gen(code, df):
     sds = []
@@ -30,11 +52,36 @@ def _gen(code, df):
     return sds
 
 
-def flush(codes, end):
+def _to_records(code, df):
+    """将网页数据一次性转换为数据表记录（字典列表）"""
+    data = df.reindex(columns=STOCKDAILY_COLS)
+    data.insert(0, '日期', df.index.date)
+    data.insert(0, '股票代码', code)
+    # 转换为python原生类型，缺失值以None表示
+    data = data.astype(object).where(pd.notnull(data), None)
+    return data.to_dict('records')
+
+
+def _write(sess, code, df, bulk):
+    """写入数据库，返回行数"""
+    if bulk:
+        # 已存在的（代码，日期）忽略，重复写入不会产生重复行
+        rows = upsert(sess, StockDaily, _to_records(code, df))
+    else:
+        to_adds = _gen(code, df)
+        sess.add_all(to_adds)
+        rows = len(to_adds)
+    if rows:
+        sess.commit()
+    return rows
+
+
+def _plan(codes, end):
+    """计算各代码需要下载的开始日期，返回（代码，开始日期）列表"""
+    watermarks = last_dates(StockDaily)
+    plans = []
     for code in codes:
-        sess = get_session()
-        last_date = sess.query(func.max(StockDaily.date)).filter(
-            StockDaily.code == code).scalar()
+        last_date = watermarks.get(code)
         if last_date is None:
             start = None
         else:
@@ -42,39 +89,61 @@ def flush(codes, end):
             if start > end:
                 logger.info('代码：{} 数据无需刷新'.format(code))
                 continue
+        plans.append((code, start))
+    return plans
+
+
+def flush(codes, end, bulk=True, max_workers=DEFAULT_WORKERS):
+    plans = _plan(codes, end)
+    sess = get_session()
+
+    def fetch(plan):
+        code, start = plan
         try:
             df = history_data_reader.read(
                 code=code, start=start, end=end, is_index=False)
-            # 按日期排序（升序）
-            df.sort_index(inplace=True)
         except ValueError:
             # 当开始日期大于结束日期时，触发值异常
             logger.info('无法获取网页数据。代码：{}，开始日期：{}, 结束日期：{}'.format(
                 code, start, end))
-            continue
-        to_adds = _gen(code, df)
-        if len(to_adds):
-            sess.add_all(to_adds)
-            sess.commit()
+            return None
+        # 按日期排序（升序）
+        return df.sort_index()
+
+    def write(plan, df):
+        code, start = plan
+        if df is None:
+            return
+        rows = _write(sess, code, df, bulk)
+        if rows:
             logger.info('代码：{}, 开始日期：{}, 结束日期：{} 添加{}行'.format(
-                code, start, end, len(to_adds)))
-            log_to_db(StockDaily.__tablename__, True, len(
-                to_adds), Action.INSERT, code, start, end)
+                code, start, end, rows))
+            log_to_db(StockDaily.__tablename__, True,
+                      rows, Action.INSERT, code, start, end)
         else:
             logger.info('代码：{}，开始日期：{}, 结束日期：{} 无数据'.format(
                 code, start, end))
             log_to_db(StockDaily.__tablename__, True, 0,
                       Action.INSERT, code, start, end)
+
+    try:
+        run_parallel(plans, fetch, write, max_workers)
+    finally:
         sess.close()
 
 
-def flush_stockdaily(codes=None, init=False):
+def flush_stockdaily(codes=None, init=False, bulk=True, max_workers=DEFAULT_WORKERS,
+                     snapshot=True):
     """
     刷新股票日线数据
     
     说明：
         如初始化则包含所有曾经上市的股票代码，含已经退市
         否则仅包含当前在市的股票代码
+        bulk为真时，以executemany批量写入，否则逐行构建ORM对象
+        max_workers为并发下载线程数
+        snapshot为真时（非初始化），仅落后一个交易日的股票以全市场最新日线一次添加，
+        其余股票逐只下载历史数据
     """
     sess = get_session()
     end = sess.query(func.max(TradingCalendar.date)).filter(
@@ -88,7 +157,9 @@ def flush_stockdaily(codes=None, init=False):
         codes = ensure_list(codes)
     # 删除无效数据
     _delete()
-    flush(codes, end)
+    if snapshot and not init:
+        codes = _flush_snapshot(codes, end)
+    flush(codes, end, bulk, max_workers)
 
 
 def get_previous_trading_date(date_):
@@ -105,9 +176,11 @@ def get_previous_trading_date(date_):
         ).limit(1).scalar()
 
 
-def get_last_trading_date():
-    """最后交易日期"""
-    date_ = pd.Timestamp('today').date()
+def get_last_trading_date(date_=None):
+    """指定日期（默认为今日）或之前的最后交易日期"""
+    if date_ is None:
+        date_ = pd.Timestamp('today')
+    date_ = pd.Timestamp(date_).date()
     with session_scope() as sess:
         return sess.query(
             TradingCalendar.date
@@ -119,10 +192,11 @@ def get_last_trading_date():
         ).limit(1).scalar()
 
 
-def codes_to_append():
-    """要添加数据的股票代码"""
-    last_trading_date = get_last_trading_date()
-    previous_trading_date = get_previous_trading_date(last_trading_date)
+def codes_to_append(date_=None):
+    """要添加数据的股票代码（上一交易日存在数据，而指定交易日不存在数据）"""
+    if date_ is None:
+        date_ = get_last_trading_date()
+    previous_trading_date = get_previous_trading_date(date_)
     with session_scope() as sess:
         y_codes = sess.query(
             StockDaily.code
@@ -132,30 +206,87 @@ def codes_to_append():
         t_codes = sess.query(
             StockDaily.code
         ).filter(
-            StockDaily.date == last_trading_date
+            StockDaily.date == date_
         )
         query = y_codes.except_(t_codes)
         return [x[0] for x in query.all()]
 
 
-def _insert(row_data, date_):
+def snapshot_date(now=None):
+    """
+    全市场最新日线所对应的交易日期
+
+    说明：
+        盘中（9:00 - 16:59）数据尚未确定，返回None；
+        次日开盘前，对应上一交易日
+    """
+    if now is None:
+        now = pd.Timestamp('now')
+    if 9 <= now.hour <= 16:
+        return None
+    date_ = get_last_trading_date(now)
+    if now.hour < 9 and date_ == now.date():
+        date_ = get_previous_trading_date(date_)
+    return date_
+
+
+def _snapshot_frame(df):
+    """将全市场最新日线转换为数据表列，以股票代码为索引。剔除无成交（停牌）的股票"""
+    data = pd.DataFrame(index=df['SYMBOL'].values)
+    for col, (field, factor) in SNAPSHOT_MAPS.items():
+        if field not in df.columns:
+            data[col] = None
+        elif factor is None:
+            data[col] = df[field].values
+        else:
+            data[col] = pd.to_numeric(df[field], errors='coerce').values * factor
+    return data[data['成交量'] > 0]
+
+
+def _append_snapshot(codes, date_):
+    """
+    以全市场最新日线为股票添加指定交易日数据（一次请求）
+
+    说明：
+        已存在的（代码，日期）保持不变；
+        添加的行成交笔数为None，为临时数据。下次刷新时由`_delete`删除，
+        改以历史数据（或再次以最新日线）添加
+
+    Returns
+    -------
+    res : set
+        已添加的股票代码
+    """
+    snapshot = _snapshot_frame(fetch_last_history())
+    codes = [code for code in codes if code in snapshot.index]
+    if len(codes) == 0:
+        return set()
+    data = snapshot.loc[codes].reindex(columns=STOCKDAILY_COLS)
+    data.insert(0, '日期', date_)
+    data.insert(0, '股票代码', codes)
+    data = data.astype(object).where(pd.notnull(data), None)
     with session_scope() as sess:
-        sd = StockDaily(
-            code=row_data['SYMBOL'],
-            date=date_,
-            A001_名称=row_data['NAME'],
-            A002_开盘价=row_data['OPEN'],
-            A003_最高价=row_data['HIGH'],
-            A004_最低价=row_data['LOW'],
-            A005_收盘价=row_data['PRICE'],
-            A006_成交量=row_data['VOLUME'],
-            A008_换手率=row_data['TURNOVER'],
-            A009_前收盘=row_data['YESTCLOSE'],
-            A011_涨跌幅=row_data['PERCENT'],
-            A012_总市值=row_data['TCAP'],
-            A013_流通市值=row_data['MCAP'],
-        )
-        sess.add(sd)
+        rows = upsert(sess, StockDaily, data.to_dict('records'))
+    logger.info('全市场最新日线：日期：{}，添加{}行'.format(date_, rows))
+    log_to_db(StockDaily.__tablename__, True, rows, Action.INSERT,
+              None, date_, date_)
+    return set(codes)
+
+
+def _flush_snapshot(codes, end):
+    """
+    仅落后一个交易日的股票，以全市场最新日线添加；返回其余需要逐只下载的代码
+    """
+    date_ = snapshot_date()
+    if date_ != end:
+        logger.info('全市场最新日线不对应交易日{}，全部逐只下载'.format(end))
+        return codes
+    previous_trading_date = get_previous_trading_date(end)
+    watermarks = last_dates(StockDaily)
+    behind = [code for code in codes
+              if watermarks.get(code) == previous_trading_date]
+    appended = _append_snapshot(behind, end)
+    return [code for code in codes if code not in appended]
 
 
 def append_last_daily():
@@ -166,25 +297,20 @@ def append_last_daily():
         为防止中间插入数据，为股票插入最后一条日线，必须满足：
         1. 当股票上一个交易日存在数据；
         2. 最后一个交易日不存在数据；
-        3. 有效操作时间在18:00 - 9:00
+        3. 有效操作时间在17:00 - 9:00
     """
-    now = pd.Timestamp('now')
-    if now.hour > 16 or now.hour < 9:
-        df = fetch_last_history()
-        to_append = codes_to_append()
-        last_trading_date = get_last_trading_date()
-        for _, row in df.iterrows():
-            stock_code = row['SYMBOL']
-            if stock_code in to_append:
-                _insert(row, last_trading_date)
-                logger.info('添加：代码：{}，日期：{}'.format(stock_code, last_trading_date))
-    else:
+    date_ = snapshot_date()
+    if date_ is None:
         logger.info('最新日线数据不得在盘中执行')
+        return
+    _append_snapshot(codes_to_append(date_), date_)
+
 
 def _delete():
-    """删除临时数据"""
+    """删除临时数据（成交金额或成交笔数为None，含以最新日线添加的行）"""
     with session_scope() as sess:
         count = sess.query(StockDaily).filter(
-            StockDaily.A007_成交金额.is_(None)
-        ).delete()
+            or_(StockDaily.A007_成交金额.is_(None),
+                StockDaily.A014_成交笔数.is_(None))
+        ).delete(synchronize_session=False)
         logger.info('删除临时数据{}行'.format(count))
\ No newline at end of file
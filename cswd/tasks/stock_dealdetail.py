@@ -3,82 +3,154 @@
 
 只能从网易中提取到最近的数据，无法获取远期数据源。
 如确有需要，使用新浪数据。
+
+成交明细以每个交易日一个文件的列式存储保存（参见`cswd.sql.ticks`），不再写入数据库。
+早期版本写入数据库的成交明细，刷新时一次性迁移至列式存储（参见`migrate_legacy`）。
 """
 import logbook
+import pandas as pd
 from datetime import datetime, timedelta
 
 from cswd.common.utils import ensure_list
-from cswd.websource.wy import fetch_cjmx
-from cswd.sql.models import DealDetail, Stock, Status, TradingCalendar, StockDaily
-from cswd.sql.base import get_session, Action
+from cswd.dataproxy.data_proxies import cjmx_reader
+from cswd.websource.exceptions import NoWebData
+from cswd.sql.models import DealDetail, TradingCalendar, StockDaily
+from cswd.sql.base import get_session, session_scope, Action
 from cswd.sql.constants import DEALDETAIL_MAPS
+from cswd.sql.ticks import TickStore, encode
 
+from .scheduler import DEFAULT_WORKERS, run_parallel
 from .utils import get_all_codes, log_to_db
 
 logger = logbook.Logger('成交明细')
 
+# 同一交易日缓冲超过此行数时，先行写入（与已有文件合并）
+TICK_BUFFER_ROWS = 5000000
+
+
+def _plan(codes, dates, store):
+    """
+    计算需要下载的（代码，日期）列表
+
+    以一次查询取得期间内存在交易（成交量>0，而非停牌）的（代码，日期），
+    减去列式存储中已有的（代码，日期），即为需要下载的任务
+    """
+    if len(dates) == 0:
+        return []
+    codes, dates = set(codes), set(dates)
+    start, end = min(dates), max(dates)
+    with session_scope() as sess:
+        traded = sess.query(StockDaily.code, StockDaily.date).filter(
+            StockDaily.date >= start).filter(
+            StockDaily.date <= end).filter(
+            StockDaily.A006_成交量 > 0).all()
+    traded = {(code, d) for code, d in traded if code in codes and d in dates}
+    loaded = {(code, d) for d in dates for code in store.codes(d)}
+    plans = sorted(traded - loaded, key=lambda x: (x[1], x[0]))
+    logger.info('交易{}项，已经刷新{}项，需要下载{}项'.format(
+        len(traded), len(traded & loaded), len(plans)))
+    return plans
+
+
+def migrate_legacy(store=None):
+    """
+    将早期版本写入数据库的成交明细迁移至列式存储，并从数据库中删除
+
+    说明：
+        按交易日逐日迁移，列式存储中已有的（代码，日期）以列式存储为准；
+        先写入文件再删除数据库行，中断后重新执行不会丢失数据。
+        数据库中已无早期数据时，仅执行一次查询
+
+    Returns
+    -------
+    res : int
+        迁移行数
+    """
+    if store is None:
+        store = TickStore()
+    with session_scope() as sess:
+        dates = [d for (d,) in sess.query(DealDetail.date).distinct().order_by(DealDetail.date)]
+    columns = ['股票代码'] + list(DEALDETAIL_MAPS.values())
+    attrs = [DealDetail.code] + [getattr(DealDetail, '_'.join(x))
+                                 for x in DEALDETAIL_MAPS.items()]
+    res = 0
+    for d in dates:
+        with session_scope() as sess:
+            query = sess.query(*attrs).filter(DealDetail.date == d)
+            df = pd.DataFrame(query.all(), columns=columns)
+            loaded = store.codes(d)
+            frames = {code: group for code, group in df.groupby('股票代码')
+                      if code not in loaded}
+            if frames:
+                res += store.write(d, frames)
+            sess.query(DealDetail).filter(DealDetail.date == d).delete(
+                synchronize_session=False)
+        logger.info('日期：{}，迁移早期成交明细{}只股票'.format(d, len(frames)))
+    return res
+
+
+def _fetch(plan):
+    """下载单个股票单日成交明细（不访问数据库）"""
+    code, d = plan
+    try:
+        return cjmx_reader.read(code, d)
+    except NoWebData:
+        return None
+
+
+def flush(codes, dates, max_workers=DEFAULT_WORKERS, store=None):
+    # 日期可为查询结果元组
+    dates = [d[0] if isinstance(d, tuple) else d for d in dates]
+    if store is None:
+        store = TickStore()
+    # 早期版本数据迁移后，计划不会重复下载
+    migrate_legacy(store)
+    plans = _plan(codes, dates, store)
+    remaining = {}
+    for _, d in plans:
+        remaining[d] = remaining.get(d, 0) + 1
+    pending = {}    # 日期 -> {代码: 列数组}
+    buffered = {}   # 日期 -> 缓冲行数
+
+    def dump(d):
+        buffered.pop(d, None)
+        parts = pending.pop(d, {})
+        if parts:
+            rows = store.write(d, parts)
+            logger.info('日期：{}，写入{}只股票，共{}行'.format(d, len(parts), rows))
+
+    def write(plan, df):
+        code, d = plan
+        remaining[d] -= 1
+        if df is None:
+            logger.info('股票：{}，日期：{} 无网页数据'.format(code, d))
+        else:
+            arrays = encode(df)
+            pending.setdefault(d, {})[code] = arrays
+            rows = len(arrays['time'])
+            buffered[d] = buffered.get(d, 0) + rows
+            logger.info('股票：{}，日期：{}, 新增{}行'.format(code, d, rows))
+            log_to_db(DealDetail.__tablename__, True, rows,
+                      Action.INSERT, code, d, d)
+        if remaining[d] == 0 or buffered.get(d, 0) >= TICK_BUFFER_ROWS:
+            dump(d)
+
+    try:
+        run_parallel(plans, _fetch, write, max_workers)
+    finally:
+        # 中断时保存已下载部分
+        for d in list(pending):
+            dump(d)
+
 
-def _gen(df):
-    dds = []
-    for _, row in df.iterrows():
-        dd = DealDetail(code=row['股票代码'],
-                        date=row['日期'],
-                        A001_时间=row['时间'],
-                        A002_价格=row['价格'],
-                        A003_涨跌额=row['涨跌额'],
-                        A004_成交量=row['成交量'],
-                        A005_成交额=row['成交额'],
-                        A006_方向=row['方向'])
-        dds.append(dd)
-    return dds
-
-
-def flush(codes, dates):
-    for day in dates:
-        # 此时day为元组
-        d = day[0]
-        for code in codes:
-            sess = get_session()
-            # 必须限定成交量>0
-            traded = sess.query(StockDaily.code).filter(
-                StockDaily.code == code).filter(
-                StockDaily.date == d).filter(
-                StockDaily.A006_成交量 > 0).scalar()
-            # 股票当天存在交易，而非停牌
-            if traded:
-                try:
-                    has_data, = sess.query(DealDetail.code).filter(
-                        DealDetail.code == code).filter(DealDetail.date == d).first()
-                except TypeError:
-                    has_data = None
-                # 确保不重复添加
-                if not has_data:
-                    df = fetch_cjmx(code, d)
-                    to_adds = _gen(df)
-                    sess.add_all(to_adds)
-                    sess.commit()
-                    logger.info('股票：{}，日期：{}, 新增{}行'.format(
-                        code, d, len(to_adds)))
-                    log_to_db(DealDetail.__tablename__, True, len(
-                        to_adds), Action.INSERT, code, d, d)
-                else:
-                    logger.info('股票：{}，日期：{} 已经刷新'.format(code, d))
-                    log_to_db(DealDetail.__tablename__, True,
-                              0, Action.INSERT, code, d, d)
-            else:
-                logger.info('股票：{}，日期：{} 停牌'.format(code, d))
-                log_to_db(DealDetail.__tablename__, True,
-                          0, Action.INSERT, code, d, d)
-            sess.close()
-
-
-def flush_dealdetail(codes=None, init=False):
+def flush_dealdetail(codes=None, init=False, max_workers=DEFAULT_WORKERS):
     """
     刷新股票分时交易数据
     
     说明：
         如初始化则包含所有曾经上市的股票代码，含已经退市
         否则仅包含当前在市的股票代码
+        按（代码，日期）并行下载，串行写入
     """
     sess = get_session()
     if init:
@@ -93,4 +165,4 @@ def flush_dealdetail(codes=None, init=False):
     dates = sess.query(TradingCalendar.date).filter(
         TradingCalendar.date >= start).filter(TradingCalendar.is_trading == True).all()
     sess.close()
-    flush(codes, dates)
+    flush(codes, dates, max_workers)
@@ -0,0 +1,226 @@
+"""
+盘中连续刷新股票实时报价
+
+`QuotePoller`常驻运行，按批次并行下载全部股票报价（每批一次请求），与上次报价比较，
+仅写入时间或成交量发生变化的报价。
+
+说明：
+    刷新间隔不低于按`hq.sinajs.cn`限速完成一次刷新所需时间（参见`min_interval`）。
+    如需更短间隔，先以`websource.base.set_rate_limit`提高该主机限速
+"""
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import datetime
+from datetime import time as dt_time
+
+import logbook
+import pandas as pd
+
+from cswd.common.constants import QUOTE_COLS
+from cswd.common.utils import ensure_list, get_server_name
+from cswd.websource.base import DEFAULT_RATE_LIMIT, HOST_RATE_LIMITS
+from cswd.websource.date_utils import is_trading_day, is_working_day
+from cswd.websource.sina import QUOTE_BATCH_SIZE, QUOTE_URL_FMT, fetch_quote_batch
+from cswd.sql.base import session_scope, bulk_insert
+from cswd.sql.models import Quotation
+
+from .scheduler import DEFAULT_WORKERS, run_parallel
+from .utils import get_all_codes
+
+logger = logbook.Logger('股票实时报价')
+
+POLL_INTERVAL = 3           # 两次刷新开始时间的间隔（秒）
+LATENCY_WINDOW = 100        # 统计最近多少次刷新用时
+
+# 交易时段（含集合竞价），前后各留一分钟
+TRADING_SESSIONS = ((dt_time(9, 14), dt_time(11, 31)),
+                    (dt_time(12, 59), dt_time(15, 1)))
+
+OPEN_CHECK_DEADLINE = dt_time(9, 31)   # 至该时间报价日期仍非当日，视为非交易日
+OPEN_CHECK_INTERVAL = 30               # 开盘后判断交易日的重试间隔（秒）
+
+# 刷新用时统计（秒）
+PollStats = namedtuple('PollStats', 'count last mean max')
+
+
+def in_session(now=None):
+    """是否处于交易时段"""
+    if now is None:
+        now = datetime.now()
+    t = now.time()
+    return any(start <= t <= end for start, end in TRADING_SESSIONS)
+
+
+def wait_for_open():
+    """
+    等待至开盘后，判断当日是否为交易日
+
+    说明：
+        报价日期在开盘前仍为上一交易日，盘前以报价判断总为非交易日。
+        周末直接返回False；其余日期等待至集合竞价开始，此后报价日期为当日即为交易日，
+        至`OPEN_CHECK_DEADLINE`仍非当日时视为非交易日（节假日）。
+        直接以报价判断，不使用`is_trading_reader`缓存的盘前结果
+    """
+    today = datetime.now().date()
+    if not is_working_day(today):
+        return False
+    open_time = TRADING_SESSIONS[0][0]
+    while True:
+        now = datetime.now()
+        if now.time() < open_time:
+            time.sleep((datetime.combine(now.date(), open_time) - now).total_seconds())
+            continue
+        if is_trading_day(now.date()):
+            return True
+        if now.time() >= OPEN_CHECK_DEADLINE:
+            return False
+        time.sleep(OPEN_CHECK_INTERVAL)
+
+
+def min_interval(n_requests):
+    """按报价主机限速（每秒请求数），持续刷新时完成一次刷新所需的最短时间（秒）"""
+    rate, _ = HOST_RATE_LIMITS.get(get_server_name(QUOTE_URL_FMT), DEFAULT_RATE_LIMIT)
+    return n_requests / rate
+
+
+def to_records(df):
+    """将报价一次性转换为数据表记录（字典列表），缺失值以None表示"""
+    data = df[QUOTE_COLS].copy()
+    data['日期'] = data['日期'].dt.date
+    data = data.astype(object)
+    return data.where(data.notna(), None).to_dict('records')
+
+
+class QuotePoller(object):
+    """
+    实时报价轮询
+
+    Parameters
+    ----------
+    codes : list
+        股票代码列表，默认为全部在市股票
+    interval : float
+        刷新间隔（秒）。低于`min_interval`时以后者为准
+    batch_size : int
+        每次请求的股票数量，不超过`QUOTE_BATCH_SIZE`
+    max_workers : int
+        并发请求数量
+    write : bool
+        是否写入数据库
+
+    Example
+    -------
+    >>> poller = QuotePoller()
+    >>> changed = poller.poll()
+    >>> poller.stats()
+    PollStats(count=1, last=0.41, mean=0.41, max=0.41)
+    """
+
+    def __init__(self, codes=None, interval=POLL_INTERVAL, batch_size=QUOTE_BATCH_SIZE,
+                 max_workers=DEFAULT_WORKERS, write=True):
+        if codes is None:
+            codes = get_all_codes(False)
+        # 去除重复代码（保持顺序），同一代码每次刷新只请求一次
+        self.codes = list(dict.fromkeys(ensure_list(codes)))
+        self.batch_size = min(batch_size, QUOTE_BATCH_SIZE)
+        # 刷新快于限速时，请求在限速器排队，实际间隔反而不稳定
+        required = min_interval(len(self._batches()))
+        if interval < required:
+            logger.info('{}次请求按限速至少需要{:.1f}秒，刷新间隔由{}秒调整为{:.1f}秒'.format(
+                len(self._batches()), required, interval, required))
+            interval = required
+        self.interval = interval
+        self.max_workers = max_workers
+        self.write = write
+        self.latest = None         # 最新全部报价
+        self._snapshot = None      # 股票代码 -> (时间, 成交量)
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._stopped = threading.Event()
+
+    def _batches(self):
+        n = self.batch_size
+        return [self.codes[i:i + n] for i in range(0, len(self.codes), n)]
+
+    def fetch(self):
+        """并行下载全部报价，每批一次请求"""
+        frames = []
+        run_parallel(self._batches(), fetch_quote_batch,
+                     lambda batch, df: frames.append(df), self.max_workers)
+        if not frames:
+            return pd.DataFrame(columns=QUOTE_COLS)
+        return pd.concat(frames, ignore_index=True)
+
+    def changes(self, df):
+        """
+        与上次报价比较，返回时间或成交量发生变化（含首次出现）的报价，并更新上次报价
+
+        同一代码出现多次时，仅保留最后一行
+        """
+        df = df.drop_duplicates('股票代码', keep='last')
+        current = df.set_index('股票代码')[['时间', '成交量']]
+        if self._snapshot is None:
+            changed = pd.Series(True, index=current.index)
+            self._snapshot = current
+        else:
+            previous = self._snapshot.reindex(current.index)
+            # 成交量缺失时无法比较，视为变化
+            changed = ((current['时间'] != previous['时间']) |
+                       (current['成交量'] != previous['成交量'])).fillna(True).astype(bool)
+            # 本次未取得报价的股票，保留上次报价
+            kept = self._snapshot[~self._snapshot.index.isin(current.index)]
+            self._snapshot = pd.concat([kept, current])
+        return df[changed.values]
+
+    def poll(self):
+        """
+        刷新一次
+
+        Returns
+        -------
+        res : DataFrame
+            发生变化的报价
+        """
+        start = time.perf_counter()
+        df = self.fetch()
+        changed = self.changes(df)
+        if self.write and not changed.empty:
+            with session_scope() as sess:
+                bulk_insert(sess, Quotation, to_records(changed))
+        self.latest = df
+        elapsed = time.perf_counter() - start
+        self._latencies.append(elapsed)
+        logger.info('报价{}行，变化{}行，用时{:.3f}秒'.format(
+            len(df), len(changed), elapsed))
+        return changed
+
+    def stats(self):
+        """最近刷新用时统计"""
+        if not self._latencies:
+            return PollStats(0, None, None, None)
+        values = list(self._latencies)
+        return PollStats(len(values), values[-1],
+                         sum(values) / len(values), max(values))
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self, until=TRADING_SESSIONS[-1][1]):
+        """
+        持续刷新，至指定时间或调用`stop`为止
+
+        说明：
+            非交易时段（如午间休市）暂停刷新；单次刷新出错时，记录后继续
+        """
+        self._stopped.clear()
+        while not self._stopped.is_set() and datetime.now().time() < until:
+            start = time.monotonic()
+            if in_session():
+                try:
+                    self.poll()
+                except Exception as e:
+                    logger.error('刷新报价失败：{}'.format(e))
+            wait = self.interval - (time.monotonic() - start)
+            if wait > 0:
+                self._stopped.wait(wait)
+        logger.info('停止刷新。{}'.format(self.stats()))
@@ -21,7 +21,8 @@ from cswd.sql.models import Shareholder
 from cswd.websource.exceptions import NoWebData
 from cswd.common.utils import ensure_list
 
-from .utils import get_all_codes, log_to_db
+from .scheduler import DEFAULT_WORKERS, run_parallel
+from .utils import get_all_codes, last_dates, log_to_db
 
 logger = logbook.Logger('股东持股')
 
@@ -183,105 +184,117 @@ def _insert(sess, objs, msg_info, code, d):
     logger.info(msg_info)
 
 
-def _get_report_periods(sess, code, type_):
-    """获取需要刷新的报告日期列表"""
+# 股东类型 -> （名称，报告期查询类别，生成函数）
+TYPE_INFO_MAPS = {
+    ShareholderType.main: ('主要股东', 't', _gen_main),
+    ShareholderType.circulating: ('十大流通股东', 'c', _gen_circulating),
+    ShareholderType.fund: ('基金持股', 'jjcg', _gen_jjcg),
+}
+
+
+def _get_start_date(sess, code, type_):
+    """数据库中指定类型股东数据的开始日期"""
     last_date = sess.query(func.max(Shareholder.date)).filter(Shareholder.code == code).filter(
         Shareholder.A001_股东类型 == type_).scalar()
+    return _start_from(last_date)
+
+
+def _start_from(last_date):
+    """由最后日期确定开始日期"""
     if last_date is None:
         # 选择所有有效日期
-        start = pd.Timestamp('1990').date()
+        return pd.Timestamp('1990').date()
     else:
         # 开始日期递延到下一天
-        start = last_date + pd.Timedelta(days=1)
+        return last_date + pd.Timedelta(days=1)
+
+
+def _report_periods_from(code, type_, start):
+    """网络已有的、不早于开始日期的报告日期列表"""
     # 当开始日期大于当前日期时，输出空列表
     if start > pd.Timestamp('today').date():
         return []
-    if type_ == ShareholderType.main:
-        t = 't'
-    elif type_ == ShareholderType.circulating:
-        t = 'c'
-    else:
-        t = 'jjcg'
+    t = TYPE_INFO_MAPS[type_][1]
     dates = fetch_report_periods(code, t).keys()
     dates = [datetime.strptime(x, '%Y-%m-%d').date() for x in dates]
     dates = [x for x in dates if x >= start]
     return dates
 
 
-def flush_main(sess, code):
-    dates = _get_report_periods(sess, code, ShareholderType.main)
-    if len(dates) == 0:
-        logger.info('{}无需刷新。股票：{}'.format('主要股东', code))
-    for d in dates:
-        if existed(sess, code, d, ShareholderType.main):
-            logger.info('主要股东，股票：{}，日期：{}， 已经存在'.format(code, d.date()))
-            continue
-        try:
-            df = top_10_reader.read(stock_code=code, query_date=d, type_='t')
-        except NoWebData:
-            logger.info('股票：{}，日期：{}，主要流通股东数据'.format(code, d.date()))
-            continue
-        to_adds = _gen_main(df, code, d)
-        type_info = '主要股东，股票：{}，日期：{}， 新增{}行'.format(
-            code, d, len(to_adds))
-        _insert(sess, to_adds, type_info, code, d)
+def _get_report_periods(sess, code, type_):
+    """获取需要刷新的报告日期列表"""
+    start = _get_start_date(sess, code, type_)
+    return _report_periods_from(code, type_, start)
 
 
-def flush_circulating(sess, code):
-    dates = _get_report_periods(sess, code, ShareholderType.circulating)
-    if len(dates) == 0:
-        logger.info('{}无需刷新。股票：{}'.format('十大股东', code))
-    for d in dates:
-        if existed(sess, code, d, ShareholderType.circulating):
-            logger.info('十大流通股东，股票：{}，日期：{}， 已经存在'.format(code, d.date()))
-            continue
-        try:
-            df = top_10_reader.read(stock_code=code, query_date=d, type_='c')
-        except NoWebData:
-            logger.info('股票：{}，日期：{}，十大流通股东数据。'.format(code, d.date()))
-            continue
-        to_adds = _gen_circulating(df, code, d)
-        type_info = '十大流通股东，股票：{}，日期：{}，新增{}行'.format(
-            code, d, len(to_adds))
-        _insert(sess, to_adds, type_info, code, d)
+def _read(code, d, type_):
+    """读取单个期间的股东网页数据"""
+    if type_ == ShareholderType.fund:
+        return jjcg_reader.read(stock_code=code, query_date=d)
+    t = TYPE_INFO_MAPS[type_][1]
+    return top_10_reader.read(stock_code=code, query_date=d, type_=t)
 
 
-def flush_fund(sess, code):
-    dates = _get_report_periods(sess, code, ShareholderType.fund)
-    if len(dates) == 0:
-        logger.info('{}无需刷新。股票：{}'.format('基金持股', code))
-    for d in dates:
-        if existed(sess, code, d, ShareholderType.fund):
-            logger.info('基金持股，股票：{}，日期：{}， 已经存在'.format(code, d.date()))
-            continue
-        try:
-            # df = fetch_jjcg(code, d)
-            df = jjcg_reader.read(stock_code=code, query_date=d)
-        except NoWebData:
-            logger.info('无基金持股数据。股票：{}，日期：{}'.format(code, d.date()))
+def _fetch(code, starts):
+    """
+    下载单个股票各类型股东数据（不访问数据库）
+
+    返回（类型，日期，DataFrame）列表
+    """
+    result = []
+    for type_, start in starts.items():
+        name = TYPE_INFO_MAPS[type_][0]
+        dates = _report_periods_from(code, type_, start)
+        if len(dates) == 0:
+            logger.info('{}无需刷新。股票：{}'.format(name, code))
+        for d in dates:
+            try:
+                df = _read(code, d, type_)
+            except NoWebData:
+                logger.info('无{}数据。股票：{}，日期：{}'.format(name, code, d))
+                continue
+            result.append((type_, d, df))
+    return result
+
+
+def _write(sess, code, result):
+    """写入单个股票下载结果"""
+    for type_, d, df in result:
+        name, _, gen = TYPE_INFO_MAPS[type_]
+        if existed(sess, code, d, type_):
+            logger.info('{}，股票：{}，日期：{}， 已经存在'.format(name, code, d))
             continue
-        to_adds = _gen_jjcg(df, code, d)
-        type_info = '基金持股，股票：{}，日期：{}, 新增{}行'.format(
-            code, d, len(to_adds))
+        to_adds = gen(df, code, d)
+        type_info = '{}，股票：{}，日期：{}，新增{}行'.format(
+            name, code, d, len(to_adds))
         _insert(sess, to_adds, type_info, code, d)
 
 
 def _flush_by(sess, code, type_):
-    if type_ == ShareholderType.main:
-        flush_main(sess, code)
-    elif type_ == ShareholderType.circulating:
-        flush_circulating(sess, code)
-    else:
-        flush_fund(sess, code)
+    starts = {type_: _get_start_date(sess, code, type_)}
+    _write(sess, code, _fetch(code, starts))
+
 
+def flush_main(sess, code):
+    _flush_by(sess, code, ShareholderType.main)
 
-def flush_shareholder(codes=None):
+
+def flush_circulating(sess, code):
+    _flush_by(sess, code, ShareholderType.circulating)
+
+
+def flush_fund(sess, code):
+    _flush_by(sess, code, ShareholderType.fund)
+
+
+def flush_shareholder(codes=None, max_workers=DEFAULT_WORKERS):
     """
     刷新股票股东信息
     
     说明：
         如初始化则包含所有曾经上市的股票代码，含已经退市
         否则仅包含当前在市的股票代码
+        按代码并行下载，串行写入
     """
     # if init:
     #     insert_preprocessed_data()
@@ -289,11 +302,21 @@ def flush_shareholder(codes=None):
         codes = get_all_codes(False)
     else:
         codes = ensure_list(codes)
-    # 按代码循环
+    # 在调用线程中确定各代码、各类型的开始日期（每类型一次查询）
+    watermarks = {type_: last_dates(Shareholder, A001_股东类型=type_)
+                  for type_ in TYPE_INFO_MAPS.keys()}
+    plans = []
     for code in codes:
-        with session_scope() as sess:
-            # 按类型循环
-            for type_ in (ShareholderType.main,
-                          ShareholderType.circulating,
-                          ShareholderType.fund):
-                _flush_by(sess, code, type_)
+        starts = {type_: _start_from(watermarks[type_].get(code))
+                  for type_ in TYPE_INFO_MAPS.keys()}
+        plans.append((code, starts))
+
+    def fetch(plan):
+        return _fetch(*plan)
+
+    with session_scope() as sess:
+
+        def write(plan, result):
+            _write(sess, plan[0], result)
+
+        run_parallel(plans, fetch, write, max_workers)
@@ -5,6 +5,7 @@ import logbook
 from ..common.utils import data_root
 from ..common.constants import DB_DIR_NAME, DB_NAME
 from ..sql.base import get_engine
+from ..sql.migrate import upgrade
 from ..sql.models import Base
 
 logger = logbook.Logger('创建表')
@@ -30,6 +31,9 @@ def creat_tables():
             os.remove(db)
         except FileNotFoundError:
             pass
+    else:
+        # 保留原有数据时，先为已有数据表添加缺失的索引
+        upgrade(db)
     engine = get_engine(echo=True)
     Base.metadata.create_all(engine)
     logger.info('完成！')
@@ -1,8 +1,19 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+
+import logbook
 import pandas as pd
 from sqlalchemy import func
 
 from cswd.sql.models import Stock, Issue, Status, RefreshRecord
-from cswd.sql.base import get_session, session_scope
+from cswd.sql.base import get_session, session_scope, bulk_insert
+
+logger = logbook.Logger('刷新记录')
+
+REFRESH_LOG_BATCH = 500       # 刷新记录累计达到此数量时写入
+REFRESH_LOG_INTERVAL = 5      # 距上次写入超过此秒数时写入
 
 
 def get_all_codes(init=False):
@@ -60,11 +71,154 @@ def existed(class_, code=None, date_=None):
     return res
 
 
-def log_to_db(table_name, status, rows, action, code=None, start=None, end=None):
-    """记录刷新数据"""
+def last_dates(class_, column=None, **filters):
+    """
+    一次查询各代码最后日期（水位）
+
+    Parameters
+    ----------
+    class_ : class
+        数据表模型类，包含`code`属性
+    column : Column
+        求最大值的列，默认为`class_.date`
+    filters : dict
+        类属性名称 -> 值，限定查询范围。如`A001_股东类型=ShareholderType.main`
+
+    Returns
+    -------
+    res : dict
+        股票代码 -> 最后日期。表中不存在的代码不包含在内
+
+    Example
+    -------
+    >>> last_dates(StockDaily)
+    {'000001': datetime.date(2018, 4, 4), ......}
+    """
+    if column is None:
+        column = class_.date
+    with session_scope() as sess:
+        query = sess.query(class_.code, func.max(column))
+        for attr, value in filters.items():
+            query = query.filter(getattr(class_, attr) == value)
+        return dict(query.group_by(class_.code).all())
+
+
+def get_ipo_dates():
+    """各股票上市日期字典（尚未上市的不包含在内）"""
     with session_scope() as sess:
-        rr = RefreshRecord(table_name=table_name,
-                           status=status, row=rows,
-                           action=action, code=code,
-                           start=start, end=end)
-        sess.add(rr)
+        query = sess.query(Issue.code, Issue.A004_上市日期).filter(
+            Issue.A004_上市日期.isnot(None))
+        return dict(query.all())
+
+
+class RefreshLogger(object):
+    """
+    缓冲写入刷新记录
+
+    记录先保存在内存，累计达到`max_records`条或距上次写入超过`interval`秒时，
+    以一个事务批量写入；进程退出时写入剩余记录。
+
+    Parameters
+    ----------
+    max_records : int
+        每批最多记录数量
+    interval : float
+        最长写入间隔（秒）
+    background : bool
+        是否在后台线程写入。否则在添加记录的线程中写入
+
+    Notes
+    -----
+        后台写入失败时，记录保留在缓冲区，下次重试
+    """
+
+    def __init__(self, max_records=REFRESH_LOG_BATCH, interval=REFRESH_LOG_INTERVAL,
+                 background=False):
+        self.max_records = max_records
+        self.interval = interval
+        self.background = background
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._thread = None
+        if background:
+            self._thread = threading.Thread(target=self._run, daemon=True,
+                                            name='refresh-logger')
+            self._thread.start()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def log(self, table_name, status, rows, action, code=None, start=None, end=None):
+        """添加一条刷新记录"""
+        record = {'表名': table_name, '状态': status, '行数': rows,
+                  '操作': action, '代码': code, '开始日期': start,
+                  '结束日期': end, '更新时间': datetime.now()}
+        with self._lock:
+            self._buffer.append(record)
+            due = (len(self._buffer) >= self.max_records or
+                   time.monotonic() - self._last_flush >= self.interval)
+        if not due:
+            return
+        if self.background:
+            self._wakeup.set()
+        else:
+            self.flush()
+
+    def _write(self, records):
+        with session_scope() as sess:
+            bulk_insert(sess, RefreshRecord, records)
+
+    def flush(self):
+        """写入缓冲区全部记录，返回写入数量"""
+        with self._write_lock:
+            with self._lock:
+                records, self._buffer = self._buffer, []
+                self._last_flush = time.monotonic()
+            if not records:
+                return 0
+            try:
+                self._write(records)
+            except BaseException:
+                # 放回缓冲区，保持原有顺序
+                with self._lock:
+                    self._buffer[:0] = records
+                raise
+            return len(records)
+
+    def _run(self):
+        while not self._closed.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error('写入刷新记录失败：{}'.format(e))
+
+    def close(self):
+        """停止后台线程，写入剩余记录"""
+        self._closed.set()
+        if self._thread is not None:
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+refresh_logger = RefreshLogger()
+atexit.register(refresh_logger.close)
+
+
+def log_to_db(table_name, status, rows, action, code=None, start=None, end=None):
+    """
+    记录刷新数据
+
+    说明：
+        记录经`refresh_logger`缓冲后批量写入。需要立即查询刷新记录时，
+        先调用`refresh_logger.flush()`
+    """
+    refresh_logger.log(table_name, status, rows, action, code, start, end)
@@ -1,101 +1,237 @@
 import requests
+import threading
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 from functools import wraps
-import numpy as np
 from logbook import Logger
 
-from .exceptions import ConnectFailed, ThreeTryFailed
+from .exceptions import ConnectFailed, ThreeTryFailed, FrequentAccess, NoWebData
 from ..common.utils import get_server_name
 
 # 可能会遇到服务器定期重启，导致网络中断。休眠时长应大于重启完成时间
 MAX_SLEEP = 2
 logger = Logger('休眠')
 
-
-class DownloadRecord(object):
-	called = {}
-	start_time = {}
-	run_time = {}
-
-
-def friendly_download(times=20, duration=None, max_sleep=1):
-	"""
-	下载函数装饰器
-
-	Parameters
+# 各主机访问速率限制。主机 -> (每秒请求数, 允许突发请求数)
+HOST_RATE_LIMITS = {
+    'quotes.money.163.com': (5, 10),
+    'hq.sinajs.cn': (2, 4),
+    'market.finance.sina.com.cn': (0.5, 2),    # 成交明细，频繁访问将被暂停响应
+    'vip.stock.finance.sina.com.cn': (1, 3),
+    'www.cninfo.com.cn': (3, 6),
+    'www.cnindex.com.cn': (2, 4),
+    'data.stats.gov.cn': (1, 2),
+    '10jqka.com.cn': (0.5, 1),                 # 同花顺（浏览器访问）
+}
+DEFAULT_RATE_LIMIT = (5, 10)
+
+MIN_RATE = 0.05          # 退避后最低速率(每秒请求数)
+BACKOFF_FACTOR = 2       # 受限后速率降低倍数
+RECOVER_FACTOR = 1.1     # 成功访问后速率恢复倍数
+THROTTLED_STATUS = (456, 503)
+NOT_FOUND_STATUS = (404,)  # 网页不存在，无需重试
+
+POOL_SIZE = 10           # 每个主机连接池保持的连接数量，应不小于并发下载线程数
+CONNECT_RETRIES = 2      # 建立连接失败时，连接池自动重试次数
+
+
+class TokenBucket(object):
+    """
+    令牌桶限速器（线程安全）
+
+    Parameters
     ----------
-	times： int
-		每`times`次调用休眠一次
-	duration：int
-		运行`duration`（秒）休眠一次
-	max_sleep：int
-		允许最长休眠时间（秒）
-
-	"""
-	assert times or duration, '运行次数与时长限制参数不得全部为空'
-
-	def decorator(func):
-
-		key = func.__name__
-
-		def sleep():
-			t = np.random.randint(1, max_sleep * 100) / 100
-			logger.info('每调用函数"{}"{}次，休眠{}秒'.format(key, times, t))
-			time.sleep(t)
-
-		@wraps(func)
-		def wrapper(*args, **kwargs):
-
-			called = DownloadRecord.called.get(key, 0)
-			run_time = DownloadRecord.run_time.get(key, 0)
-			start_time = DownloadRecord.start_time.get(key, time.time())
-
-			if times and ((called + 1) % times == 0):
-				sleep()
-			if duration and (int(run_time + 1) % duration == 0):
-				sleep()
-
-			DownloadRecord.called.update({key: called + 1})
-			DownloadRecord.run_time.update({key: time.time() - start_time})
-			DownloadRecord.start_time.update({key: time.time()})
-			return func(*args, **kwargs)
-		return wrapper
-	return decorator
-
-
-def _get(url, params, timeout):
+    rate : float
+        每秒补充的令牌数量，即稳定状态下每秒请求数
+    burst : int
+        令牌桶容量，即允许的突发请求数
+    """
+
+    def __init__(self, rate, burst):
+        assert rate > 0 and burst >= 1, 'rate必须大于0，burst不得小于1'
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def try_acquire(self, tokens=1):
+        """尝试取得令牌，不阻塞。成功返回0，否则返回需要等待的时长（秒）"""
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens=1):
+        """取得令牌，不足时阻塞等待。返回等待时长（秒）"""
+        waited = 0.0
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    def backoff(self):
+        """服务器限制访问时，降低速率并清空令牌"""
+        with self._lock:
+            self.rate = max(MIN_RATE, self.rate / BACKOFF_FACTOR)
+            self._tokens = 0.0
+            self._last = time.monotonic()
+        return self.rate
+
+    def recover(self):
+        """访问成功后，逐步恢复至设定速率"""
+        if self.rate < self.max_rate:
+            with self._lock:
+                self._refill(time.monotonic())
+                self.rate = min(self.max_rate, self.rate * RECOVER_FACTOR)
+        return self.rate
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(server):
+    """主机所对应的限速器（同一主机的所有函数、线程共享）"""
+    with _limiters_lock:
+        limiter = _limiters.get(server)
+        if limiter is None:
+            rate, burst = HOST_RATE_LIMITS.get(server, DEFAULT_RATE_LIMIT)
+            limiter = TokenBucket(rate, burst)
+            _limiters[server] = limiter
+        return limiter
+
+
+def set_rate_limit(server, rate, burst):
+    """设置主机访问速率限制"""
+    with _limiters_lock:
+        HOST_RATE_LIMITS[server] = (rate, burst)
+        _limiters[server] = TokenBucket(rate, burst)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _make_http_session():
+    session = requests.Session()
+    retries = Retry(total=CONNECT_RETRIES, connect=CONNECT_RETRIES,
+                    read=0, status=0, backoff_factor=0.5)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE,
+                          max_retries=retries)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_http_session(server):
+    """
+    主机所对应的连接池会话
+
+    同一主机的所有请求共享一个会话，复用保持连接(keep-alive)的TCP连接，
+    避免每次请求重新握手。连接池线程安全。
+    """
+    with _sessions_lock:
+        session = _sessions.get(server)
+        if session is None:
+            session = _make_http_session()
+            _sessions[server] = session
+        return session
+
+
+def set_pool_size(size):
+    """设置每个主机连接池大小（关闭现有会话）"""
+    global POOL_SIZE
+    with _sessions_lock:
+        POOL_SIZE = size
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def limit_rate(server):
+    """
+    限速装饰器
+
+    用于未经`get_page_response`而直接读取网址的下载函数（如`pd.read_csv(url)`）。
+
+    Parameters
+    ----------
+    server : str
+        主机名称。同一主机的函数共享限速器
+
+    Notes
+    -----
+        函数触发`FrequentAccess`异常时，降低该主机访问速率后重新抛出
+    """
+    def decorator(func):
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            limiter = get_limiter(server)
+            limiter.acquire()
+            try:
+                res = func(*args, **kwargs)
+            except FrequentAccess:
+                rate = limiter.backoff()
+                logger.info('频繁访问主机"{}"，速率降低至每秒{:.2f}次'.format(
+                    server, rate))
+                raise
+            limiter.recover()
+            return res
+        return wrapper
+    return decorator
+
+
+def _request(method, url, params, timeout):
     """超时不能设置太短，否则经常出错"""
+    server = get_server_name(url)
+    limiter = get_limiter(server)
     for i in range(3):
+        limiter.acquire()
         try:
-            r = requests.get(url, params=params, timeout=timeout)
+            r = get_http_session(server).request(
+                method, url, params=params, timeout=timeout)
             if r.status_code == requests.codes.ok:
+                limiter.recover()
                 return r
+            if r.status_code in NOT_FOUND_STATUS:
+                limiter.recover()
+                raise NoWebData('网页不存在：{}'.format(url))
+            if r.status_code in THROTTLED_STATUS:
+                rate = limiter.backoff()
+                logger.info('第{}次尝试。主机"{}"限制访问（{}），速率降低至每秒{:.2f}次'.format(
+                    i + 1, server, r.status_code, rate))
+                continue
+        except NoWebData:
+            raise
         except requests.exceptions.ConnectionError:
-            logger.info('第{}次尝试。无法连接服务器：{}'.format(
-            	i + 1, get_server_name(url)))
+            logger.info('第{}次尝试。无法连接服务器：{}'.format(i + 1, server))
             time.sleep(MAX_SLEEP)
             continue
         except Exception as e:
             logger.info('第{}次尝试。错误：{}'.format(i + 1, e.args))
         time.sleep(0.1)
-    raise ConnectFailed('三次尝试失败。服务器：{}'.format(get_server_name(url)))
+    raise ConnectFailed('三次尝试失败。服务器：{}'.format(server))
+
+
+def _get(url, params, timeout):
+    return _request('GET', url, params, timeout)
 
 
 def _post(url, params, timeout):
-    for i in range(3):
-        try:
-            r = requests.post(url, params=params, timeout=timeout)
-            if r.status_code == requests.codes.ok:
-                return r
-        except requests.exceptions.ConnectionError:
-            logger.info('第{}次尝试。无法连接服务器：{}'.format(
-            	i + 1, get_server_name(url)))
-            time.sleep(MAX_SLEEP)
-            continue
-        except Exception as e:
-            logger.info('第{}次尝试。错误：{}'.format(i + 1, e.args))
-        time.sleep(0.1)
-    raise ConnectFailed('三次尝试均失败。服务器：{}'.format(get_server_name(url)))
+    return _request('POST', url, params, timeout)
 
 
 def get_page_response(url, method='get', params=None, timeout=(6, 3)):
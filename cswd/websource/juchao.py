@@ -19,16 +19,13 @@ from datetime import datetime
 from io import BytesIO, StringIO
 import os
 import re
-import numpy as np
 import pandas as pd
 import logbook
 from itertools import product
-from urllib.error import HTTPError
 from urllib.parse import quote
-import requests
 import time
 from ..common.utils import data_root
-from .base import get_page_response, friendly_download
+from .base import get_page_response
 from .exceptions import ThreeTryFailed, ConnectFailed, NoWebData, NoDataBefore
 
 
@@ -191,7 +188,6 @@ def fetch_index_info():
     urls = [url_fmt.format(x[0], x[1]) for x in prod_]
     dfs = []
 
-    @friendly_download(30, max_sleep=1)
     def _process(url):
         # 部分网页并不存在
         try:
@@ -331,14 +327,14 @@ def fetch_industry(date_str, department):
     url_fmt = 'http://www.cnindex.com.cn/syl/{}/{}_hsls.html'
     url = url_fmt.format(date_str, department)
     try:
-        df = pd.read_html(url)[1].loc[:, range(2)]
-        df.columns = ['industry_id', 'name']
-        return df
-    except HTTPError:
+        page_response = get_page_response(url)
+    except NoWebData:
         msg_fmt = "或者当前日期的数据尚未发布，或者日期'{}'并非交易日"
         raise ValueError(msg_fmt.format(date_str))
+    df = pd.read_html(BytesIO(page_response.content))[1].loc[:, range(2)]
+    df.columns = ['industry_id', 'name']
+    return df
 
-@friendly_download(30)
 def _industry_stocks(industry_id, date_str):
     url = "http://www.cnindex.com.cn/stockPEs.do"
     if len(industry_id) == 1:
@@ -414,8 +410,8 @@ def ensure_report_date(date_):
 
 
 def _retry_one_page(url, data):
-    r = requests.post(url, data)
-    return r.json()['prbookinfos']
+    # 与首次请求相同，经`get_page_response`限速
+    return get_page_response(url, 'post', data)
 
 
 def _get_markets(date_):
@@ -447,18 +443,15 @@ def _fetch_prbookinfos(report_date, url, markets):
             logger.info('提取{}年{}季度{}第{}页数据'.format(
                 year, q,
                 JUCHAO_MARKET_MAPS[market], pagenum))
-            if pagenum % 30 == 0:
-                t = np.random.randint(1, 3 * 100) / 100
-                time.sleep(t)
             try:
                 r = get_page_response(url, 'post', data)
-                book = r.json()['prbookinfos']
             except ConnectFailed:
                 logger.info('{}第{}页出现异常！！！'.format(
                     JUCHAO_MARKET_MAPS[market], pagenum))
                 logger.info('休眠3秒后再次尝试')
                 time.sleep(3)
-                book = _retry_one_page(url, data)
+                r = _retry_one_page(url, data)
+            book = r.json()['prbookinfos']
             has_next_page = r.json()['hasNextPage']
             total_page = int(r.json()['totalPages'])
             df = pd.DataFrame.from_records(book)
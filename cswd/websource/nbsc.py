@@ -1,7 +1,7 @@
 import pandas as pd
 from datetime import date
 from calendar import monthrange
-from .base import get_page_response, friendly_download
+from .base import get_page_response
 
 
 HOST_URL = "http://data.stats.gov.cn/easyquery.htm"
@@ -53,7 +53,6 @@ def _freq_to_dbcode(freq):
    return ref.get(freq.strip().lower())
 
 
-@friendly_download(times=66, duration=None, max_sleep=1)
 def fetch_economics(code, start, end, freq):
    '''freq = monthly, quarterly, yearly'''
    start = _sanitize_date(start, freq)
@@ -123,7 +122,6 @@ def _batch_leaf_codes(freq, node_id='zb'):
    return ret
 
 
-@friendly_download(times=66, duration=None, max_sleep=1)
 def _get_leaf_codes(freq, page_code):
    '''return list of code which directly denotes a series
    page_code should be the node which are direct parent to leafs'''      
@@ -192,7 +190,6 @@ def _batch_page_codes(freq, node_id='zb'):
    return (nodes, parents_of_leafs)
 
 
-@friendly_download(times=33, duration=None, max_sleep=1)
 def _get_page_codes(freq='quarterly', node_id='zb'):
    '''default: the children of the root
    return the direct children to the node_id'''
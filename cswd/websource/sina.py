@@ -4,35 +4,40 @@
 新浪有许多以列表形式提供的汇总列，每天访问也仅仅一次。
 
 """
+import math
 import re
 from datetime import date
+from io import BytesIO, StringIO
 from urllib.error import HTTPError
 
 import pandas as pd
-import requests
 from bs4 import BeautifulSoup
 import logbook
 
 from ..common.constants import QUOTE_COLS
 from ..common.utils import ensure_list
 from ..dataproxy.cache import DataProxy
-from .base import friendly_download, get_page_response
+from .base import limit_rate, get_page_response
 from .exceptions import NoWebData, FrequentAccess
 
 QUOTE_PATTERN = re.compile('"(.*)"')
+# 代码及前32个字段（至时间为止）。停牌或无效代码的报价为空字符串，不匹配
+QUOTE_LINE_PATTERN = re.compile(r'hq_str_(?:sh|sz)(\d{6})="((?:[^,"\n]*,){31}[^,"\n]*)')
 NEWS_PATTERN = re.compile(r'\W+')
 STOCK_CODE_PATTERN = re.compile(r'\d{6}')
 DATA_BASE_URL = 'http://vip.stock.finance.sina.com.cn/q/go.php/'
+QUOTE_URL_FMT = 'http://hq.sinajs.cn/list={}'
+QUOTE_BATCH_SIZE = 800      # 每次请求的股票数量上限
 
 logger = logbook.Logger('新浪网')
 
 
-@friendly_download(10, 10, 10)
 def fetch_company_info(stock_code):
     """获取公司基础信息"""
     url_fmt = 'http://vip.stock.finance.sina.com.cn/corp/go.php/vCI_CorpInfo/stockid/{}.phtml'
     url = url_fmt.format(stock_code)
-    df = pd.read_html(url, attrs={'id': 'comInfo1'})[0]
+    response = get_page_response(url)
+    df = pd.read_html(BytesIO(response.content), attrs={'id': 'comInfo1'})[0]
     return df
 
 
@@ -40,7 +45,8 @@ def fetch_issue_new_stock_info(stock_code):
     """获取发行新股信息"""
     url_fmt = 'http://vip.stock.finance.sina.com.cn/corp/go.php/vISSUE_NewStock/stockid/{}.phtml'
     url = url_fmt.format(stock_code)
-    df = pd.read_html(url, attrs={'id': 'comInfo1'})[0]
+    response = get_page_response(url)
+    df = pd.read_html(BytesIO(response.content), attrs={'id': 'comInfo1'})[0]
     return df
 
 
@@ -52,14 +58,53 @@ def _add_prefix(stock_code):
         return 'sz{}'.format(stock_code)
 
 
-def _to_dataframe(content, p_codes):
-    """解析网页数据，返回DataFrame对象"""
-    res = [x.split(',') for x in re.findall(QUOTE_PATTERN, content)]
-    df = pd.DataFrame(res).iloc[:, :32]
-    df.columns = QUOTE_COLS[1:]
-    df.insert(0, '股票代码', p_codes)
-    # df['股票代码'] = p_codes
-    df.dropna(inplace=True)
+def _quote_dtypes():
+    """报价列类型。量为可空整数，价格及金额为浮点数"""
+    dtypes = {'股票代码': str, '股票简称': str, '日期': str, '时间': str}
+    for col in QUOTE_COLS:
+        if col not in dtypes:
+            dtypes[col] = 'Int64' if col.endswith('量') else 'float64'
+    return dtypes
+
+
+QUOTE_DTYPES = _quote_dtypes()
+
+
+def _to_dataframe(content, p_codes=None):
+    """
+    解析网页数据，返回DataFrame对象
+
+    以正则表达式一次提取代码及字段后，由`read_csv`一次完成分列，再按列转换类型。
+    个别字段为空或无法解析时，该字段为缺失值，不影响其余报价
+
+    Parameters
+    ----------
+    content : str
+        网页内容
+    p_codes : list
+        请求的股票代码列表。默认为网页中的全部代码
+
+    Returns
+    -------
+    res : DataFrame
+        价格及金额为浮点数，量为可空整数，日期为datetime64，时间为'HH:MM:SS'字符串
+    """
+    lines = ['{},{}'.format(code, fields)
+             for code, fields in QUOTE_LINE_PATTERN.findall(content)]
+    if lines:
+        # 全部按字符串读取，保留空字符串（股票简称等不视为缺失值）
+        df = pd.read_csv(StringIO('\n'.join(lines)), header=None,
+                         names=QUOTE_COLS, dtype=str, keep_default_na=False)
+        for col, dtype in QUOTE_DTYPES.items():
+            if dtype is not str:
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype(dtype)
+    else:
+        df = pd.DataFrame({col: pd.Series(dtype=dtype)
+                           for col, dtype in QUOTE_DTYPES.items()},
+                          columns=QUOTE_COLS)
+    df['日期'] = pd.to_datetime(df['日期'], format='%Y-%m-%d', errors='coerce')
+    if p_codes is not None:
+        df = df[df['股票代码'].isin(p_codes)]
     return df
 
 
@@ -87,23 +132,32 @@ def fetch_quotes(stock_codes):
     1  000002  万 科Ａ  33.700  34.160  33.290  33.990  33.170  33.290
     """
     stock_codes = ensure_list(stock_codes)
-    num = len(stock_codes)
-    length = 800
-    times = int(num / length) + 1
-    url_fmt = 'http://hq.sinajs.cn/list={}'
-    dfs = []
-    for i in range(times):
-        p_codes = stock_codes[i * length:(i + 1) * length]
-        url = url_fmt.format(','.join(map(_add_prefix, p_codes)))
-        content = get_page_response(url).text
-        dfs.append(_to_dataframe(content, p_codes))
+    length = QUOTE_BATCH_SIZE
+    times = math.ceil(len(stock_codes) / length)
+    if times == 0:
+        return _to_dataframe('', [])
+    dfs = [fetch_quote_batch(stock_codes[i * length:(i + 1) * length])
+           for i in range(times)]
     return pd.concat(dfs).sort_values('股票代码')
 
 
+def fetch_quote_batch(stock_codes):
+    """
+    以一次请求获取股票列表的分时报价
+
+    股票数量不得超过`QUOTE_BATCH_SIZE`。结果与`fetch_quotes`一致，但未排序
+    """
+    assert len(stock_codes) <= QUOTE_BATCH_SIZE, \
+        '每次请求不得超过{}只股票'.format(QUOTE_BATCH_SIZE)
+    url = QUOTE_URL_FMT.format(','.join(map(_add_prefix, stock_codes)))
+    content = get_page_response(url).text
+    return _to_dataframe(content, stock_codes)
+
+
 def fetch_globalnews():
     """获取24*7全球财经新闻"""
     url = 'http://live.sina.com.cn/zt/f/v/finance/globalnews1'
-    response = requests.get(url)
+    response = get_page_response(url)
     today = date.today()
     soup = BeautifulSoup(response.content, "lxml")
 
@@ -121,7 +175,7 @@ def fetch_globalnews():
     return stamps, titles, categories, data_mid
 
 
-@friendly_download(10, 10, 2)
+@limit_rate('market.finance.sina.com.cn')
 def fetch_cjmx(stock_code, date_):
     """
     下载指定股票代码所在日期成交明细
@@ -171,14 +225,14 @@ def fetch_cjmx(stock_code, date_):
             code_str, date_str))
 
 
-@friendly_download(10, 10, 1)
 def _common_fun(url, pages, skiprows=1, verbose=False):
     """处理新浪数据中心网页数据通用函数"""
     dfs = []
 
     def sina_read_fun(x):
+        response = get_page_response(x)
         return pd.read_html(
-            x,
+            BytesIO(response.content),
             skiprows=skiprows,
             na_values=['--'],
             flavor='html5lib',
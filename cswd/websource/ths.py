@@ -24,7 +24,7 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.support.ui import WebDriverWait
 
 from ._selenium import make_headless_browser
-from .base import friendly_download
+from .base import limit_rate
 
 logbook.set_datetime_format('local')
 logger = logbook.Logger('同花顺')
@@ -35,6 +35,7 @@ NEXT_PAGE_LINK = '下一页'
 
 # 根据个人电脑运行状况调整
 SLEEP = 0.5
+THS_SERVER = '10jqka.com.cn'    # 限速主机名称（含同花顺各子域名）
 ISSUE_KEYS = ('成立日期', '发行数量', '发行价格', '上市日期', '发行市盈率', '预计募资',
               '首日开盘价', '发行中签率', '实际募资', '主承销商', '上市保荐人', '历史沿革')
 
@@ -207,7 +208,7 @@ class THSF10(object):
         df = _parse_to_df(tds, 7, col_names)
         return df.iloc[:, 1:]
 
-    @friendly_download(10)
+    @limit_rate(THS_SERVER)
     def get_issue_info(self, stock_code):
         """
         获取指定股票代码的发行信息
@@ -389,7 +390,7 @@ class THSF10(object):
             res.append(df)
         return pd.concat(res)
 
-    @friendly_download(10)
+    @limit_rate(THS_SERVER)
     def _get_pages_dataframe(self, url, info, table_loc=-1):
         """获取网页数据框(单页或连续多页)"""
         logger.info('当前网址：{}'.format(url))
@@ -13,9 +13,7 @@
     融资融券                  fetch_margin_data
 
 """
-from urllib.error import HTTPError
 from bs4 import BeautifulSoup
-import requests
 import pandas as pd
 import re
 from functools import partial, lru_cache
@@ -23,7 +21,7 @@ from io import StringIO, BytesIO
 
 from ..common.utils import sanitize_dates
 
-from .base import get_page_response, friendly_download
+from .base import get_page_response
 from .exceptions import NoWebData, NoDataBefore
 
 
@@ -43,6 +41,9 @@ _WY_MARGIN_DATA_COL_NAMES = ['股票代码', '融资余额', '融资买入额',
 
 MARGIN_START = pd.Timestamp('2010-3-31').date()
 
+WY_SERVER = 'quotes.money.163.com'
+HISTORY_URL_FMT = 'http://quotes.money.163.com/service/chddata.html?code={}&start={}&end={}'
+
 
 def get_index_base():
     """获取上海及深圳指数代码、名称表"""
@@ -109,18 +110,17 @@ def _query_code(code, is_index):
     return code
 
 
-def fetch_history(code, start, end=None, is_index=False):
-    """获取股票或者指数的历史交易数据（不复权）
-    备注：
-        提供的数据延迟一日
-        TODO：开市前后再下载，观察结果
-    """
+def _history_url(code, start, end, is_index):
+    """历史交易数据网址"""
     start, end = sanitize_dates(start, end)
-    url_fmt = 'http://quotes.money.163.com/service/chddata.html?code={}&start={}&end={}'
     code = _query_code(code, is_index)
     start_str = start.strftime('%Y%m%d')
     end_str = end.strftime('%Y%m%d')
-    url = url_fmt.format(code, start_str, end_str)  # + '#01b07'
+    return HISTORY_URL_FMT.format(code, start_str, end_str)  # + '#01b07'
+
+
+def _parse_history(content):
+    """解析历史交易数据网页内容（bytes）"""
     na_values = ['None', '--', 'none']
     kwds = {
         'index_col': 0,
@@ -129,9 +129,18 @@ def fetch_history(code, start, end=None, is_index=False):
         'parse_dates': True,
         'na_values': na_values,
     }
+    return pd.read_csv(BytesIO(content), **kwds)
+
+
+def fetch_history(code, start, end=None, is_index=False):
+    """获取股票或者指数的历史交易数据（不复权）
+    备注：
+        提供的数据延迟一日
+        TODO：开市前后再下载，观察结果
+    """
+    url = _history_url(code, start, end, is_index)
     page_response = get_page_response(url, 'get')
-    df = pd.read_csv(BytesIO(page_response.content), **kwds)
-    return df
+    return _parse_history(page_response.content)
 
 
 def fetch_ohlcv(code, start, end, is_index=False):
@@ -145,18 +154,19 @@ def fetch_last_history():
 
     注意：
         区别于fetch_history，用于提取全部股票最新的日线交易数据。
+        单位与fetch_history不同：PERCENT（涨跌幅）、HS（换手率）为小数；
+        TURNOVER为成交金额（元），而非换手率
     """
     url = "http://quotes.money.163.com/hs/service/diyrank.php?"
     # url += "host=http://quotes.money.163.com/hs/service/diyrank.php&"
-    url += "page=0&query=STYPE:EQA&fields=SYMBOL,NAME,PRICE,PERCENT,OPEN,YESTCLOSE,"
-    url += "HIGH,LOW,VOLUME,TURNOVER,PE,MCAP,TCAP&sort=PERCENT&"
+    url += "page=0&query=STYPE:EQA&fields=SYMBOL,NAME,PRICE,PERCENT,UPDOWN,OPEN,YESTCLOSE,"
+    url += "HIGH,LOW,VOLUME,TURNOVER,HS,PE,MCAP,TCAP&sort=PERCENT&"
     url += "order=desc&count=5000&type=query"
-    r = requests.get(url)
+    r = get_page_response(url)
     df = pd.DataFrame.from_records(r.json()['list'])
     return df
 
 
-@friendly_download(20,60,1)
 def fetch_cjmx(code, tdate):
    """
    提取股票历史交易明细
@@ -173,9 +183,10 @@ def fetch_cjmx(code, tdate):
    na_values = ['None', '--', 'none']
    kwds = {'na_values': na_values}
    try:
-       df = pd.read_excel(url, **kwds)
-   except HTTPError:
+       page_response = get_page_response(url)
+   except NoWebData:
        raise NoWebData('网页数据不存在。股票：{}，日期：{}'.format(code, tdate))
+   df = pd.read_excel(BytesIO(page_response.content), **kwds)
    df.columns = _CJMX_COLS
    df.insert(0, '日期', tdate)
    df.insert(0, '股票代码', code)
@@ -200,6 +211,18 @@ def _report_url(code, type_, report):
     return url_fmt.format(report, code, type_)
 
 
+def _parse_financial_indicator(content):
+    """解析财务指标网页内容（bytes）"""
+    return pd.read_csv(BytesIO(content),
+                       na_values=['--', ' --', '-- '], encoding='gb2312').iloc[:, :-1]
+
+
+def _parse_financial_report(content):
+    """解析财务报表网页内容（bytes）"""
+    return pd.read_csv(BytesIO(content),
+                       na_values=['--', ' --', '-- '], encoding='gb18030').iloc[:, :-1]
+
+
 def _parse_report_data(url):
     response = get_page_response(url)
     #response.encoding = 'gb2312'
@@ -208,7 +231,6 @@ def _parse_report_data(url):
     return pd.read_csv(StringIO(response.text), na_values=na_values).iloc[:, :-1]
 
 
-@friendly_download()
 def fetch_financial_indicator(code, report_type, part):
     """
     财务指标
@@ -231,12 +253,10 @@ def fetch_financial_indicator(code, report_type, part):
     assert report_type in ('report', 'year', 'season')
     assert part in ('zhzb', 'ylnl', 'chnl', 'cznl', 'yynl')
     url = _cwzb_url(code, report_type, part)
-    data = pd.read_csv(
-        url, na_values=['--', ' --', '-- '], encoding='gb2312').iloc[:, :-1]
-    return data
+    response = get_page_response(url)
+    return _parse_financial_indicator(response.content)
 
 
-@friendly_download()
 def fetch_financial_report(code, report_type, report_item):
     """
     财务报表
@@ -257,9 +277,8 @@ def fetch_financial_report(code, report_type, report_item):
     assert report_type in ('report', 'year')
     assert report_item in ('lrb', 'zcfzb', 'xjllb')
     url = _report_url(code, report_type, report_item)
-    data = pd.read_csv(
-        url, na_values=['--', ' --', '-- '], encoding='gb18030').iloc[:, :-1]
-    return data
+    response = get_page_response(url)
+    return _parse_financial_report(response.content)
 
 
 def _parse_performance_notice(raw_df):
@@ -298,19 +317,13 @@ def fetch_company_info(stock_code):
     url_fmt = 'http://quotes.money.163.com/f10/gszl_{}.html'
     url = url_fmt.format(stock_code)
     attrs = {'class': 'table_bg001 border_box limit_sale table_details'}
-    res = pd.read_html(url, attrs=attrs)
+    response = get_page_response(url)
+    res = pd.read_html(BytesIO(response.content), attrs=attrs)
     return res[0], res[1]
 
 
-@lru_cache(None)
-def fetch_report_periods(stock_code, query):
-    """
-    下载股东持股、基金持股时，网络已有可供下载的期间
-
-    返回：dict对象
-        键：期末日期 eg 2017-06-30
-        值：2017-06-30,2017-03-31
-    """
+def _report_periods_url(stock_code, query):
+    """报告期网址及选项所在序号"""
     valid_types = ('c', 't', 'jjcg')
     assert query in valid_types, '{}不在有效类型{}中'.format(query, valid_types)
     if query == 'jjcg':
@@ -322,11 +335,15 @@ def fetch_report_periods(stock_code, query):
     else:
         type_ = 'gdfx'
         target_num = 0
-    result = {}
     url_fmt = 'http://quotes.money.163.com/f10/{type}_{stock_code}.html'
     url = url_fmt.format(stock_code=stock_code, type=type_)
-    response = get_page_response(url, 'post')
-    soup = BeautifulSoup(response.text, 'lxml')
+    return url, target_num
+
+
+def _parse_report_periods(text, target_num):
+    """解析报告期网页内容（str）"""
+    result = {}
+    soup = BeautifulSoup(text, 'lxml')
     ss = soup.find_all('select', {'id': '', 'name': ''})
     # 找到对应的选项父节点
     target = ss[target_num]
@@ -336,7 +353,20 @@ def fetch_report_periods(stock_code, query):
     return result
 
 
-@friendly_download()
+@lru_cache(None)
+def fetch_report_periods(stock_code, query):
+    """
+    下载股东持股、基金持股时，网络已有可供下载的期间
+
+    返回：dict对象
+        键：期末日期 eg 2017-06-30
+        值：2017-06-30,2017-03-31
+    """
+    url, target_num = _report_periods_url(stock_code, query)
+    response = get_page_response(url, 'post')
+    return _parse_report_periods(response.text, target_num)
+
+
 def fetch_top10_stockholder(stock_code, query_date, type_='c'):
     """
     给定股票代码、期末日期、数据类型，返回股东数据
@@ -407,11 +437,12 @@ def fetch_top10_stockholder(stock_code, query_date, type_='c'):
     # df = pd.read_html(url, encoding='utf-8', header=0, skiprows=range(1))[0]
     attrs = {'class': 'table_bg001 border_box limit_sale'}
     # 必须使用html5lib解析
-    df = pd.read_html(url, encoding='utf-8', attrs=attrs, flavor='html5lib')[0]
+    response = get_page_response(url)
+    df = pd.read_html(BytesIO(response.content), encoding='utf-8',
+                      attrs=attrs, flavor='html5lib')[0]
     return df
 
 
-@friendly_download()
 def fetch_jjcg(stock_code, query_date):
     """
     给定股票代码、期末日期，返回基金持股数据
@@ -442,22 +473,30 @@ def fetch_jjcg(stock_code, query_date):
     3  华宝兴业宝康配置混合         0      0.00            退出       0      0
 
     """
+    periods = fetch_report_periods(stock_code, 'jjcg')
+    url = _jjcg_url(stock_code, query_date, periods)
+    response = get_page_response(url)
+    return _parse_jjcg(response.json())
+
+
+def _jjcg_url(stock_code, query_date, periods):
+    """基金持股网址。如查询日期不在可选期间，触发NoWebData异常"""
     query_date_str = pd.Timestamp(query_date).strftime('%Y-%m-%d')
     url_fmt = 'http://quotes.money.163.com/service/{}.html?{}date={}%2C{}&symbol={}'
     query_type = 'jjcg'
     prefix = ''
-    periods = fetch_report_periods(stock_code, query_type)
     if query_date_str not in periods.keys():
         raise NoWebData('不存在股票{}报告期为："{}"的基金持股数据'.format(
             stock_code, query_date_str))
     from_date_str = periods[query_date_str].split(',')[1]
-    url = url_fmt.format(query_type, prefix,
-                         query_date_str, from_date_str,
-                         stock_code)
-    response = get_page_response(url)
-    table = response.json()
-    df = pd.read_html(table['table'], header=0, skiprows=range(1))[0]
-    return df
+    return url_fmt.format(query_type, prefix,
+                          query_date_str, from_date_str,
+                          stock_code)
+
+
+def _parse_jjcg(table):
+    """解析基金持股json数据"""
+    return pd.read_html(table['table'], header=0, skiprows=range(1))[0]
 
 
 def fetch_margin_data(query_date):
@@ -493,7 +532,8 @@ def fetch_margin_data(query_date):
     url_fmt = "http://quotes.money.163.com/data/margintrade,{}.html"
     date_str = query_date.strftime('%Y%m%d')
     url = url_fmt.format(date_str)
-    df = pd.read_html(url)[2].iloc[:, _WY_MARGIN_DATA_USE_COLS]
+    response = get_page_response(url)
+    df = pd.read_html(BytesIO(response.content))[2].iloc[:, _WY_MARGIN_DATA_USE_COLS]
     df.columns = _WY_MARGIN_DATA_COL_NAMES
     df.insert(1, '日期', query_date.date())
     return df
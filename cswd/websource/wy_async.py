@@ -0,0 +1,224 @@
+"""
+网易数据异步下载模块
+
+与`wy`模块中的同名函数对应，使用异步HTTP客户端共享连接池，
+在单个进程中同时下载大量代码的数据（如初始化股票日线）。
+
+数据类别：
+    股票指数交易数据            fetch_history, gather_history
+    财务指标                  fetch_financial_indicator
+    财务报表                  fetch_financial_report
+    基金持股                  fetch_jjcg
+
+说明：
+    解析过程与同步版本共用，结果一致；
+    与同步版本共享各主机限速器，另按主机限制同时进行的请求数量。
+
+Example
+-------
+>>> import asyncio
+>>> loop = asyncio.get_event_loop()
+>>> dfs = loop.run_until_complete(gather_history(['000001', '000002'], '2018-1-1'))
+>>> sorted(dfs.keys())
+['000001', '000002']
+"""
+import asyncio
+import json
+
+import aiohttp
+import logbook
+
+from ..common.utils import get_server_name
+from .base import MAX_SLEEP, THROTTLED_STATUS, get_limiter
+from .exceptions import ConnectFailed
+from .wy import (_cwzb_url, _history_url, _jjcg_url, _parse_financial_indicator,
+                 _parse_financial_report, _parse_history, _parse_jjcg,
+                 _parse_report_periods, _report_periods_url, _report_url)
+
+# 总连接数
+DEFAULT_LIMIT = 100
+# 各主机同时进行的请求数量。主机 -> 请求数量
+HOST_CONCURRENCY = {
+    'quotes.money.163.com': 16,
+}
+DEFAULT_CONCURRENCY = 8
+
+logger = logbook.Logger('网易异步')
+
+
+class AsyncClient(object):
+    """
+    网易数据异步下载客户端
+
+    Parameters
+    ----------
+    limit : int
+        连接池总连接数
+    timeout : float
+        单次请求超时（秒）
+
+    Example
+    -------
+    >>> async def main():
+    ...     async with AsyncClient() as client:
+    ...         return await client.fetch_history('000001', '2018-1-1')
+    """
+
+    def __init__(self, limit=DEFAULT_LIMIT, timeout=30):
+        self._limit = limit
+        self._timeout = timeout
+        self._session = None
+        self._semaphores = {}
+        self._periods = {}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self._limit)
+        timeout = aiohttp.ClientTimeout(total=self._timeout)
+        self._session = aiohttp.ClientSession(connector=connector,
+                                              timeout=timeout)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+        self._session = None
+
+    def _semaphore(self, server):
+        semaphore = self._semaphores.get(server)
+        if semaphore is None:
+            n = HOST_CONCURRENCY.get(server, DEFAULT_CONCURRENCY)
+            semaphore = asyncio.Semaphore(n)
+            self._semaphores[server] = semaphore
+        return semaphore
+
+    async def _request(self, url, method='GET'):
+        """请求网址，返回(bytes, str编码)"""
+        server = get_server_name(url)
+        limiter = get_limiter(server)
+        async with self._semaphore(server):
+            for i in range(3):
+                wait = limiter.try_acquire()
+                while wait:
+                    await asyncio.sleep(wait)
+                    wait = limiter.try_acquire()
+                try:
+                    async with self._session.request(method, url) as r:
+                        if r.status == 200:
+                            limiter.recover()
+                            return await r.read(), r.get_encoding()
+                        if r.status in THROTTLED_STATUS:
+                            rate = limiter.backoff()
+                            logger.info('第{}次尝试。主机"{}"限制访问（{}），速率降低至每秒{:.2f}次'.format(
+                                i + 1, server, r.status, rate))
+                            continue
+                except aiohttp.ClientConnectionError:
+                    logger.info('第{}次尝试。无法连接服务器：{}'.format(i + 1, server))
+                    await asyncio.sleep(MAX_SLEEP)
+                    continue
+                except Exception as e:
+                    logger.info('第{}次尝试。错误：{}'.format(i + 1, e.args))
+                await asyncio.sleep(0.1)
+        raise ConnectFailed('三次尝试失败。服务器：{}'.format(server))
+
+    async def fetch_history(self, code, start, end=None, is_index=False):
+        """获取股票或者指数的历史交易数据（不复权）"""
+        url = _history_url(code, start, end, is_index)
+        content, _ = await self._request(url)
+        return _parse_history(content)
+
+    async def fetch_financial_indicator(self, code, report_type, part):
+        """财务指标。参数参考`wy.fetch_financial_indicator`"""
+        assert report_type in ('report', 'year', 'season')
+        assert part in ('zhzb', 'ylnl', 'chnl', 'cznl', 'yynl')
+        url = _cwzb_url(code, report_type, part)
+        content, _ = await self._request(url)
+        return _parse_financial_indicator(content)
+
+    async def fetch_financial_report(self, code, report_type, report_item):
+        """财务报表。参数参考`wy.fetch_financial_report`"""
+        assert report_type in ('report', 'year')
+        assert report_item in ('lrb', 'zcfzb', 'xjllb')
+        url = _report_url(code, report_type, report_item)
+        content, _ = await self._request(url)
+        return _parse_financial_report(content)
+
+    async def fetch_report_periods(self, stock_code, query):
+        """网络已有可供下载的期间。参考`wy.fetch_report_periods`"""
+        key = (stock_code, query)
+        if key not in self._periods:
+            url, target_num = _report_periods_url(stock_code, query)
+            content, encoding = await self._request(url, 'POST')
+            text = content.decode(encoding, errors='replace')
+            self._periods[key] = _parse_report_periods(text, target_num)
+        return self._periods[key]
+
+    async def fetch_jjcg(self, stock_code, query_date):
+        """
+        给定股票代码、期末日期，返回基金持股数据
+
+        如果查询日期不在可选期间，触发NoWebData异常
+        """
+        periods = await self.fetch_report_periods(stock_code, 'jjcg')
+        url = _jjcg_url(stock_code, query_date, periods)
+        content, encoding = await self._request(url)
+        table = json.loads(content.decode(encoding, errors='replace'))
+        return _parse_jjcg(table)
+
+    async def gather_history(self, codes, start, end=None, is_index=False, failed=None):
+        """
+        同时下载多个代码的历史交易数据
+
+        单个代码下载失败时，记录日志，不影响其余代码
+
+        Parameters
+        ----------
+        failed : dict
+            可选。传入时以下载失败的代码 -> 异常更新该字典
+
+        Returns
+        -------
+        res : dict
+            代码 -> DataFrame，不含下载失败的代码
+        """
+        codes = list(codes)
+        tasks = [self.fetch_history(code, start, end, is_index)
+                 for code in codes]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        dfs = {}
+        for code, res in zip(codes, results):
+            if isinstance(res, Exception):
+                logger.warn('代码{}下载失败：{}'.format(code, res))
+                if failed is not None:
+                    failed[code] = res
+            elif isinstance(res, BaseException):
+                # 任务取消等
+                raise res
+            else:
+                dfs[code] = res
+        return dfs
+
+
+async def gather_history(codes, start, end=None, is_index=False, limit=DEFAULT_LIMIT,
+                         failed=None):
+    """
+    同时下载多个代码的历史交易数据
+
+    Parameters
+    ----------
+    codes : list
+        股票或指数代码列表
+    start, end : date_like
+        期间
+    is_index : bool
+        是否为指数
+    limit : int
+        连接池总连接数
+    failed : dict
+        可选。传入时以下载失败的代码 -> 异常更新该字典
+
+    Returns
+    -------
+    res : dict
+        代码 -> DataFrame，与`wy.fetch_history`结果一致。不含下载失败的代码
+    """
+    async with AsyncClient(limit) as client:
+        return await client.gather_history(codes, start, end, is_index, failed)
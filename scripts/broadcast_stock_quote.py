@@ -0,0 +1,29 @@
+"""
+盘中广播股票报价
+
+运行唯一的报价轮询，供本机多个进程以`QuoteClient`订阅。
+盘前启动时等待至开盘后判断是否为交易日，收盘后自动退出。
+同时写入发生变化的报价，替代poll-stock-quote，二者不要同时运行。
+
+    >>> from cswd.tasks.quote_broadcast import QuoteClient
+    >>> df = QuoteClient().latest(timeout=10)
+"""
+import logbook
+from datetime import datetime
+
+from cswd.tasks.quote_broadcast import QuoteBroadcaster
+from cswd.tasks.stock_quote import wait_for_open
+
+logger = logbook.Logger('报价广播')
+
+
+def main():
+    today = datetime.today().date()
+    if wait_for_open():
+        QuoteBroadcaster(write=True).run()
+    else:
+        logger.info('{}非交易日'.format(today))
+
+
+if __name__ == '__main__':
+    main()
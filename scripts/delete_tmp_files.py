@@ -1,10 +1,19 @@
 """
-每周删除临时缓存文件
+每周删除临时文件
+
+说明：
+    删除日志文件；
+    网络缓存仅删除过期项目，并按最久未使用删除至不超过预算，保留有效缓存
 """
-from shutil import rmtree
 import os
 
+import logbook
+
 from cswd.common.utils import data_root
+from cswd.dataproxy import data_proxies  # 注册各数据代理，按其更新时间判断过期
+from cswd.dataproxy.cache import CacheManager
+
+logger = logbook.Logger('删除临时文件')
 
 
 def main():
@@ -13,9 +22,12 @@ def main():
     for fn in os.listdir(log_dir):
         p = os.path.join(log_dir, fn)
         os.remove(p)
-    # 删除网络cache文件
-    rmtree(data_root('webcache'))
+    # 清理网络cache文件
+    manager = CacheManager()
+    count, nbytes = manager.evict()
+    logger.info('删除网络缓存{}项，释放{}字节'.format(count, nbytes))
+    logger.info('网络缓存统计：\n{}'.format(manager.stats()))
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -13,11 +13,13 @@ from cswd.websource.juchao import fetch_announcement_summary
 def for_reports(df):
     """根据公告刷新定期报告相关数据"""
     from cswd.tasks.stock_shareholders import flush_shareholder
-    from cswd.tasks.financial_reports import flush_reports
+    from cswd.tasks.financial_reports import flush_reports, invalidate_reports
     # 可能含有Na
     codes = df.loc[df['类别'].str.contains('报告') == True, '股票代码'].unique()
     codes = sorted(filter_a(codes))
     flush_shareholder(codes)
+    # 财务报告缓存按周更新，先删除缓存
+    invalidate_reports(codes)
     flush_reports(codes)
 
 
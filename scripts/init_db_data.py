@@ -32,6 +32,7 @@ logbook.set_datetime_format('local')
 logbook.StreamHandler(sys.stdout).push_application()
 
 
+from cswd.sql.base import set_default_profile
 from cswd.tasks.tables import creat_tables
 from cswd.tasks.load_data import github_data_to_sql
 from cswd.tasks.trading_calendar import flush_trading_calendar
@@ -60,6 +61,8 @@ from cswd.tasks.sina_data_center import flush_sina_data
 logger = logbook.Logger('初始化数据')
 
 def main():
+    # 大批量写入
+    set_default_profile('bulk')
     creat_tables()
     logger.info('完整数据约12G，预计用时约24小时......')
     flush_stock_codes()
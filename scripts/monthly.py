@@ -6,7 +6,9 @@
 
 import pandas as pd
 from cswd.sql.base import get_session
-from cswd.sql.models import Quotation, DealDetail
+from cswd.sql.models import Quotation
+from cswd.sql.ticks import TickStore
+from cswd.tasks.stock_dealdetail import migrate_legacy
 
 
 def delete_old(sess):
@@ -14,9 +16,11 @@ def delete_old(sess):
     before_date = pd.Timestamp('today') - pd.Timedelta(days=30)
     sess.query(Quotation).filter(Quotation.date <=
                                  before_date.date()).delete(synchronize_session=False)
-    sess.query(DealDetail).filter(DealDetail.date <=
-                                  before_date.date()).delete(synchronize_session=False)
     sess.commit()
+    # 分时交易按交易日分文件存储，直接删除文件。早期版本写入数据库的分时交易先行迁移
+    store = TickStore()
+    migrate_legacy(store)
+    store.drop_before(before_date.date())
 
 
 def main():
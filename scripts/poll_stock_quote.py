@@ -0,0 +1,24 @@
+"""
+盘中连续刷新股票报价
+
+交易日9点前启动，等待至开盘后判断是否为交易日，收盘后自动退出。仅写入发生变化的报价。
+运行broadcast-stock-quote时无需运行本脚本，否则报价重复写入。
+"""
+import logbook
+from datetime import datetime
+
+from cswd.tasks.stock_quote import QuotePoller, wait_for_open
+
+logger = logbook.Logger('股票实时报价')
+
+
+def main():
+    today = datetime.today().date()
+    if wait_for_open():
+        QuotePoller().run()
+    else:
+        logger.info('{}非交易日'.format(today))
+
+
+if __name__ == '__main__':
+    main()
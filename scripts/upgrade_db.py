@@ -0,0 +1,28 @@
+"""
+升级已有数据库
+
+说明：
+    为已有数据表添加缺失的索引，删除已废弃的索引；
+    添加唯一索引前删除重复行（保留最后写入的行），删除的行逐行记录于日志。
+    运行前应停止其他写入数据库的计划任务
+"""
+import logbook
+
+from cswd.common.constants import DB_NAME
+from cswd.sql.base import db_path
+from cswd.sql.migrate import upgrade
+
+logger = logbook.Logger('数据库升级')
+
+
+def main():
+    path = db_path(DB_NAME)
+    added = upgrade(path)
+    if added:
+        logger.info('数据库{}升级完成，添加索引：{}'.format(path, '，'.join(added)))
+    else:
+        logger.info('数据库{}无需升级'.format(path))
+
+
+if __name__ == '__main__':
+    main()
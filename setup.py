@@ -35,6 +35,7 @@ setup(
     scripts=[
         'scripts/init_db_data.py', 
         'scripts/create_tables.py',
+        'scripts/upgrade_db.py',
         'scripts/before_trading.py',
         'scripts/flush_trading_calendar.py',    
         'scripts/daily.py',    
@@ -42,6 +43,8 @@ setup(
         'scripts/after_trading.py', 
         'scripts/flush_global_news.py',
         'scripts/flush_stock_quote.py',
+        'scripts/poll_stock_quote.py',
+        'scripts/broadcast_stock_quote.py',
         'scripts/weekly.py',            
         'scripts/monthly.py',       
         'scripts/delete_tmp_files.py',
@@ -50,10 +53,13 @@ setup(
     entry_points={
         'console_scripts': [
             'create-db-tables = create_tables:main',
+            'upgrade-db = upgrade_db:main',
             'init-stock-data = init_db_data:main',
             'before-trading = before_trading:main',
             'refresh-trading-calendar = flush_trading_calendar:main',            
             'refresh-stock-quote = flush_stock_quote:main',
+            'poll-stock-quote = poll_stock_quote:main',
+            'broadcast-stock-quote = broadcast_stock_quote:main',
             'daily-refresh = daily:main',
             'daily-refresh-notice = flush_by_notice:by_notice',
             'refresh-trading-data = after_trading:main',
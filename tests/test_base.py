@@ -0,0 +1,57 @@
+import time
+import unittest
+from unittest import mock
+
+from cswd.websource.base import (TokenBucket, limit_rate, get_limiter, set_rate_limit, MIN_RATE,
+                                 get_page_response)
+from cswd.websource.exceptions import FrequentAccess, NoWebData
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_burst_then_rate(self):
+        """测试突发请求无需等待，超出后按速率等待"""
+        bucket = TokenBucket(rate=20, burst=5)
+        start = time.monotonic()
+        for _ in range(5):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - start, 0.05)
+        for _ in range(4):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+
+    def test_backoff_and_recover(self):
+        """测试受限后降低速率，成功后逐步恢复"""
+        bucket = TokenBucket(rate=4, burst=1)
+        self.assertEqual(bucket.backoff(), 2)
+        for _ in range(100):
+            bucket.backoff()
+        self.assertEqual(bucket.rate, MIN_RATE)
+        for _ in range(200):
+            bucket.recover()
+        self.assertEqual(bucket.rate, 4)
+
+    def test_limit_rate_backoff_on_frequent_access(self):
+        """测试频繁访问异常触发主机退避"""
+        server = 'test.example.com'
+        set_rate_limit(server, 100, 10)
+
+        @limit_rate(server)
+        def fetch():
+            raise FrequentAccess()
+
+        with self.assertRaises(FrequentAccess):
+            fetch()
+        self.assertEqual(get_limiter(server).rate, 50)
+
+    def test_not_found(self):
+        """测试网页不存在时不再重试，触发无网页数据异常"""
+        session = mock.Mock()
+        session.request.return_value = mock.Mock(status_code=404)
+        with mock.patch('cswd.websource.base.get_http_session', return_value=session):
+            with self.assertRaises(NoWebData):
+                get_page_response('http://test.example.com/a.xls')
+        self.assertEqual(session.request.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,9 +2,14 @@ import unittest
 import pandas as pd
 from pandas.testing import assert_frame_equal
 import os
+import shutil
+import tempfile
 import time
+from unittest import mock
 
-from cswd.dataproxy.cache import DataProxy, last_modified_time
+from cswd.dataproxy import cache
+from cswd.dataproxy.cache import CacheManager, DataProxy, last_modified_time
+from cswd.websource.exceptions import NoWebData
 from cswd.websource.wy import fetch_history
 from cswd.websource.fenghuang import fetch_gpgk
 
@@ -48,15 +53,16 @@ class Test_cache(unittest.TestCase):
         assert_frame_equal(df_1, df_2)
 
     def test_cache_file_name(self):
-        # 使用函数默认值时，尽管意义相同，结果一样，hash表示不一样
-        # 最终导致存储路径发生变化而重复下载
-        # 使用数据代理类时，要注意保持函数参数写法的一致性
+        # 按函数签名绑定参数并应用默认值，意义相同的写法使用同一存储路径
         same_kwargs = {'code': '000001',
                        'start': '2017-11-10', 'end': '2017-11-21'}
         path_1 = self.reader.get_cache_file_path(**self.kwargs)
         path_2 = self.reader.get_cache_file_path(**same_kwargs)
+        path_3 = self.reader.get_cache_file_path(
+            '000001', pd.Timestamp('2017-11-10'), '2017/11/21')
 
-        self.assertNotEqual(path_1, path_2)
+        self.assertEqual(path_1, path_2)
+        self.assertEqual(path_1, path_3)
 
         df_1 = self.reader.read(**self.kwargs)
         df_2 = self.reader.read(**same_kwargs)
@@ -64,5 +70,157 @@ class Test_cache(unittest.TestCase):
         assert_frame_equal(df_1, df_2)
 
 
+class Test_expiration(unittest.TestCase):
+    def _expires_at(self, freq, last_time):
+        reader = DataProxy(fetch_history, '18:00:00', freq)
+        return reader.expires_at(pd.Timestamp(last_time, tz='Asia/Shanghai'))
+
+    def test_daily(self):
+        # 更新时间之前写入，当日过期；之后写入，下一工作日过期
+        self.assertEqual(self._expires_at('D', '2018-4-4 10:00'),
+                         pd.Timestamp('2018-4-4 18:00', tz='Asia/Shanghai'))
+        self.assertEqual(self._expires_at('D', '2018-4-6 19:00'),
+                         pd.Timestamp('2018-4-9 18:00', tz='Asia/Shanghai'))
+
+    def test_weekly(self):
+        self.assertEqual(self._expires_at('W', '2018-4-4 10:00'),
+                         pd.Timestamp('2018-4-9 18:00', tz='Asia/Shanghai'))
+
+
+class Test_cache_manager(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+        def fetch_a(x):
+            return b'a' * 1000
+
+        def fetch_b(x):
+            return b'b' * 1000
+
+        with mock.patch.object(cache, 'TEMP_DIR', self.root):
+            self.reader_a = DataProxy(fetch_a, '00:00:00')
+            self.reader_b = DataProxy(fetch_b, '00:00:00', store='sqlite')
+        self.manager = CacheManager(root=self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_evict_lru(self):
+        for i in range(3):
+            self.reader_a.read(i)
+            time.sleep(0.01)
+        # 访问第一项后，最久未使用的是第二项
+        self.reader_a.read(0)
+        stats = self.manager.stats()
+        self.assertEqual(stats.loc['fetch_a', '项目数'], 3)
+        total = self.manager.total_bytes()
+        removed, freed = self.manager.evict(total - 1)
+        self.assertEqual(removed, 1)
+        keys = [e.key for e in self.reader_a.store.entries()]
+        self.assertNotIn(self.reader_a.get_cache_key(1), keys)
+        self.assertIn(self.reader_a.get_cache_key(0), keys)
+
+    def test_evict_expired(self):
+        self.reader_b.read(0)
+        with mock.patch.object(self.reader_b, 'is_expired', lambda t: True):
+            stats = self.manager.stats()
+            self.assertEqual(stats.loc['fetch_b', '过期项目数'], 1)
+            removed, _ = self.manager.evict()
+        self.assertEqual(removed, 1)
+        self.assertEqual(self.reader_b.store.entries(), [])
+
+
+class Test_stale_while_revalidate(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.calls = 0
+
+        def fetch_value(x):
+            self.calls += 1
+            if self.calls > 1:
+                time.sleep(0.2)
+            return self.calls
+
+        with mock.patch.object(cache, 'TEMP_DIR', self.root):
+            self.reader = DataProxy(fetch_value, stale_while_revalidate=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_serve_stale(self):
+        self.assertEqual(self.reader.read(1), 1)
+        with mock.patch.object(self.reader, 'is_expired', lambda t: True):
+            # 立即返回过期数据，后台重新下载
+            start = time.time()
+            self.assertEqual(self.reader.read(1), 1)
+            self.assertLess(time.time() - start, 0.2)
+            time.sleep(0.4)
+        self.assertEqual(self.reader.read(1), 2)
+        self.assertEqual(self.calls, 2)
+
+    def test_revalidate_not_daemon(self):
+        """测试后台下载线程为非守护线程，进程退出前完成下载"""
+        self.reader.read(1)
+        with mock.patch.object(self.reader, 'is_expired', lambda t: True):
+            thread = self.reader._revalidate(self.reader.get_cache_key(1), (1,), {})
+            self.assertFalse(thread.daemon)
+            thread.join()
+        self.assertEqual(self.reader.read(1), 2)
+
+
+class Test_negative_cache(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.calls = 0
+
+        def fetch_none(x):
+            self.calls += 1
+            raise NoWebData('无数据：{}'.format(x))
+
+        with mock.patch.object(cache, 'TEMP_DIR', self.root):
+            self.reader = DataProxy(fetch_none, negative_ttl=3600)
+            self.no_cache_reader = DataProxy(fetch_none)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_reraise_from_cache(self):
+        for _ in range(2):
+            with self.assertRaisesRegex(NoWebData, '无数据：1'):
+                self.reader.read(1)
+        self.assertEqual(self.calls, 1)
+        # 超出有效期后重新请求
+        with mock.patch.object(self.reader, '_negative_ttl', 0):
+            with self.assertRaises(NoWebData):
+                self.reader.read(1)
+        self.assertEqual(self.calls, 2)
+
+    def test_negative_only(self):
+        """测试仅缓存无数据结果，有数据时每次下载且不存储"""
+        calls = []
+
+        def fetch_ticks(x):
+            calls.append(x)
+            if x == 0:
+                raise NoWebData('无数据：{}'.format(x))
+            return pd.DataFrame({'价格': [1.0] * x})
+
+        with mock.patch.object(cache, 'TEMP_DIR', self.root):
+            reader = DataProxy(fetch_ticks, negative_ttl=3600, negative_only=True,
+                               memory_limit=1024 * 1024)
+        for _ in range(2):
+            self.assertEqual(len(reader.read(2)), 2)
+            with self.assertRaises(NoWebData):
+                reader.read(0)
+        self.assertListEqual(calls, [2, 0, 2])
+        self.assertEqual(len(reader.store.entries()), 1)
+
+    def test_disabled(self):
+        for _ in range(2):
+            with self.assertRaises(NoWebData):
+                self.no_cache_reader.read(2)
+        self.assertEqual(self.calls, 2)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,80 @@
+import datetime
+import os
+import unittest
+from unittest import mock
+
+from cswd.sql.base import session_scope
+from cswd.sql.models import DealDetail, StockDaily
+from cswd.sql.ticks import TickStore
+from cswd.tasks import stock_dealdetail
+from cswd.tasks.stock_dealdetail import _plan, flush, migrate_legacy
+from cswd.websource.exceptions import NoWebData
+
+from test_stock_daily import DatabaseTestCase
+from test_ticks import _cjmx
+
+D1 = datetime.date(2018, 4, 2)
+D2 = datetime.date(2018, 4, 3)
+
+
+class TestDealDetail(DatabaseTestCase):
+    def setUp(self):
+        super(TestDealDetail, self).setUp()
+        # 000002于D1停牌；000003不在刷新范围内
+        volumes = {('000001', D1): 100, ('000001', D2): 100,
+                   ('000002', D1): 0, ('000002', D2): 100,
+                   ('000003', D1): 100, ('000003', D2): 100}
+        with session_scope() as sess:
+            sess.add_all([StockDaily(code=code, date=d, A001_名称=code, A006_成交量=v)
+                          for (code, d), v in volumes.items()])
+        self.store = TickStore(os.path.join(self.root, 'ticks'))
+        self.store.write(D1, {'000001': _cjmx(['09:30:00'], [10.0], ['买盘'])})
+        self.codes = ['000001', '000002']
+
+    def test_plan(self):
+        """测试仅下载有交易、尚未存储且在刷新范围内的（代码，日期）"""
+        plans = _plan(self.codes, [D1, D2], self.store)
+        self.assertListEqual(plans, [('000001', D2), ('000002', D2)])
+        self.assertListEqual(_plan(self.codes, [], self.store), [])
+
+    def test_flush(self):
+        calls = []
+
+        def read(code, d):
+            calls.append((code, d))
+            if code == '000002':
+                raise NoWebData('无数据')
+            return _cjmx(['09:30:00', '09:30:03'], [10.0, 10.1], ['买盘', '卖盘'])
+
+        with mock.patch.object(stock_dealdetail, 'cjmx_reader', mock.Mock(read=read)), \
+                mock.patch.object(stock_dealdetail, 'log_to_db'):
+            flush(self.codes, [(D1,), (D2,)], max_workers=2, store=self.store)
+        self.assertListEqual(sorted(calls), [('000001', D2), ('000002', D2)])
+        self.assertSetEqual(self.store.codes(D1), {'000001'})
+        self.assertSetEqual(self.store.codes(D2), {'000001'})
+        self.assertEqual(len(self.store.read('000001', D2, D2)), 2)
+
+    def _add_legacy(self, code, d, times):
+        with session_scope() as sess:
+            sess.add_all([DealDetail(code=code, date=d, A001_时间=t, A002_价格=9.0,
+                                     A003_涨跌额=0.01, A004_成交量=100, A005_成交额=900.0,
+                                     A006_方向='中性盘') for t in times])
+
+    def test_migrate_legacy(self):
+        """测试早期数据库数据迁移至列式存储，已存储的（代码，日期）以列式存储为准"""
+        self._add_legacy('000002', D2, ['09:31:00', '09:30:00'])
+        self._add_legacy('000001', D1, ['10:00:00'])
+        self.assertEqual(migrate_legacy(self.store), 2)
+        df = self.store.read('000002')
+        self.assertListEqual(list(df['时间']), ['09:30:00', '09:31:00'])
+        self.assertListEqual(list(df['方向']), ['中性盘'] * 2)
+        self.assertListEqual(list(self.store.read('000001', D1, D1)['价格']), [10.0])
+        with session_scope() as sess:
+            self.assertEqual(sess.query(DealDetail).count(), 0)
+        self.assertEqual(migrate_legacy(self.store), 0)
+        # 已迁移的（代码，日期）不再下载
+        self.assertListEqual(_plan(self.codes, [D1, D2], self.store), [('000001', D2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
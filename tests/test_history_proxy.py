@@ -0,0 +1,89 @@
+import shutil
+import tempfile
+import unittest
+from datetime import date
+from unittest import mock
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from cswd.dataproxy import cache
+from cswd.dataproxy.history import HistoryProxy
+from cswd.load import load_csv
+
+
+class Test_history_proxy(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.full = load_csv('000333.csv', kwargs={'index_col': 0,
+                                                   'parse_dates': True})
+        self.calls = []
+        # 网站已有数据的最后日期
+        self.last_bar = self.full.index.max()
+
+        def fetch_history(code, start, end=None, is_index=False):
+            self.calls.append((str(start), str(end)))
+            index = self.full.index
+            end = min(pd.Timestamp(end), self.last_bar)
+            return self.full[(index >= pd.Timestamp(start)) & (index <= end)]
+
+        with mock.patch.object(cache, 'TEMP_DIR', self.root):
+            self.reader = HistoryProxy(fetch_history)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _expected(self, start, end):
+        index = self.full.index
+        return self.full[(index >= start) & (index <= end)].sort_index(ascending=False)
+
+    def test_fetch_missing_only(self):
+        self.reader.read('000333', '2017-6-1', '2017-12-31')
+        self.reader.read('000333', '2017-6-1', '2018-3-1')
+        self.reader.read('000333', '2017-1-1', '2018-3-1')
+        df = self.reader.read('000333', '2017-3-1', '2017-9-1')
+        # 仅下载新增的尾部及头部期间
+        self.assertEqual(self.calls, [('2017-06-01', '2017-12-31'),
+                                      ('2018-01-01', '2018-03-01'),
+                                      ('2017-01-01', '2017-05-31')])
+        assert_frame_equal(df, self._expected('2017-03-01', '2017-09-01'))
+
+    def test_unpublished_tail(self):
+        """测试未发布期间在同一更新周期内只下载一次"""
+        published = mock.patch.object(self.reader, '_published_date')
+        with published as published_date:
+            published_date.return_value = date(2018, 3, 1)
+            self.reader.read('000333', '2018-2-1', '2018-3-2')
+            for _ in range(3):
+                df = self.reader.read('000333', '2018-2-1', '2018-3-2')
+            # 到达下一更新时间后，重新下载未发布期间
+            published_date.return_value = date(2018, 3, 2)
+            self.reader.read('000333', '2018-2-1', '2018-3-2')
+            self.reader.read('000333', '2018-2-1', '2018-3-2')
+        self.assertEqual(self.calls, [('2018-02-01', '2018-03-02'),
+                                      ('2018-03-02', '2018-03-02')])
+        assert_frame_equal(df, self._expected('2018-02-01', '2018-03-02'))
+
+    def test_short_tail(self):
+        """测试已发布日期当日网站尚无数据时，不计入覆盖期间，下次读取重新下载"""
+        self.last_bar = pd.Timestamp('2018-03-01')
+        with mock.patch.object(self.reader, '_published_date') as published_date:
+            published_date.return_value = date(2018, 3, 2)
+            self.reader.read('000333', '2018-2-1', '2018-3-2')
+            self.reader.read('000333', '2018-2-1', '2018-3-2')
+            # 网站发布后读取到当日数据，此后不再下载
+            self.last_bar = self.full.index.max()
+            self.reader.read('000333', '2018-2-1', '2018-3-2')
+            df = self.reader.read('000333', '2018-2-1', '2018-3-2')
+        self.assertEqual(self.calls, [('2018-02-01', '2018-03-02'),
+                                      ('2018-03-02', '2018-03-02'),
+                                      ('2018-03-02', '2018-03-02')])
+        assert_frame_equal(df, self._expected('2018-02-01', '2018-03-02'))
+
+    def test_invalid_dates(self):
+        with self.assertRaises(ValueError):
+            self.reader.read('000333', '2018-1-2', '2018-1-1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import datetime
+import unittest
+
+from cswd.sql.base import ShareholderType, session_scope
+from cswd.sql.models import Issue, Shareholder, StockDaily
+from cswd.tasks.utils import get_ipo_dates, last_dates
+
+from test_stock_daily import DatabaseTestCase
+
+
+def _date(day):
+    return datetime.date(2018, 4, day)
+
+
+class TestLastDates(DatabaseTestCase):
+    def setUp(self):
+        super(TestLastDates, self).setUp()
+        with session_scope() as sess:
+            sess.add_all([StockDaily(code=code, date=_date(day), A001_名称=code)
+                          for code, day in (('000001', 2), ('000001', 4), ('000002', 3))])
+            sess.add_all([Shareholder(code=code, date=_date(day), A001_股东类型=type_)
+                          for code, day, type_ in (('000001', 2, ShareholderType.main),
+                                                   ('000001', 3, ShareholderType.fund),
+                                                   ('000002', 4, ShareholderType.fund))])
+            sess.add_all([Issue(code='000001', A004_上市日期=datetime.date(1991, 4, 3)),
+                          Issue(code='000002', A004_上市日期=datetime.date(1991, 1, 29)),
+                          Issue(code='300999')])
+
+    def test_last_dates(self):
+        self.assertDictEqual(last_dates(StockDaily),
+                             {'000001': _date(4), '000002': _date(3)})
+
+    def test_last_dates_filters(self):
+        """测试按类属性限定查询范围"""
+        self.assertDictEqual(last_dates(Shareholder, A001_股东类型=ShareholderType.main),
+                             {'000001': _date(2)})
+        self.assertDictEqual(last_dates(Shareholder, A001_股东类型=ShareholderType.fund),
+                             {'000001': _date(3), '000002': _date(4)})
+        self.assertDictEqual(last_dates(Shareholder, A001_股东类型=ShareholderType.circulating),
+                             {})
+
+    def test_ipo_dates(self):
+        """测试尚未上市（上市日期为空）的股票不包含在内"""
+        self.assertDictEqual(get_ipo_dates(), {'000001': datetime.date(1991, 4, 3),
+                                               '000002': datetime.date(1991, 1, 29)})
+
+
+if __name__ == '__main__':
+    unittest.main()
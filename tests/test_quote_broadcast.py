@@ -0,0 +1,103 @@
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from multiprocessing.connection import Client
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from cswd.tasks.quote_broadcast import AUTHKEY, QuoteBroadcaster, QuoteClient
+
+from test_quote_poller import _quotes
+
+
+@unittest.skipIf(sys.platform == 'win32', '使用Unix套接字')
+class TestQuoteBroadcast(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        address = os.path.join(self.root, 'quotes.sock')
+        self.broadcaster = QuoteBroadcaster(address=address, codes=['000001', '000002'],
+                                            max_workers=1)
+        self.broadcaster.start()
+        self.clients = []
+
+    def tearDown(self):
+        for client in self.clients:
+            client.close()
+        self.broadcaster.close()
+        shutil.rmtree(self.root)
+
+    def _client(self):
+        client = QuoteClient(self.broadcaster.address)
+        self.clients.append(client)
+        return client
+
+    def _wait(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def test_fan_out(self):
+        """测试一次刷新，全部订阅方收到相同报价"""
+        first, second = self._client(), self._client()
+        self.assertIsNone(first.latest())
+        fetch = mock.Mock(side_effect=lambda codes: _quotes(codes, '09:30:00', 100))
+        with mock.patch('cswd.tasks.stock_quote.fetch_quote_batch', fetch):
+            self.broadcaster.poll()
+        self.assertEqual(fetch.call_count, 1)
+        for client in (first, second):
+            assert_frame_equal(client.latest(timeout=5), self.broadcaster.latest)
+            self.assertEqual(client.snapshot().seq, 1)
+
+    def test_late_subscriber(self):
+        """测试新的订阅方立即收到最近一次报价"""
+        with mock.patch('cswd.tasks.stock_quote.fetch_quote_batch',
+                        lambda codes: _quotes(codes, '09:30:00', 100)):
+            self.broadcaster.poll()
+        client = self._client()
+        self.assertEqual(len(client.latest(timeout=5)), 2)
+
+    def test_disconnect(self):
+        """测试广播方关闭后，订阅方连接失效"""
+        client = self._client()
+        self.broadcaster.close()
+        self.assertIsNone(client.latest(timeout=5))
+        self.assertFalse(client.connected)
+
+    def test_slow_subscriber(self):
+        """测试不读取的订阅方不阻塞广播及其他订阅方，发送停滞超时后被断开"""
+        slow = Client(self.broadcaster.address, authkey=AUTHKEY)
+        self.addCleanup(slow.close)
+        fast = self._client()
+        self.assertTrue(self._wait(lambda: self.broadcaster.subscribers == 2))
+        # 单次报价远大于套接字缓冲区，向不读取的订阅方发送将一直阻塞
+        data = pd.DataFrame({'现价': np.arange(500000, dtype=float)})
+        start = time.monotonic()
+        for _ in range(5):
+            self.broadcaster.publish(data)
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertTrue(self._wait(
+            lambda: fast.snapshot() is not None and fast.snapshot().seq == 5))
+        self.assertEqual(self.broadcaster.subscribers, 2)
+        with mock.patch('cswd.tasks.quote_broadcast.SEND_TIMEOUT', 0.1):
+            time.sleep(0.2)
+            self.broadcaster.publish(data)
+        self.assertEqual(self.broadcaster.subscribers, 1)
+        self.assertTrue(self._wait(lambda: fast.snapshot().seq == 6))
+        self.assertTrue(fast.connected)
+
+    def test_default_no_write(self):
+        self.assertFalse(self.broadcaster.write)
+        self.assertFalse(QuoteBroadcaster(address='', codes=['000001']).write)
+
+
+if __name__ == '__main__':
+    unittest.main()
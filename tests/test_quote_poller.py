@@ -0,0 +1,159 @@
+import threading
+import unittest
+from datetime import datetime
+from unittest import mock
+
+import pandas as pd
+
+from cswd.common.constants import QUOTE_COLS
+from cswd.tasks import stock_quote
+from cswd.tasks.stock_quote import (QuotePoller, in_session, min_interval, to_records,
+                                    wait_for_open)
+from cswd.websource.sina import fetch_quotes
+
+
+def _quotes(codes, time_, volume):
+    data = {col: 1.0 for col in QUOTE_COLS}
+    df = pd.DataFrame([data] * len(codes), columns=QUOTE_COLS)
+    df['股票代码'] = codes
+    df['股票简称'] = codes
+    df['日期'] = pd.Timestamp('2018-04-04')
+    df['时间'] = time_
+    df['成交量'] = volume
+    return df
+
+
+class FakeSina(object):
+    """模拟`hq.sinajs.cn`，记录请求次数"""
+
+    def __init__(self):
+        self.urls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, url, *args, **kwargs):
+        with self._lock:
+            self.urls.append(url)
+        fields = ['股票'] + ['1.0'] * 7 + ['100', '1.0'] + ['100', '1.0'] * 10 + \
+            ['2018-04-04', '09:30:00', '00']
+        lines = ['var hq_str_{}="{}";'.format(code, ','.join(fields))
+                 for code in url.split('list=')[1].split(',')]
+        return mock.Mock(text='\n'.join(lines))
+
+
+def _codes(n):
+    return [str(i).zfill(6) for i in range(1, n + 1)]
+
+
+class TestQuotePoller(unittest.TestCase):
+    def test_changes(self):
+        """测试仅返回时间或成交量变化的报价"""
+        poller = QuotePoller(['000001', '000002', '000003'], batch_size=2,
+                             max_workers=2, write=False)
+        state = {'time': '09:30:00', 'volume': 100}
+
+        def fetch(codes):
+            df = _quotes(codes, state['time'], state['volume'])
+            # 000002成交量随时间变化，其余不变
+            df.loc[df['股票代码'] == '000002', '成交量'] = state['volume'] * 2
+            df.loc[df['股票代码'] != '000002', ['时间', '成交量']] = ['09:30:00', 100]
+            return df
+
+        with mock.patch('cswd.tasks.stock_quote.fetch_quote_batch', fetch):
+            self.assertEqual(len(poller.poll()), 3)
+            self.assertEqual(len(poller.poll()), 0)
+            state.update(time='09:30:03', volume=200)
+            changed = poller.poll()
+        self.assertListEqual(list(changed['股票代码']), ['000002'])
+        self.assertEqual(len(poller.latest), 3)
+        stats = poller.stats()
+        self.assertEqual(stats.count, 3)
+        self.assertGreaterEqual(stats.max, stats.mean)
+
+    def test_duplicate_codes(self):
+        """测试去除重复代码，报价中重复的代码不影响比较"""
+        poller = QuotePoller(['000002', '000001', '000002'], write=False)
+        self.assertListEqual(poller.codes, ['000002', '000001'])
+        df = _quotes(['000001', '000001', '000002'], '09:30:00', 100)
+        self.assertEqual(len(poller.changes(df)), 2)
+        df.loc[1, '成交量'] = 200
+        self.assertListEqual(list(poller.changes(df)['股票代码']), ['000001'])
+
+    def test_to_records_missing(self):
+        """测试缺失字段转换为None，量为python整数"""
+        with mock.patch('cswd.websource.sina.get_page_response', FakeSina()):
+            df = fetch_quotes(['000001', '000002'])
+        df.loc[1, '买1量'] = pd.NA
+        df.loc[1, '现价'] = float('nan')
+        records = to_records(df)
+        self.assertIs(type(records[0]['买1量']), int)
+        self.assertIsNone(records[1]['买1量'])
+        self.assertIsNone(records[1]['现价'])
+        # 成交量缺失时视为变化
+        poller = QuotePoller(['000001', '000002'], write=False)
+        self.assertEqual(len(poller.changes(df)), 2)
+        df['成交量'] = df['成交量'].astype('Int64')
+        df.loc[1, '成交量'] = pd.NA
+        self.assertListEqual(list(poller.changes(df)['股票代码']), ['000002'])
+
+    def test_requests_per_poll(self):
+        """测试每批股票只请求一次"""
+        sina = FakeSina()
+        poller = QuotePoller(_codes(1700), max_workers=2, write=False)
+        with mock.patch('cswd.websource.sina.get_page_response', sina):
+            self.assertEqual(len(poller.poll()), 1700)
+            self.assertEqual(len(sina.urls), 3)
+            # 恰为整批时不发出多余的空请求
+            self.assertEqual(len(fetch_quotes(_codes(800))), 800)
+            self.assertEqual(len(sina.urls), 4)
+            self.assertEqual(len(fetch_quotes([])), 0)
+            self.assertEqual(len(sina.urls), 4)
+
+    def test_interval_within_rate_limit(self):
+        """测试刷新间隔不低于按主机限速完成一次刷新所需时间"""
+        small = QuotePoller(_codes(3800), interval=3, write=False)
+        self.assertEqual(small.interval, 3)
+        self.assertLessEqual(min_interval(5), 3)
+        large = QuotePoller(_codes(8000), interval=3, write=False)
+        self.assertEqual(large.interval, min_interval(10))
+        self.assertGreater(large.interval, 3)
+
+    def test_in_session(self):
+        self.assertTrue(in_session(datetime(2018, 4, 4, 10, 0)))
+        self.assertFalse(in_session(datetime(2018, 4, 4, 12, 0)))
+        self.assertFalse(in_session(datetime(2018, 4, 4, 15, 30)))
+
+
+class TestWaitForOpen(unittest.TestCase):
+    def _wait(self, times, trading):
+        """按`times`依次返回当前时间，返回(结果, 等待秒数列表, 判断次数)"""
+        clock = mock.Mock(wraps=datetime)
+        clock.now.side_effect = [datetime(2018, 4, 4, *t) for t in times]
+        sleeps = []
+        checks = mock.Mock(side_effect=trading)
+        with mock.patch.object(stock_quote, 'datetime', clock), \
+                mock.patch.object(stock_quote.time, 'sleep', sleeps.append), \
+                mock.patch.object(stock_quote, 'is_trading_day', checks):
+            return wait_for_open(), sleeps, checks.call_count
+
+    def test_wait_before_open(self):
+        """测试盘前启动时等待至开盘后再判断"""
+        res, sleeps, checks = self._wait([(8, 0), (8, 0), (9, 14), (9, 15)], [False, True])
+        self.assertTrue(res)
+        self.assertEqual(sleeps[0], (74 * 60))
+        self.assertEqual(checks, 2)
+
+    def test_holiday(self):
+        """测试至截止时间报价日期仍非当日时为非交易日"""
+        res, _, checks = self._wait([(9, 30), (9, 30), (9, 31)], [False, False])
+        self.assertFalse(res)
+        self.assertEqual(checks, 2)
+
+    def test_weekend(self):
+        with mock.patch.object(stock_quote, 'is_working_day', return_value=False):
+            res, sleeps, checks = self._wait([(8, 0)], [])
+        self.assertFalse(res)
+        self.assertEqual((sleeps, checks), ([], 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import time
+import unittest
+
+from cswd.sql.base import Action
+from cswd.tasks.utils import RefreshLogger
+
+
+class MemoryLogger(RefreshLogger):
+    """写入内存列表，记录每批数量"""
+
+    def __init__(self, *args, **kwargs):
+        self.batches = []
+        super(MemoryLogger, self).__init__(*args, **kwargs)
+
+    def _write(self, records):
+        self.batches.append(len(records))
+
+
+class FailingLogger(RefreshLogger):
+    def _write(self, records):
+        raise IOError('disk full')
+
+
+class TestRefreshLogger(unittest.TestCase):
+    def test_flush_by_count(self):
+        """测试累计达到数量时批量写入"""
+        logger = MemoryLogger(max_records=3, interval=3600)
+        for i in range(7):
+            logger.log('stock_dailies', True, i, Action.INSERT, '000001')
+        self.assertEqual(logger.batches, [3, 3])
+        self.assertEqual(len(logger), 1)
+        logger.close()
+        self.assertEqual(logger.batches, [3, 3, 1])
+
+    def test_flush_by_interval(self):
+        """测试超过间隔时写入"""
+        logger = MemoryLogger(max_records=100, interval=0.05)
+        logger.log('margins', True, 1, Action.INSERT)
+        time.sleep(0.06)
+        logger.log('margins', True, 1, Action.INSERT)
+        self.assertEqual(logger.batches, [2])
+
+    def test_background(self):
+        """测试后台线程写入"""
+        logger = MemoryLogger(max_records=2, interval=3600, background=True)
+        for _ in range(2):
+            logger.log('margins', True, 1, Action.INSERT)
+        for _ in range(100):
+            if logger.batches:
+                break
+            time.sleep(0.01)
+        self.assertEqual(logger.batches, [2])
+        logger.log('margins', True, 1, Action.INSERT)
+        logger.close()
+        self.assertEqual(logger.batches, [2, 1])
+
+    def test_keep_records_on_failure(self):
+        """测试写入失败时保留记录"""
+        logger = FailingLogger(max_records=100, interval=3600)
+        logger.log('margins', True, 1, Action.INSERT)
+        with self.assertRaises(IOError):
+            logger.flush()
+        self.assertEqual(len(logger), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import threading
+import unittest
+
+from cswd.tasks.scheduler import run_parallel
+
+
+class TestScheduler(unittest.TestCase):
+    def test_write_in_calling_thread(self):
+        """测试并行下载，在调用线程中写入全部结果"""
+        main_thread = threading.current_thread()
+        written = {}
+
+        def fetch(x):
+            return x * 2
+
+        def write(x, res):
+            self.assertIs(threading.current_thread(), main_thread)
+            written[x] = res
+
+        done = run_parallel(range(20), fetch, write, max_workers=4)
+        self.assertEqual(done, 20)
+        self.assertDictEqual(written, {x: x * 2 for x in range(20)})
+
+    def test_raise_fetch_error(self):
+        """测试下载异常在调用线程中重新抛出"""
+        def fetch(x):
+            if x == 3:
+                raise ValueError(x)
+            return x
+
+        with self.assertRaises(ValueError):
+            run_parallel(range(10), fetch, lambda x, res: None, max_workers=2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 import unittest
-from cswd.websource.sina import (fetch_quotes, fetch_globalnews,
+
+import pandas as pd
+from cswd.websource.sina import (fetch_quotes, fetch_globalnews, _to_dataframe,
                                  fetch_rating, fetch_organization_care,
                                  fetch_industry_care, fetch_target_price,
                                  fetch_performance_prediction, fetch_eps_prediction,
@@ -14,6 +16,42 @@ class TestSina(unittest.TestCase):
         df = fetch_quotes(['000001', '000002'])
         self.assertSetEqual(set(df.columns), set(QUOTE_COLS))
 
+    def test_to_dataframe(self):
+        """测试解析报价：数值列类型及跳过停牌股票的空报价"""
+        fields = ['平安银行', '11.040', '11.050', '10.900', '11.050', '10.880',
+                  '10.900', '10.910', '98416542', '1077963811.640'] + \
+            ['100', '10.900'] * 10 + ['2018-04-04', '15:00:03', '00']
+        content = 'var hq_str_sz000001="{}";\nvar hq_str_sz000002="";'.format(
+            ','.join(fields))
+        df = _to_dataframe(content, ['000001', '000002'])
+        self.assertListEqual(list(df.columns), QUOTE_COLS)
+        self.assertEqual(len(df), 1)
+        self.assertEqual(df['现价'].iloc[0], 10.9)
+        self.assertEqual(df['成交量'].iloc[0], 98416542)
+        self.assertEqual(df['买1量'].dtype, 'Int64')
+        self.assertEqual(df['日期'].iloc[0], pd.Timestamp('2018-04-04'))
+        self.assertEqual(df['时间'].iloc[0], '15:00:03')
+
+    def test_to_dataframe_empty_field(self):
+        """测试个别字段为空时该字段为缺失值，不影响同批其余报价"""
+        fields = ['平安银行', '11.040', '11.050', '10.900', '11.050', '10.880',
+                  '10.900', '10.910', '98416542', '1077963811.640'] + \
+            ['100', '10.900'] * 10 + ['2018-04-04', '15:00:03', '00']
+        broken = list(fields)
+        broken[0] = ''
+        broken[3] = ''
+        broken[10] = ''
+        content = 'var hq_str_sz000001="{}";\nvar hq_str_sz000002="{}";'.format(
+            ','.join(fields), ','.join(broken))
+        df = _to_dataframe(content).set_index('股票代码')
+        self.assertEqual(len(df), 2)
+        self.assertEqual(df.loc['000002', '股票简称'], '')
+        self.assertTrue(pd.isnull(df.loc['000002', '现价']))
+        self.assertTrue(pd.isnull(df.loc['000002', '买1量']))
+        self.assertEqual(df.loc['000002', '成交量'], 98416542)
+        self.assertEqual(df.loc['000001', '现价'], 10.9)
+        self.assertEqual(df['买1量'].dtype, 'Int64')
+
     def test_fetch_globalnews(self):
         """测试提取全球财经新闻"""
         data = fetch_globalnews()
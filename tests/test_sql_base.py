@@ -0,0 +1,58 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from cswd.sql import base
+from cswd.sql.base import PRAGMA_PROFILES, dispose_engines, get_engine, get_sessionmaker
+
+# PRAGMA synchronous读取值
+SYNCHRONOUS = {'OFF': 0, 'NORMAL': 1, 'FULL': 2}
+
+
+class TestEngine(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'a.db')
+
+    def tearDown(self):
+        dispose_engines()
+        shutil.rmtree(self.root)
+
+    def test_cached_engine(self):
+        """测试同一（路径，echo，方案）共享引擎"""
+        engine = get_engine(self.path)
+        self.assertIs(get_engine(self.path), engine)
+        self.assertIs(get_engine(self.path, profile='default'), engine)
+        self.assertIsNot(get_engine(self.path, echo=True), engine)
+        self.assertIsNot(get_engine(self.path, profile='read'), engine)
+        self.assertIsNot(get_engine(os.path.join(self.root, 'b.db')), engine)
+        self.assertIs(get_sessionmaker(self.path), get_sessionmaker(self.path))
+
+    def test_dispose_engines(self):
+        engine = get_engine(self.path)
+        Session = get_sessionmaker(self.path)
+        dispose_engines()
+        self.assertEqual(base._engines, {})
+        self.assertEqual(base._sessionmakers, {})
+        self.assertIsNot(get_engine(self.path), engine)
+        self.assertIsNot(get_sessionmaker(self.path), Session)
+
+    def _pragmas(self, profile):
+        engine = get_engine(self.path, profile=profile)
+        with engine.connect() as conn:
+            return {name: conn.exec_driver_sql('PRAGMA {}'.format(name)).scalar()
+                    for name in ('journal_mode', 'synchronous', 'cache_size', 'busy_timeout')}
+
+    def test_pragma_profiles(self):
+        """测试建立连接时按方案执行PRAGMA设置"""
+        for profile, pragmas in PRAGMA_PROFILES.items():
+            actual = self._pragmas(profile)
+            self.assertEqual(actual['journal_mode'], pragmas['journal_mode'].lower())
+            self.assertEqual(actual['synchronous'], SYNCHRONOUS[pragmas['synchronous']])
+            self.assertEqual(actual['cache_size'], pragmas['cache_size'])
+            self.assertEqual(actual['busy_timeout'], pragmas['busy_timeout'])
+
+
+if __name__ == '__main__':
+    unittest.main()
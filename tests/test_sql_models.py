@@ -1,11 +1,20 @@
+import datetime
+import os
+import shutil
+import tempfile
 import unittest
 
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import sessionmaker
+
+from cswd.sql.base import dispose_engines, get_engine, get_sessionmaker, upsert
 from cswd.sql.constants import *
 from cswd.sql.models import (Issue,
                              BalanceSheet, ProfitStatement, CashflowStatement,
                              ZYZB, YLNL, CZNL, CHNL, YYNL,
                              PerformanceForecast,
-                             StockDaily, Margin, Quotation, DealDetail)
+                             StockDaily, Margin, Quotation, DealDetail, Adjustment)
+from cswd.sql.migrate import UpgradeRequired, create_indexes, upgrade
 
 
 class TestModels(unittest.TestCase):
@@ -140,5 +149,110 @@ class TestModels(unittest.TestCase):
         self.valid_attribute(fixed_cols, DealDetail,
                              DEALDETAIL_MAPS)
 
+class TestUpsert(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        Margin.__table__.create(self.engine)
+        self.sess = sessionmaker(bind=self.engine)()
+
+    def tearDown(self):
+        self.sess.close()
+        self.engine.dispose()
+
+    def _record(self, day, value):
+        return {'股票代码': '000001', '日期': datetime.date(2018, 1, day),
+                '融资余额': value}
+
+    def test_upsert_ignore(self):
+        """测试重复写入时忽略已有（代码，日期）"""
+        self.assertEqual(upsert(self.sess, Margin, [self._record(2, 1.0)]), 1)
+        records = [self._record(2, 2.0), self._record(3, 3.0)]
+        self.assertEqual(upsert(self.sess, Margin, records), 1)
+        self.sess.commit()
+        rows = self.sess.query(Margin.date, Margin.A001_融资余额).order_by(
+            Margin.date).all()
+        self.assertEqual([x[1] for x in rows], [1.0, 3.0])
+
+    def test_upsert_update(self):
+        """测试冲突时以新值更新"""
+        upsert(self.sess, Margin, [self._record(2, 1.0)])
+        upsert(self.sess, Margin, [self._record(2, 2.0)], update=True)
+        self.sess.commit()
+        self.assertEqual(self.sess.query(Margin).count(), 1)
+        self.assertEqual(self.sess.query(Margin.A001_融资余额).scalar(), 2.0)
+
+    def test_create_indexes(self):
+        """测试为已有表添加唯一索引前删除重复行"""
+        engine = create_engine('sqlite://')
+        with engine.begin() as conn:
+            conn.exec_driver_sql(
+                'CREATE TABLE margins ("序号" INTEGER PRIMARY KEY, '
+                '"股票代码" VARCHAR(6), "日期" DATE, "融资余额" FLOAT)')
+            conn.exec_driver_sql(
+                "INSERT INTO margins VALUES (1, '000001', '2018-01-02', 1.0), "
+                "(2, '000001', '2018-01-02', 2.0), (3, '000002', '2018-01-02', 3.0)")
+        self.assertIn('uix_margins_code_date', create_indexes(engine))
+        with engine.connect() as conn:
+            rows = conn.exec_driver_sql(
+                'SELECT "序号" FROM margins ORDER BY "序号"').fetchall()
+        self.assertEqual([x[0] for x in rows], [2, 3])
+        names = [x['name'] for x in inspect(engine).get_indexes('margins')]
+        self.assertIn('uix_margins_code_date', names)
+        self.assertEqual(create_indexes(engine), [])
+        engine.dispose()
+
+    def test_upgrade_old_database(self):
+        """测试打开旧版本数据库（无唯一索引、存在重复行）时要求升级，升级后可以upsert"""
+        root = tempfile.mkdtemp()
+        path = os.path.join(root, 'stock.db')
+        try:
+            old = create_engine('sqlite:///' + path)
+            StockDaily.__table__.create(old)
+            with old.begin() as conn:
+                conn.exec_driver_sql('DROP INDEX uix_stock_dailies_code_date')
+                for close in (1.0, 2.0):
+                    conn.exec_driver_sql(
+                        'INSERT INTO stock_dailies ("股票代码", "日期", "名称", "收盘价") '
+                        "VALUES ('000001', '2018-01-02', 'A', ?)", (close,))
+            old.dispose()
+
+            # 打开数据库时不修改数据，提示升级
+            with self.assertRaisesRegex(UpgradeRequired, 'stock_dailies'):
+                get_engine(path)
+            self.assertIn('uix_stock_dailies_code_date', upgrade(path))
+            self.assertEqual(upgrade(path), [])
+            dispose_engines()
+            sess = get_sessionmaker(path)()
+            records = [{'股票代码': '000001', '日期': datetime.date(2018, 1, day),
+                        '名称': 'A', '收盘价': 3.0} for day in (2, 3)]
+            self.assertEqual(upsert(sess, StockDaily, records), 1)
+            sess.commit()
+            rows = sess.query(StockDaily.date, StockDaily.A005_收盘价).order_by(
+                StockDaily.date).all()
+            sess.close()
+            self.assertEqual([x[1] for x in rows], [2.0, 3.0])
+        finally:
+            dispose_engines()
+            shutil.rmtree(root)
+
+    def test_obsolete_index(self):
+        """测试升级时删除已废弃的索引：同一实施日期可添加多个年度的分红"""
+        engine = create_engine('sqlite://')
+        Adjustment.__table__.create(engine)
+        with engine.begin() as conn:
+            conn.exec_driver_sql('DROP INDEX uix_adjustments_code_date_annual')
+            conn.exec_driver_sql('CREATE UNIQUE INDEX uix_adjustments_code_date '
+                                 'ON adjustments ("股票代码", "日期")')
+        self.assertEqual(create_indexes(engine), ['uix_adjustments_code_date_annual'])
+        names = [x['name'] for x in inspect(engine).get_indexes('adjustments')]
+        self.assertNotIn('uix_adjustments_code_date', names)
+        sess = sessionmaker(bind=engine)()
+        records = [{'股票代码': '000001', '日期': datetime.date(2018, 6, 1),
+                    '分红年度': annual, '派息': 1.0} for annual in ('2016', '2017')]
+        self.assertEqual(upsert(sess, Adjustment, records), 2)
+        self.assertEqual(upsert(sess, Adjustment, records), 0)
+        sess.close()
+        engine.dispose()
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,181 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from cswd.load import load_csv
+from cswd.sql.base import bulk_insert, dispose_engines, get_engine, session_scope
+from cswd.sql.models import Base, StockDaily, TradingCalendar
+from cswd.tasks import stock_daily
+from cswd.tasks.stock_daily import (_append_snapshot, _delete, _snapshot_frame, _to_records,
+                                    _write, snapshot_date)
+
+# 2018年清明节假期：4月5日至7日休市
+TRADING_DATES = ['2018-04-02', '2018-04-03', '2018-04-04', '2018-04-09']
+CALENDAR_DATES = pd.date_range('2018-04-02', '2018-04-09')
+
+
+class DatabaseTestCase(unittest.TestCase):
+    """以临时数据库替代默认数据库"""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'stock.db')
+        patcher = mock.patch('cswd.sql.base.db_path', lambda name: self.path)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        Base.metadata.create_all(get_engine())
+
+    def tearDown(self):
+        dispose_engines()
+        shutil.rmtree(self.root)
+
+
+def _last_history(**fields):
+    """模拟`fetch_last_history`结果（网页单位）"""
+    data = {
+        'SYMBOL': ['000001', '000002', '000003'],
+        'NAME': ['平安银行', '万科A', '停牌'],
+        'OPEN': [10.0, 30.0, 0.0],
+        'HIGH': [10.5, 31.0, 0.0],
+        'LOW': [9.9, 29.5, 0.0],
+        'PRICE': [10.2, 30.5, 8.0],
+        'VOLUME': [1000000, 200000, 0],
+        'TURNOVER': [10200000.0, 6100000.0, 0.0],
+        'HS': [0.0123, 0.002, 0.0],
+        'YESTCLOSE': [10.0, 30.0, 8.0],
+        'UPDOWN': [0.2, 0.5, 0.0],
+        'PERCENT': [0.02, 0.0167, 0.0],
+        'TCAP': [1.7e11, 3.4e11, 1e9],
+        'MCAP': [1.7e11, 2.9e11, 1e9],
+        'PE': [8.0, 10.0, None],
+    }
+    data.update(fields)
+    return pd.DataFrame(data)
+
+
+class TestSnapshot(DatabaseTestCase):
+    def setUp(self):
+        super(TestSnapshot, self).setUp()
+        with session_scope() as sess:
+            sess.add_all([TradingCalendar(date=d.date(),
+                                          is_trading=str(d.date()) in TRADING_DATES)
+                          for d in CALENDAR_DATES])
+
+    def test_snapshot_frame(self):
+        """测试单位转换，并剔除无成交的股票"""
+        df = _snapshot_frame(_last_history())
+        self.assertListEqual(list(df.index), ['000001', '000002'])
+        self.assertAlmostEqual(df.loc['000001', '换手率'], 1.23)
+        self.assertAlmostEqual(df.loc['000001', '涨跌幅'], 2.0)
+        self.assertAlmostEqual(df.loc['000002', '成交金额'], 6100000.0)
+        self.assertEqual(df.loc['000001', '名称'], '平安银行')
+        self.assertNotIn('成交笔数', df.columns)
+
+    def test_snapshot_frame_missing_field(self):
+        df = _snapshot_frame(_last_history().drop('TCAP', axis=1))
+        self.assertTrue(df['总市值'].isnull().all())
+
+    def test_snapshot_date(self):
+        def check(now, expected):
+            self.assertEqual(snapshot_date(pd.Timestamp(now)), expected)
+
+        # 盘中及收盘后、网站更新前
+        check('2018-04-04 09:00', None)
+        check('2018-04-04 16:59', None)
+        # 更新后为当日，次日开盘前为上一交易日
+        check('2018-04-04 17:00', datetime.date(2018, 4, 4))
+        check('2018-04-04 08:59', datetime.date(2018, 4, 3))
+        # 非交易日为之前最后交易日
+        check('2018-04-05 20:00', datetime.date(2018, 4, 4))
+        check('2018-04-07 08:00', datetime.date(2018, 4, 4))
+        check('2018-04-09 08:00', datetime.date(2018, 4, 4))
+
+    def test_append_snapshot(self):
+        """测试仅添加有成交的指定股票，不覆盖已存在的（代码，日期）"""
+        date_ = datetime.date(2018, 4, 4)
+        with session_scope() as sess:
+            sess.add(StockDaily(code='000002', date=date_, A001_名称='万科A',
+                                A005_收盘价=30.0, A007_成交金额=1.0))
+        with mock.patch.object(stock_daily, 'fetch_last_history', _last_history), \
+                mock.patch.object(stock_daily, 'log_to_db'):
+            appended = _append_snapshot(['000001', '000002', '000003', '600000'], date_)
+        self.assertSetEqual(appended, {'000001', '000002'})
+        with session_scope() as sess:
+            rows = {r.code: (r.date, r.A005_收盘价, r.A007_成交金额, r.A008_换手率, r.A014_成交笔数)
+                    for r in sess.query(StockDaily).all()}
+        self.assertListEqual(sorted(rows), ['000001', '000002'])
+        self.assertEqual(rows['000002'][1:3], (30.0, 1.0))
+        date, close, amount, turnover, count = rows['000001']
+        self.assertEqual((date, close, amount), (date_, 10.2, 10200000.0))
+        self.assertAlmostEqual(turnover, 1.23)
+        self.assertIsNone(count)
+
+    def test_delete_snapshot_rows(self):
+        """测试以最新日线添加的行（成交笔数为None）为临时数据，刷新前删除"""
+        date_ = datetime.date(2018, 4, 4)
+        with session_scope() as sess:
+            sess.add(StockDaily(code='000002', date=date_, A001_名称='万科A',
+                                A007_成交金额=1.0, A014_成交笔数=10.0))
+        with mock.patch.object(stock_daily, 'fetch_last_history', _last_history), \
+                mock.patch.object(stock_daily, 'log_to_db'):
+            _append_snapshot(['000001'], date_)
+        _delete()
+        with session_scope() as sess:
+            self.assertListEqual([r.code for r in sess.query(StockDaily).all()], ['000002'])
+
+
+class TestWrite(DatabaseTestCase):
+    def setUp(self):
+        super(TestWrite, self).setUp()
+        df = load_csv('000333.csv', kwargs={'index_col': 0, 'parse_dates': True})
+        self.df = df.iloc[:5].sort_index()
+        self.df.loc[self.df.index[0], '换手率'] = np.nan
+
+    def _rows(self):
+        with session_scope() as sess:
+            query = sess.query(StockDaily).order_by(StockDaily.date)
+            return [(r.code, r.date, r.A001_名称, r.A005_收盘价, r.A006_成交量,
+                     r.A008_换手率, r.A014_成交笔数) for r in query.all()]
+
+    def test_to_records(self):
+        """测试转换为python原生类型，缺失值为None"""
+        records = _to_records('000333', self.df)
+        self.assertEqual(len(records), 5)
+        first = records[0]
+        self.assertEqual(first['股票代码'], '000333')
+        self.assertIs(type(first['日期']), datetime.date)
+        self.assertIs(type(first['成交量']), int)
+        self.assertIs(type(first['收盘价']), float)
+        self.assertIsNone(first['换手率'])
+        self.assertListEqual(list(first)[2:], stock_daily.STOCKDAILY_COLS)
+
+    def test_bulk_same_as_orm(self):
+        """测试批量写入与逐行构建ORM对象结果一致，重复写入不产生重复行"""
+        with session_scope() as sess:
+            self.assertEqual(_write(sess, '000333', self.df, bulk=False), 5)
+        expected = self._rows()
+        with session_scope() as sess:
+            sess.query(StockDaily).delete()
+        with session_scope() as sess:
+            self.assertEqual(_write(sess, '000333', self.df, bulk=True), 5)
+            self.assertEqual(_write(sess, '000333', self.df, bulk=True), 0)
+        self.assertListEqual(self._rows(), expected)
+        self.assertIsNone(expected[0][5])
+
+    def test_bulk_insert_batches(self):
+        records = _to_records('000333', self.df)
+        with session_scope() as sess:
+            with mock.patch.object(sess, 'execute', wraps=sess.execute) as execute:
+                self.assertEqual(bulk_insert(sess, StockDaily, records, batch_size=2), 5)
+            self.assertEqual(execute.call_count, 3)
+        self.assertEqual(len(self._rows()), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from cswd.dataproxy import cache, stores
+from cswd.dataproxy.cache import DataProxy
+from cswd.dataproxy.locks import LOCK_FILE_NAME, KeyLock
+from cswd.dataproxy.stores import FileStore, MemoryCache, SqliteStore
+
+
+class Test_stores(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.df = pd.DataFrame({'收盘价': [1.0, 2.0]},
+                               index=pd.date_range('2018-1-1', periods=2))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def _check(self, store):
+        self.assertIsNone(store.updated_time('a'))
+        store.dump('a', self.df)
+        self.assertIsNotNone(store.updated_time('a'))
+        assert_frame_equal(store.load('a'), self.df)
+        store.delete('a')
+        self.assertIsNone(store.updated_time('a'))
+
+    def test_file_store(self):
+        self._check(FileStore(self.root))
+
+    def test_sqlite_store(self):
+        self._check(SqliteStore(self.root))
+
+    def test_sqlite_access_time(self):
+        """测试命中时仅在访问时间超出精度后写入"""
+        store = SqliteStore(self.root)
+        store.dump('a', self.df)
+        accessed = store.entries()[0].accessed
+        with mock.patch.object(stores.time, 'time', return_value=accessed + 60):
+            store.load('a')
+        self.assertEqual(store.entries()[0].accessed, accessed)
+        later = accessed + stores.ACCESS_RESOLUTION
+        with mock.patch.object(stores.time, 'time', return_value=later):
+            store.load('a')
+        self.assertEqual(store.entries()[0].accessed, later)
+
+    def test_memory_cache(self):
+        now = pd.Timestamp('now', tz='Asia/Shanghai')
+        nbytes = int(self.df.memory_usage(index=True, deep=True).sum())
+        cache = MemoryCache(nbytes * 2)
+        cache.put('a', now, self.df)
+        cache.put('b', now, self.df)
+        # 命中后'a'为最近使用，放入'c'时淘汰'b'
+        hit, df = cache.get('a', lambda t: False)
+        self.assertTrue(hit)
+        assert_frame_equal(df, self.df)
+        cache.put('c', now, self.df)
+        self.assertFalse(cache.get('b', lambda t: False)[0])
+        # 过期
+        self.assertFalse(cache.get('a', lambda t: t <= now)[0])
+        info = cache.info()
+        self.assertEqual((info.hits, info.misses, info.evictions), (1, 2, 1))
+        self.assertEqual(info.currsize, nbytes)
+
+    def test_key_lock(self):
+        locks = KeyLock()
+        running = []
+        max_running = []
+
+        def work(key):
+            with locks(key):
+                running.append(key)
+                max_running.append(running.count(key))
+                time.sleep(0.05)
+                running.remove(key)
+
+        with ThreadPoolExecutor(6) as executor:
+            list(executor.map(work, ['a', 'a', 'a', 'b', 'b', 'b']))
+        # 同一键不会同时执行，不同键可并行
+        self.assertEqual(max(max_running), 1)
+        self.assertEqual(locks._locks, {})
+
+    def _check_single_flight(self, store):
+        calls = []
+        calls_lock = threading.Lock()
+
+        def fetch_slow(x):
+            with calls_lock:
+                calls.append(x)
+            time.sleep(0.2)
+            return self.df
+
+        with mock.patch.object(cache, 'TEMP_DIR', self.root):
+            reader = DataProxy(fetch_slow, '00:00:00', store=store)
+        with ThreadPoolExecutor(8) as executor:
+            dfs = list(executor.map(lambda _: reader.read(1), range(8)))
+        # 8个线程同时读取未缓存的键，只下载一次
+        self.assertEqual(calls, [1])
+        for df in dfs:
+            assert_frame_equal(df, self.df)
+
+    def test_single_flight_file(self):
+        self._check_single_flight('file')
+
+    def test_single_flight_sqlite(self):
+        self._check_single_flight('sqlite')
+
+    def test_one_lock_file(self):
+        """测试每个本地存储只使用一个锁文件"""
+        with mock.patch.object(cache, 'TEMP_DIR', self.root):
+            reader = DataProxy(lambda x: self.df, '00:00:00', store='file')
+        for x in range(50):
+            reader.read(x)
+        names = [x for x in os.listdir(reader.store.root) if x.startswith('.')]
+        self.assertListEqual(names, [LOCK_FILE_NAME])
+        self.assertEqual(len(reader.store.entries()), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
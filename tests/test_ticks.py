@@ -0,0 +1,79 @@
+import datetime
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from cswd.sql.ticks import TickStore
+
+
+def _cjmx(times, prices, directions):
+    n = len(times)
+    return pd.DataFrame({'时间': times,
+                         '价格': prices,
+                         '涨跌额': [0.01] * n,
+                         '成交量': [100] * n,
+                         '成交额': [p * 100 for p in prices],
+                         '方向': directions})
+
+
+class TestTickStore(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = TickStore(self.root)
+        self.d1 = datetime.date(2018, 4, 2)
+        self.d2 = datetime.date(2018, 4, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_round_trip(self):
+        """测试写入后按代码、期间读取"""
+        # 时间乱序、未知方向
+        df = _cjmx(['09:30:03', '09:25:00'], [10.5, 10.0], ['卖盘', '--'])
+        self.assertEqual(self.store.write(self.d1, {'000001': df}), 2)
+        self.store.write(self.d2, {'600000': _cjmx(['14:59:57'], [8.0], ['买盘'])})
+        res = self.store.read('000001')
+        self.assertEqual(list(res['时间']), ['09:25:00', '09:30:03'])
+        self.assertEqual(list(res['方向']), [None, '卖盘'])
+        self.assertTrue(np.allclose(res['价格'], [10.0, 10.5]))
+        self.assertEqual(list(res['股票代码']), ['000001', '000001'])
+        self.assertEqual(len(self.store.read(start=self.d2, end=self.d2)), 1)
+        self.assertTrue(self.store.read('000002').empty)
+
+    def test_merge_same_day(self):
+        """测试同一交易日分批写入时合并，同一代码以新数据为准"""
+        self.store.write(self.d1, {'000002': _cjmx(['09:30:00'], [1.0], ['买盘'])})
+        self.store.write(self.d1, {'000001': _cjmx(['09:30:00'], [2.0], ['买盘']),
+                                   '000002': _cjmx(['09:31:00'], [3.0], ['卖盘'])})
+        self.assertEqual(self.store.codes(self.d1), {'000001', '000002'})
+        res = self.store.read('000002', self.d1, self.d1)
+        self.assertEqual(list(res['时间']), ['09:31:00'])
+
+    def test_concurrent_write(self):
+        """测试同时写入同一交易日的不同代码，合并时不丢失数据"""
+        codes = [str(i).zfill(6) for i in range(1, 17)]
+
+        def write(code):
+            self.store.write(self.d1, {code: _cjmx(['09:30:00'], [1.0], ['买盘'])})
+
+        with ThreadPoolExecutor(8) as executor:
+            list(executor.map(write, codes))
+        self.assertEqual(self.store.codes(self.d1), set(codes))
+        self.assertEqual(self.store.dates(), [self.d1])
+
+    def test_drop_before(self):
+        """测试按交易日删除"""
+        for d in (self.d1, self.d2):
+            self.store.write(d, {'000001': _cjmx(['09:30:00'], [1.0], ['买盘'])})
+        self.assertEqual(self.store.drop_before(self.d1), [self.d1])
+        self.assertEqual(self.store.dates(), [self.d2])
+        self.assertFalse(os.path.exists(self.store.path(self.d1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
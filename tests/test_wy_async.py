@@ -0,0 +1,80 @@
+import asyncio
+import unittest
+from unittest import mock
+
+from aiohttp import web
+from pandas.testing import assert_frame_equal
+
+from cswd.websource.base import set_rate_limit
+from cswd.websource.exceptions import ConnectFailed
+from cswd.websource.wy import _parse_history
+from cswd.websource.wy_async import AsyncClient
+
+HISTORY_CSV = ('日期,股票代码,名称,收盘价\r\n'
+               "2018-04-04,'{0},股票{0},10.5\r\n"
+               "2018-04-03,'{0},股票{0},10.2\r\n")
+FAILED_CODE = '000002'
+
+
+def _content(code):
+    return HISTORY_CSV.format(code).encode('cp936')
+
+
+async def _history(request):
+    """模拟网易历史交易数据。FAILED_CODE始终返回服务器错误"""
+    code = request.match_info['code']
+    if code == FAILED_CODE:
+        return web.Response(status=500)
+    return web.Response(body=_content(code), content_type='text/csv')
+
+
+class TestGatherHistory(unittest.TestCase):
+    """以本机模拟服务器测试，不访问网络"""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        app = web.Application()
+        app.router.add_get('/history/{code}', _history)
+        self.runner = web.AppRunner(app)
+        self.loop.run_until_complete(self.runner.setup())
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        self.loop.run_until_complete(site.start())
+        port = site._server.sockets[0].getsockname()[1]
+        self.host = '127.0.0.1:{}'.format(port)
+        set_rate_limit(self.host, 1000, 1000)
+
+    def tearDown(self):
+        self.loop.run_until_complete(self.runner.cleanup())
+        self.loop.close()
+
+    def _gather(self, codes, failed=None):
+        def url(code, start, end, is_index):
+            return 'http://{}/history/{}'.format(self.host, code)
+
+        async def gather():
+            async with AsyncClient(timeout=5) as client:
+                return await client.gather_history(codes, '2018-04-01', failed=failed)
+
+        with mock.patch('cswd.websource.wy_async._history_url', url):
+            return self.loop.run_until_complete(gather())
+
+    def test_success(self):
+        failed = {}
+        dfs = self._gather(['000001', '000003'], failed)
+        self.assertDictEqual(failed, {})
+        self.assertListEqual(sorted(dfs), ['000001', '000003'])
+        for code, df in dfs.items():
+            assert_frame_equal(df, _parse_history(_content(code)))
+
+    def test_partial_failure(self):
+        """测试单个代码失败时，返回其余代码数据，并记录失败代码"""
+        self.assertListEqual(sorted(self._gather(['000001', FAILED_CODE])), ['000001'])
+        failed = {}
+        dfs = self._gather(['000001', FAILED_CODE, '000003'], failed)
+        self.assertListEqual(sorted(dfs), ['000001', '000003'])
+        self.assertListEqual(list(failed), [FAILED_CODE])
+        self.assertIsInstance(failed[FAILED_CODE], ConnectFailed)
+
+
+if __name__ == '__main__':
+    unittest.main()